@@ -1,10 +1,9 @@
 from datetime import datetime, timedelta
-import time
 import os
 import pendulum
 from airflow import DAG
 from airflow.providers.docker.operators.docker import DockerOperator
-from airflow.operators.python import PythonOperator
+from docker.types import Mount
 
 
 # Default arguments for the DAG
@@ -16,14 +15,6 @@ default_args = {
 }
 
 
-# Helper function
-def sleep_3_seconds():
-    """
-    Simple delay to avoid hitting rate limits / being banned by the website.
-    Each task needs its own PythonOperator instance.
-    """
-    time.sleep(3)
-
 taipei_tz = pendulum.timezone("Asia/Taipei")
 
 # DAG definition
@@ -51,20 +42,32 @@ with DAG(
         "MYSQL_DATA_PASSWORD": os.getenv("MYSQL_DATA_PASSWORD", "test"),
         "MYSQL_DATA_PORT": os.getenv("MYSQL_DATA_PORT", "3306"),
         "MYSQL_DATA_DATABASE": os.getenv("MYSQL_DATA_DATABASE", "stockdata"),
-      }
+        "MYSQL_TARGETS": os.getenv("MYSQL_TARGETS", "{}"),
+        "MYSQL_ROUTES": os.getenv("MYSQL_ROUTES", "{}"),
+        "CRAWLER_STATE_DIR": "/var/lib/stockdata",
+      },
+        # Shared state volume, all crawler containers draw from one per-host rate limit budget
+        "mounts": [
+            Mount(source="stockdata_crawler_state", target="/var/lib/stockdata", type="volume"),
+        ],
     }
 
     # Define tasks
+    # Create missing tables, columns and next year's partitions first (a no-op when the schema is current),
+    # a table needing a rebuild fails the run until `migrate --rebuild` is run by hand
+    task_migrate = DockerOperator(
+        task_id="migrate_schema",
+        command="python -m stockdata.main migrate",
+        **docker_config,
+    )
+
+    # Crawl tasks have no dependencies between them and run concurrently, the shared rate limiter keeps each website within its budget
     # Update stock info
     task_stock_info = DockerOperator(
         task_id="update_stock_info",
         command="python -m stockdata.main taiwan_stock_info",
         **docker_config,
     )
-    delay_after_stock_info = PythonOperator(
-        task_id="delay_after_stock_info",
-        python_callable=sleep_3_seconds,
-    )
 
     # Update share holding
     task_share_holding = DockerOperator(
@@ -72,10 +75,6 @@ with DAG(
         command="python -m stockdata.main taiwan_share_holding",
         **docker_config,
     )
-    delay_after_share_holding = PythonOperator(
-        task_id="delay_after_share_holding",
-        python_callable=sleep_3_seconds,
-    )
 
     # Update stock price
     task_stock_price = DockerOperator(
@@ -83,10 +82,6 @@ with DAG(
         command="python -m stockdata.main taiwan_stock_price {{ ds }} {{ ds }}",
         **docker_config,
     )
-    delay_after_stock_price = PythonOperator(
-        task_id="delay_after_stock_price",
-        python_callable=sleep_3_seconds,
-    )
 
     # Update institutional investor
     task_institutional_investor = DockerOperator(
@@ -94,10 +89,6 @@ with DAG(
         command="python -m stockdata.main taiwan_institutional_investor {{ ds }} {{ ds }}",
         **docker_config,
     )
-    delay_after_institutional = PythonOperator(
-        task_id="delay_after_institutional",
-        python_callable=sleep_3_seconds,
-    )
 
     # Update margin short sale
     task_margin_short_sale = DockerOperator(
@@ -105,10 +96,6 @@ with DAG(
         command="python -m stockdata.main taiwan_margin_short_sale {{ ds }} {{ ds }}",
         **docker_config,
     )
-    delay_after_margin = PythonOperator(
-        task_id="delay_after_margin",
-        python_callable=sleep_3_seconds,
-    )
 
     # Update future daily
     task_future_daily = DockerOperator(
@@ -117,16 +104,11 @@ with DAG(
         **docker_config,
     )
 
-    (
-        task_stock_info
-        >> delay_after_stock_info
-        >> task_share_holding
-        >> delay_after_share_holding
-        >> task_stock_price
-        >> delay_after_stock_price
-        >> task_institutional_investor
-        >> delay_after_institutional
-        >> task_margin_short_sale
-        >> delay_after_margin
-        >> task_future_daily
-    )
+    task_migrate >> [
+        task_stock_info,
+        task_share_holding,
+        task_stock_price,
+        task_institutional_investor,
+        task_margin_short_sale,
+        task_future_daily,
+    ]
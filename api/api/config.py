@@ -1,3 +1,4 @@
+import json
 import os
 
 MYSQL_DATA_HOST = os.environ.get("MYSQL_DATA_HOST", "127.0.0.1")
@@ -5,3 +6,28 @@ MYSQL_DATA_USER = os.environ.get("MYSQL_DATA_USER", "root")
 MYSQL_DATA_PASSWORD = os.environ.get("MYSQL_DATA_PASSWORD", "test")
 MYSQL_DATA_PORT = int(os.environ.get("MYSQL_DATA_PORT", "3306"))
 MYSQL_DATA_DATABASE = os.environ.get("MYSQL_DATA_DATABASE", "stockdata")
+
+# Extra MySQL targets and the tables routed to them, the same JSON settings as the crawler:
+# MYSQL_TARGETS='{"holding": {"host": "mysql-holding", "port": 3306}}', fields left out default to MYSQL_DATA_*
+# MYSQL_ROUTES='{"taiwan_share_holding": "holding"}', other tables are read from MYSQL_DATA_*
+MYSQL_TARGETS = json.loads(os.environ.get("MYSQL_TARGETS", "{}"))
+MYSQL_ROUTES = json.loads(os.environ.get("MYSQL_ROUTES", "{}"))
+
+for _table, _target in MYSQL_ROUTES.items():
+    if _target != "stockdata" and _target not in MYSQL_TARGETS:
+        raise ValueError(f"MYSQL_ROUTES {_table}: unknown target {_target}")
+
+
+def mysql_target(table: str) -> dict:
+    """
+    Connection settings of the MySQL target a table is routed to
+    """
+    settings = MYSQL_TARGETS.get(MYSQL_ROUTES.get(table), {})
+
+    return {
+        "host": settings.get("host", MYSQL_DATA_HOST),
+        "port": int(settings.get("port", MYSQL_DATA_PORT)),
+        "user": settings.get("user", MYSQL_DATA_USER),
+        "password": settings.get("password", MYSQL_DATA_PASSWORD),
+        "database": settings.get("database", MYSQL_DATA_DATABASE),
+    }
@@ -2,27 +2,16 @@ import pandas as pd
 from fastapi import FastAPI, HTTPException
 import pymysql
 from typing import Dict, List, Optional
-from api.config import (
-    MYSQL_DATA_USER,
-    MYSQL_DATA_PASSWORD,
-    MYSQL_DATA_HOST,
-    MYSQL_DATA_PORT,
-    MYSQL_DATA_DATABASE,
-)
+from api.config import mysql_target
 
 # Import Prometheus instrumentation
 from prometheus_fastapi_instrumentator import Instrumentator
 from prometheus_client import Counter, Histogram, Gauge
 import time
 
-def get_mysql_financialdata_conn() -> pymysql.connections.Connection:
-    return pymysql.connect(
-        host=MYSQL_DATA_HOST,   
-        port=MYSQL_DATA_PORT,
-        user=MYSQL_DATA_USER,
-        password=MYSQL_DATA_PASSWORD,
-        database=MYSQL_DATA_DATABASE
-    )
+def get_mysql_financialdata_conn(table: str) -> pymysql.connections.Connection:
+    # Each table is read from the MySQL target the crawler routes it to (MYSQL_ROUTES)
+    return pymysql.connect(**mysql_target(table))
 
 app = FastAPI()
 
@@ -71,7 +60,7 @@ def taiwan_stock_price(stock_id: str = '', start_date: str = '', end_date: str =
     ).inc()
     
     try:
-        connection = get_mysql_financialdata_conn()
+        connection = get_mysql_financialdata_conn("taiwan_stock_price")
         active_db_connections.inc()  # Increment active connections
         
         with connection.cursor() as cursor:
@@ -132,7 +121,7 @@ def taiwan_future_daily(future_id: str = '', start_date: str = '', end_date: str
     ).inc()
     
     try:
-        connection = get_mysql_financialdata_conn()
+        connection = get_mysql_financialdata_conn("taiwan_future_daily")
         active_db_connections.inc()
         
         with connection.cursor() as cursor:
@@ -194,7 +183,7 @@ def taiwan_institutional_investor(stock_id: str = '', start_date: str = '', end_
     ).inc()
     
     try:
-        connection = get_mysql_financialdata_conn()
+        connection = get_mysql_financialdata_conn("taiwan_institutional_investor")
         active_db_connections.inc()
         
         with connection.cursor() as cursor:
@@ -256,7 +245,7 @@ def taiwan_margin_short_sale(stock_id: str = '', start_date: str = '', end_date:
     ).inc()
     
     try:
-        connection = get_mysql_financialdata_conn()
+        connection = get_mysql_financialdata_conn("taiwan_margin_short_sale")
         active_db_connections.inc()
         
         with connection.cursor() as cursor:
@@ -318,7 +307,7 @@ def taiwan_share_holding(stock_id: str = '', start_date: str = '', end_date: str
     ).inc()
     
     try:
-        connection = get_mysql_financialdata_conn()
+        connection = get_mysql_financialdata_conn("taiwan_share_holding")
         active_db_connections.inc()
         
         with connection.cursor() as cursor:
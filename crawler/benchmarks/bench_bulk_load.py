@@ -0,0 +1,144 @@
+"""
+LOAD DATA LOCAL INFILE through a staging table vs multi-row INSERT upserts, for a full-market day and a TDCC snapshot
+
+The client-side part (building the INSERT statements vs writing the in-memory CSV)
+always runs. The end-to-end part runs when the MySQL server of the MYSQL_DATA_*
+settings is reachable and has local_infile=ON; it writes to scratch tables
+that are dropped afterwards.
+
+Run from the crawler directory:
+    python -m benchmarks.bench_bulk_load [repeat]
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import timeit
+from unittest import mock
+
+os.environ.setdefault("CRAWLER_STATE_DIR", tempfile.mkdtemp(prefix="bench_bulk_load_"))
+os.environ.setdefault("CRAWLER_ARCHIVE", "0")
+
+import pandas as pd
+import pymysql
+
+from benchmarks.bench_memory import share_holding_payload, stock_price_payloads, streaming
+from stockdata import config
+from stockdata.crawler import taiwan_share_holding, taiwan_stock_price
+from stockdata.fetch import client
+from stockdata.fetch.snapshot import snapshots
+
+
+SQL_TYPES = {"i": "BIGINT", "f": "DOUBLE", "O": "VARCHAR(64)"}
+
+
+def connect():
+    try:
+        return pymysql.connect(
+            host=config.MYSQL_DATA_HOST,
+            port=config.MYSQL_DATA_PORT,
+            user=config.MYSQL_DATA_USER,
+            password=config.MYSQL_DATA_PASSWORD,
+            database=config.MYSQL_DATA_DATABASE,
+            charset="utf8mb4",
+            local_infile=True,
+            connect_timeout=3,
+        )
+
+    except pymysql.err.OperationalError as e:
+        print(f"MySQL not reachable, client-side only ({e})")
+
+        # Importing the db package opens the shared connection
+        mock.patch("pymysql.connect").start()
+        return None
+
+
+def frames():
+    """
+    One full-market day of prices (TWSE + TPEX) and one TDCC snapshot, as the pipelines return them
+    """
+
+    with contextlib.redirect_stdout(io.StringIO()), \
+            mock.patch.object(client, "get", stock_price_payloads(1300)), \
+            mock.patch.object(client, "stream", streaming(share_holding_payload(3800))), \
+            mock.patch.object(snapshots, "get", lambda source: None):
+        twse, tpex = taiwan_stock_price.stock_price_pipeline("2024-01-02")
+        share_holding = pd.concat(taiwan_share_holding.share_holding_pipeline(), ignore_index=True)
+
+    return {
+        "full-market day": pd.concat([twse, tpex], ignore_index=True),
+        "TDCC snapshot": share_holding,
+    }
+
+
+def client_side(df: pd.DataFrame, repeat: int):
+    from stockdata.backend.db.db import csv_buffer
+
+    conn = pymysql.connections.Connection(charset="utf8mb4", defer_connect=True)
+    conn.server_status = 0
+    placeholders = f"({', '.join(['%s'] * len(df.columns))})"
+
+    def insert():
+        # What update2mysql_by_sql sends, without sending it
+        cursor = conn.cursor()
+        for start in range(0, len(df), config.MYSQL_WRITE_CHUNK_ROWS):
+            records = df.iloc[start:start + config.MYSQL_WRITE_CHUNK_ROWS].to_records(index=False).tolist()
+            ",".join(cursor.mogrify(placeholders, record) for record in records)
+
+    def infile():
+        with csv_buffer(df):
+            pass
+
+    return (
+        min(timeit.repeat(insert, number=1, repeat=repeat)),
+        min(timeit.repeat(infile, number=1, repeat=repeat)),
+    )
+
+
+def end_to_end(conn, df: pd.DataFrame, repeat: int):
+    from stockdata.backend.db.db import load2mysql_by_infile, update2mysql_by_sql
+
+    table = "bench_bulk_load"
+    definition = ", ".join(f"`{col}` {SQL_TYPES[df[col].dtype.kind]}" for col in df.columns)
+    times = {}
+
+    for name, write in (("insert", update2mysql_by_sql), ("infile", load2mysql_by_infile)):
+        samples = []
+        for _ in range(repeat):
+            with conn.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+                cursor.execute(f"CREATE TABLE {table} ({definition})")
+                cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS _staging_{table}")
+
+            samples.append(timeit.timeit(lambda: write(df, table, conn), number=1))
+
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT COUNT(*) FROM {table}")
+                assert cursor.fetchone()[0] == len(df)
+
+        times[name] = min(samples)
+
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+    return times["insert"], times["infile"]
+
+
+def main(repeat: int = 5) -> None:
+    conn = connect()
+
+    print(f"{'frame':16} {'rows':>7} {'part':12} {'INSERT':>12} {'infile':>9} {'speedup':>8}")
+
+    for name, df in frames().items():
+        parts = {"client-side": client_side(df, repeat)}
+        if conn is not None:
+            parts["end-to-end"] = end_to_end(conn, df, repeat)
+
+        for part, (before, after) in parts.items():
+            print(f"{name:16} {len(df):7} {part:12} {before * 1000:10.1f}ms {after * 1000:7.1f}ms {before / after:7.1f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,103 @@
+"""
+Micro-benchmark of the numeric cleaner against the previous chained str.replace cleaner
+
+Run from the crawler directory:
+    python -m benchmarks.bench_cleaner [rows] [repeat]
+"""
+
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from stockdata.crawler import taiwan_stock_price
+
+
+NUMERIC = ["TradeVolume", "Transaction", "TradeValue", "Open", "Max", "Min", "Close", "Change"]
+
+
+def legacy_clear_data(df: pd.DataFrame) -> pd.DataFrame:
+    for col in NUMERIC:
+        df[col] = (
+            df[col]
+            .astype(str)
+            .str.replace(",", "")
+            .str.replace("X", "")
+            .str.replace("+", "")
+            .str.replace("----", "0")
+            .str.replace("---", "0")
+            .str.replace("--", "0")
+            .str.replace(" ", "")
+            .str.replace("除權息", "0")
+            .str.replace("除息", "0")
+            .str.replace("除權", "0")
+        )
+
+    return df
+
+
+def legacy_convert_change(df: pd.DataFrame) -> pd.DataFrame:
+    df["Dir"] = df["Dir"].str.split(">").str[1].str.split("<").str[0]
+    df["Change"] = df["Dir"] + df["Change"]
+    df["Change"] = df["Change"].str.replace(" ", "").str.replace("X", "").astype(float)
+    df = df.fillna("")
+    df = df.drop(["Dir"], axis=1)
+
+    return df
+
+
+def mi_index_frame(rows: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Synthetic MI_INDEX type=ALL table, with the placeholders seen in real payloads
+    """
+
+    rng = np.random.default_rng(seed)
+    close = rng.uniform(5, 1000, rows).round(2)
+
+    df = pd.DataFrame({
+        "StockID": [f"{1000 + i}" for i in range(rows)],
+        "TradeVolume": [f"{v:,}" for v in rng.integers(0, 10**9, rows)],
+        "Transaction": [f"{v:,}" for v in rng.integers(0, 10**5, rows)],
+        "TradeValue": [f"{v:,}" for v in rng.integers(0, 10**11, rows)],
+        "Open": [f"{v:,.2f}" for v in close],
+        "Max": [f"{v:,.2f}" for v in close * 1.01],
+        "Min": [f"{v:,.2f}" for v in close * 0.99],
+        "Close": [f"{v:,.2f}" for v in close],
+        "Dir": rng.choice(["<p style= color:red>+</p>", "<p style= color:green>-</p>", "<p> </p>", "<p>X</p>"], rows),
+        "Change": [f"{v:.2f}" for v in rng.uniform(0, 10, rows)],
+        "Date": "2024-01-02",
+    })
+
+    # Untraded and ex-dividend rows
+    df.loc[::37, ["Open", "Max", "Min", "Close"]] = "--"
+    df.loc[::53, "Change"] = "除權息"
+
+    return df
+
+
+def main(rows: int = 1200, repeat: int = 50) -> None:
+    df = mi_index_frame(rows)
+
+    def legacy():
+        return legacy_convert_change(legacy_clear_data(df.copy()))
+
+    def current():
+        return taiwan_stock_price.convert_change(taiwan_stock_price.clear_data(df.copy()))
+
+    # Same numbers out of both cleaners
+    expected = legacy()[NUMERIC].astype(float)
+    actual = current()[NUMERIC].astype(float)
+    pd.testing.assert_frame_equal(expected, actual)
+
+    legacy_time = min(timeit.repeat(legacy, number=1, repeat=repeat))
+    current_time = min(timeit.repeat(current, number=1, repeat=repeat))
+
+    print(f"rows={rows} repeat={repeat}")
+    print(f"legacy  clear_data + convert_change: {legacy_time * 1000:8.2f} ms")
+    print(f"current clear_data + convert_change: {current_time * 1000:8.2f} ms")
+    print(f"speedup: {legacy_time / current_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
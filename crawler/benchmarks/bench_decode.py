@@ -0,0 +1,140 @@
+"""
+Parse time and peak allocations per JSON payload, parse-once orjson decoding vs repeated response.json()
+
+Both sides parse numbers with the current cleaner, so only decoding and
+building the frame differ. MI_INDEX gains from both; T86 is all share
+counts, its time is the cleaner's and stays the same, only its peak drops
+since no frame of strings is built first.
+
+Run from the crawler directory:
+    python -m benchmarks.bench_decode [rows] [repeat]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import timeit
+import tracemalloc
+from unittest import mock
+
+os.environ.setdefault("CRAWLER_STATE_DIR", tempfile.mkdtemp(prefix="bench_decode_"))
+os.environ.setdefault("CRAWLER_ARCHIVE", "0")
+
+import numpy as np
+import pandas as pd
+import requests
+
+from benchmarks.bench_memory import institutional_payloads, numbers, prices
+from stockdata.crawler import taiwan_institutional_investor, taiwan_stock_price
+from stockdata.fetch import client
+
+
+DATE = "2024-01-02"
+
+
+def response(payload) -> requests.Response:
+    res = requests.Response()
+    res.status_code = 200
+    res._content = json.dumps(payload, ensure_ascii=False).encode()
+    res.encoding = "utf-8"
+
+    return res
+
+
+def mi_index_payload(rows: int) -> dict:
+    """
+    MI_INDEX type=ALL: the stock table plus the market summary tables that come with it
+    """
+
+    rng = np.random.default_rng(0)
+    fields = list(taiwan_stock_price.TWSE_COLUMNS)
+    data = [
+        [
+            str(1000 + i), "名稱", *numbers(rng, 1, 10**9), *numbers(rng, 1, 10**5), *numbers(rng, 1, 10**11),
+            *prices(rng, 4), "<p style= color:red>+</p>", *prices(rng, 1), *prices(rng, 1), "10", *prices(rng, 1), "5", "12.50",
+        ]
+        for i in range(rows)
+    ]
+    summary = [[f"指數{i}", *prices(rng, 4)] for i in range(300)]
+
+    payload = {"stat": "OK", "date": DATE.replace("-", ""), "fields9": fields, "data9": data}
+    for i in range(1, 9):
+        payload[f"fields{i}"] = ["名稱", "收盤", "漲跌", "漲跌點數", "漲跌百分比"]
+        payload[f"data{i}"] = summary
+
+    return payload
+
+
+def legacy_twse(res: requests.Response) -> pd.DataFrame:
+    """
+    The MI_INDEX parsing before the decode layer: response.json() for every lookup
+    """
+
+    if res.json()["stat"] == "很抱歉，沒有符合條件的資料!":
+        return pd.DataFrame()
+
+    if "data9" in res.json():
+        df = pd.DataFrame(res.json()["data9"])
+        colname = res.json()["fields9"]
+
+    df.columns = [taiwan_stock_price.TWSE_COLUMNS[col] for col in colname]
+    df = df.drop([""], axis=1)
+    df["Date"] = DATE
+    df = taiwan_stock_price.clear_data(df)
+
+    return taiwan_stock_price.convert_change(df)
+
+
+def legacy_t86(res: requests.Response) -> pd.DataFrame:
+    data = res.json()
+    df = pd.DataFrame(data["data"], columns=data["fields"])
+    df.columns = [taiwan_institutional_investor.TWSE_COLUMNS.get(col, col) for col in data["fields"]]
+    df = taiwan_institutional_investor.clear_data(df)
+    df["Date"] = DATE
+
+    return df
+
+
+def measure(fn, repeat: int):
+    fn()
+    seconds = min(timeit.repeat(fn, number=1, repeat=repeat))
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return seconds, peak
+
+
+def main(rows: int = 1300, repeat: int = 20) -> None:
+    mi_index = response(mi_index_payload(rows))
+    t86 = institutional_payloads(rows)("https://www.twse.com.tw/fund/T86")
+    t86 = response(t86.json())
+
+    cases = {
+        "MI_INDEX": (lambda: legacy_twse(mi_index), lambda: taiwan_stock_price.crawler_twse(DATE), mi_index),
+        "T86": (lambda: legacy_t86(t86), lambda: taiwan_institutional_investor.crawler_twse(DATE), t86),
+    }
+
+    print(f"rows={rows} repeat={repeat}")
+    print(f"{'payload':10} {'size':>8} {'before':>10} {'after':>10} {'peak before':>12} {'peak after':>11}")
+
+    for name, (before, after, res) in cases.items():
+        with mock.patch.object(client, "get", lambda *args, **kwargs: res), \
+                mock.patch("stockdata.trading_calendar.TradingCalendar.learn"):
+            expected, actual = before(), after()
+            pd.testing.assert_frame_equal(expected, actual)
+
+            before_time, before_peak = measure(before, repeat)
+            after_time, after_peak = measure(after, repeat)
+
+        print(
+            f"{name:10} {len(res.content) / 2**20:7.2f}M {before_time * 1000:8.2f}ms {after_time * 1000:8.2f}ms "
+            f"{before_peak / 2**20:11.2f}M {after_peak / 2**20:10.2f}M"
+        )
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
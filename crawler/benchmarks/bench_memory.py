@@ -0,0 +1,287 @@
+"""
+Peak memory of each dataset's transformation chain, copy-free vs the previous defensive copies
+
+The HTTP client is replaced by synthetic payloads shaped like the real ones.
+Responses are built, and JSON payloads decoded, before tracing starts: the
+payload is the chain's input, held by the fetch stage either way, so the peaks
+are what building, cleaning and validating the frames adds on top of it.
+The copy-free run is what the stage runner does: Copy-on-Write on, tables
+built with only their kept columns, each stage modifying the frame it owns.
+The "copying" run restores the old behaviour: Copy-on-Write off, every field
+of a table built and consolidated before the kept ones are selected, and
+every stage called as f(df.copy()).
+
+Run from the crawler directory:
+    python -m benchmarks.bench_memory [scale]
+"""
+
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+from unittest import mock
+
+os.environ.setdefault("CRAWLER_STATE_DIR", tempfile.mkdtemp(prefix="bench_memory_"))
+os.environ.setdefault("CRAWLER_ARCHIVE", "0")
+
+import numpy as np
+import pandas as pd
+
+from stockdata.crawler import (
+    common,
+    decode,
+    taiwan_futures_daily,
+    taiwan_institutional_investor,
+    taiwan_margin_short_sale,
+    taiwan_share_holding,
+    taiwan_stock_price,
+)
+from stockdata.fetch import client
+from stockdata.fetch.snapshot import snapshots
+from stockdata.pipeline import copy_on_write
+
+
+DATE = "2024-01-02"
+
+
+class FakeResponse:
+    def __init__(self, payload=None, content: bytes = b""):
+        self._payload = payload
+        self.content = content or json.dumps(payload, ensure_ascii=False).encode()
+        self.text = self.content.decode("utf-8", errors="replace")
+        self.status_code = 200
+        self.ok = True
+        self.headers = {}
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        pass
+
+
+def responses(twse: FakeResponse, tpex: FakeResponse):
+    return lambda url, **kwargs: twse if "twse" in url else tpex
+
+
+def numbers(rng, rows: int, high: int):
+    return [f"{v:,}" for v in rng.integers(0, high, rows)]
+
+
+def prices(rng, rows: int):
+    return [f"{v:.2f}" for v in rng.uniform(5, 1000, rows)]
+
+
+def stock_price_payloads(rows: int):
+    rng = np.random.default_rng(0)
+    twse_fields = [
+        "證券代號", "證券名稱", "成交股數", "成交筆數", "成交金額", "開盤價", "最高價", "最低價", "收盤價",
+        "漲跌(+/-)", "漲跌價差", "最後揭示買價", "最後揭示買量", "最後揭示賣價", "最後揭示賣量", "本益比",
+    ]
+    twse = list(zip(
+        [str(1000 + i) for i in range(rows)], ["名稱"] * rows,
+        numbers(rng, rows, 10**9), numbers(rng, rows, 10**5), numbers(rng, rows, 10**11),
+        prices(rng, rows), prices(rng, rows), prices(rng, rows), prices(rng, rows),
+        rng.choice(["<p style= color:red>+</p>", "<p style= color:green>-</p>"], rows).tolist(),
+        prices(rng, rows), prices(rng, rows), numbers(rng, rows, 10**3), prices(rng, rows), numbers(rng, rows, 10**3),
+        prices(rng, rows),
+    ))
+    tpex = list(zip(
+        [str(5000 + i) for i in range(rows)], ["名稱"] * rows,
+        prices(rng, rows), prices(rng, rows), prices(rng, rows), prices(rng, rows), prices(rng, rows),
+        numbers(rng, rows, 10**9), numbers(rng, rows, 10**11), numbers(rng, rows, 10**5),
+        *[prices(rng, rows)] * 9,
+    ))
+
+    return responses(
+        FakeResponse({"stat": "OK", "fields9": twse_fields, "data9": twse}),
+        FakeResponse({"tables": [{"data": tpex}]}),
+    )
+
+
+def institutional_payloads(rows: int):
+    rng = np.random.default_rng(1)
+    fields = [
+        "證券代號", "證券名稱",
+        "外陸資買進股數(不含外資自營商)", "外陸資賣出股數(不含外資自營商)", "外陸資買賣超股數(不含外資自營商)",
+        "外資自營商買進股數", "外資自營商賣出股數", "外資自營商買賣超股數",
+        "投信買進股數", "投信賣出股數", "投信買賣超股數", "自營商買賣超股數",
+        "自營商買進股數(自行買賣)", "自營商賣出股數(自行買賣)", "自營商買賣超股數(自行買賣)",
+        "自營商買進股數(避險)", "自營商賣出股數(避險)", "自營商買賣超股數(避險)", "三大法人買賣超股數",
+    ]
+    twse = [[str(1000 + i), "名稱", *(f"{v:,}" for v in rng.integers(0, 10**8, 17))] for i in range(rows)]
+    tpex = [[str(5000 + i), "名稱", *(f"{v:,}" for v in rng.integers(0, 10**8, 22))] for i in range(rows)]
+
+    return responses(
+        FakeResponse({"stat": "OK", "fields": fields, "data": twse}),
+        FakeResponse({"tables": [{"data": tpex}]}),
+    )
+
+
+def margin_payloads(rows: int):
+    rng = np.random.default_rng(2)
+    tpex_fields = [
+        "代號", "名稱", "前資餘額(張)", "資買", "資賣", "現償", "資餘額", "資屬證金", "資使用率(%)", "資限額",
+        "前券餘額(張)", "券賣", "券買", "券償", "券餘額", "券屬證金", "券使用率(%)", "券限額", "資券相抵(張)", "備註",
+    ]
+    twse = [[str(1000 + i), "名稱", *(f"{v:,}" for v in rng.integers(0, 10**6, 13)), ""] for i in range(rows)]
+    tpex = [[str(5000 + i), "名稱", *(f"{v:,}" for v in rng.integers(0, 10**6, 17)), ""] for i in range(rows)]
+
+    return responses(
+        FakeResponse({"stat": "OK", "tables": [{}, {"fields": [f"f{i}" for i in range(16)], "data": twse}]}),
+        FakeResponse({"tables": [{"fields": tpex_fields, "data": tpex}]}),
+    )
+
+
+def share_holding_payload(stocks: int):
+    rng = np.random.default_rng(3)
+    rows = stocks * 17
+    df = pd.DataFrame({
+        "資料日期": "20240105",
+        "證券代號": np.repeat([f"{1000 + i:06d}" for i in range(stocks)], 17),
+        "持股分級": np.tile(np.arange(1, 18), stocks),
+        "人數": rng.integers(0, 10**5, rows),
+        "股數": rng.integers(0, 10**9, rows),
+        "占集保庫存數比例%": rng.uniform(0, 100, rows).round(2),
+    })
+    response = FakeResponse(content=df.to_csv(index=False).encode())
+
+    return lambda url, **kwargs: response
+
+
+def futures_payload(rows: int):
+    rng = np.random.default_rng(4)
+    df = pd.DataFrame({
+        "交易日期": "2024/01/02",
+        "契約": rng.choice(["TX", "MTX", "TE", "TF"], rows),
+        "到期月份(週別)": rng.choice(["202401", "202402", "202403"], rows),
+        "開盤價": prices(rng, rows),
+        "最高價": prices(rng, rows),
+        "最低價": prices(rng, rows),
+        "收盤價": prices(rng, rows),
+        "漲跌價": prices(rng, rows),
+        "漲跌%": [f"{v:.2f}%" for v in rng.uniform(-5, 5, rows)],
+        "成交量": rng.integers(0, 10**5, rows),
+        "結算價": prices(rng, rows),
+        "未沖銷契約數": rng.integers(0, 10**5, rows),
+        "最後最佳買價": "-",
+        "最後最佳賣價": "-",
+        "歷史最高價": "-",
+        "歷史最低價": "-",
+        "是否因訊息面暫停交易": "",
+        "交易時段": rng.choice(["一般", "盤後"], rows),
+        "價差對單式委託成交量": "-",
+    })
+    response = FakeResponse(content=df.to_csv(index=False).encode("big5"))
+
+    return lambda url, **kwargs: response
+
+
+def streaming(fake_get):
+    """
+    client.stream over a fake response, so chunked pipelines read the same payloads
+
+    Snapshot fingerprints are ignored by main(), every run parses the whole payload.
+    """
+
+    @contextlib.contextmanager
+    def stream(method, url, chunk_size=1 << 16, **kwargs):
+        response = fake_get(url, **kwargs)
+        chunks = (response.content[i:i + chunk_size] for i in range(0, len(response.content), chunk_size))
+        yield response, io.BufferedReader(client.ChunkReader(chunks), buffer_size=chunk_size)
+
+    return stream
+
+
+def copying(stage):
+    return lambda df, *args, **kwargs: stage(df.copy(), *args, **kwargs)
+
+
+def consolidating(frame):
+    """
+    decode.frame as it was: every field built and copied into one frame, then the kept ones selected and renamed
+    """
+
+    def build(rows, columns, dtypes=None, names=None):
+        df = frame(rows, columns, dtypes).copy()
+        if names is None:
+            return df
+
+        df = df[list(names)]
+        df.columns = list(names.values())
+        return df
+
+    return build
+
+
+# dataset: (pipeline, fake HTTP, stages that used to receive df.copy())
+def datasets(scale: int):
+    return {
+        "taiwan_stock_price": (
+            lambda: taiwan_stock_price.stock_price_pipeline(DATE),
+            stock_price_payloads(1300 * scale),
+            [(taiwan_stock_price, ["clear_data", "convert_change"]), (common, ["check_schema"])],
+        ),
+        "taiwan_institutional_investor": (
+            lambda: taiwan_institutional_investor.institutional_investor_pipeline(DATE),
+            institutional_payloads(1300 * scale),
+            [(taiwan_institutional_investor, ["clear_data"]), (common, ["check_schema"])],
+        ),
+        "taiwan_margin_short_sale": (
+            lambda: taiwan_margin_short_sale.margin_short_sale_pipeline(DATE),
+            margin_payloads(1300 * scale),
+            [(taiwan_margin_short_sale, ["clear_data"]), (common, ["check_schema"])],
+        ),
+        "taiwan_share_holding": (
+            lambda: sum(len(df) for df in taiwan_share_holding.share_holding_pipeline()),
+            share_holding_payload(3800 * scale),
+            [(taiwan_share_holding, ["colname_zh2en", "format_date", "clean_security_code", "check_schema"])],
+        ),
+        "taiwan_future_daily": (
+            lambda: taiwan_futures_daily.future_pipeline(DATE),
+            futures_payload(600 * scale),
+            [(taiwan_futures_daily, ["colname_zh2en", "clean_data", "check_schema"])],
+        ),
+    }
+
+
+def peak(pipeline) -> int:
+    with contextlib.redirect_stdout(io.StringIO()):
+        pipeline()  # warm up caches and lazy imports
+
+        tracemalloc.start()
+        result = pipeline()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    del result
+    return peak_bytes
+
+
+def main(scale: int = 1) -> None:
+    print(f"{'dataset':32} {'copying':>10} {'copy-free':>10} {'saved':>7}")
+
+    for name, (pipeline, fake_get, stages) in datasets(scale).items():
+        with mock.patch.object(client, "get", fake_get), mock.patch.object(client, "post", fake_get), \
+                mock.patch.object(client, "stream", streaming(fake_get)), \
+                mock.patch.object(decode, "payload", FakeResponse.json), \
+                mock.patch.object(snapshots, "get", lambda source: None):
+            with copy_on_write():
+                current = peak(pipeline)
+
+            with contextlib.ExitStack() as stack:
+                stack.enter_context(pd.option_context("mode.copy_on_write", False))
+                stack.enter_context(mock.patch.object(decode, "frame", consolidating(decode.frame)))
+                for module, names in stages:
+                    for stage in names:
+                        stack.enter_context(mock.patch.object(module, stage, copying(getattr(module, stage))))
+                legacy = peak(pipeline)
+
+        print(f"{name:32} {legacy / 2**20:9.1f}M {current / 2**20:9.1f}M {1 - current / legacy:6.0%}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:2]))
@@ -0,0 +1,105 @@
+"""
+Backfill wall time and results held in memory, staged pipeline vs the date engine
+
+Fetch waits like a rate-limited download, transform is the real schema validation
+of a full-market day, write waits like a MySQL load. The engine crawls (fetch and
+validate) CRAWLER_CONCURRENCY dates at once and loads on one thread; the pipeline
+runs fetch, transform and write as separate stages joined by bounded queues.
+
+Run from the crawler directory:
+    python -m benchmarks.bench_pipeline [dates] [fetch_ms] [write_ms]
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+os.environ.setdefault("CRAWLER_STATE_DIR", tempfile.mkdtemp(prefix="bench_pipeline_"))
+os.environ.setdefault("CRAWLER_ARCHIVE", "0")
+
+from benchmarks.bench_memory import stock_price_payloads
+from stockdata import pipeline
+from stockdata.config import CRAWLER_CONCURRENCY, CRAWLER_QUEUE_SIZE
+from stockdata.crawler import taiwan_stock_price
+from stockdata.fetch import client, engine
+
+
+class Held:
+    """
+    Fetched results not written yet, and the most there ever were
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.now = self.peak = 0
+
+    def add(self, n: int) -> None:
+        with self.lock:
+            self.now += n
+            self.peak = max(self.peak, self.now)
+
+
+def main(dates: int = 40, fetch_ms: int = 100, write_ms: int = 150) -> None:
+    fake_get = stock_price_payloads(1300)
+    items = [f"2024-01-{i:02d}" for i in range(1, dates + 1)]
+
+    def fetch(date):
+        time.sleep(fetch_ms / 1000)
+        return taiwan_stock_price.stock_price_fetch(date)
+
+    def run_engine(held):
+        def crawl(date):
+            frames = taiwan_stock_price.stock_price_transform(date, fetch(date))
+            held.add(1)
+            return frames
+
+        def write(date, frames):
+            time.sleep(write_ms / 1000)
+            held.add(-1)
+
+        engine.run_dates(crawl, write, items, CRAWLER_CONCURRENCY)
+
+    def run_pipeline(held, writers):
+        def fetch_held(date):
+            frames = fetch(date)
+            held.add(1)
+            return frames
+
+        def write(date, frames):
+            time.sleep(write_ms / 1000)
+            held.add(-1)
+
+        pipeline.run(items, [
+            pipeline.Stage("fetch", fetch_held, CRAWLER_CONCURRENCY),
+            pipeline.Stage("transform", taiwan_stock_price.stock_price_transform, 1),
+            pipeline.Stage("write", write, writers),
+        ], CRAWLER_QUEUE_SIZE)
+
+    print(f"dates={dates} fetch={fetch_ms}ms write={write_ms}ms concurrency={CRAWLER_CONCURRENCY} queue={CRAWLER_QUEUE_SIZE}")
+    print(f"{'run':20} {'wall':>8} {'peak held':>10}")
+
+    with contextlib.redirect_stdout(io.StringIO()), mock.patch.object(client, "get", fake_get), \
+            mock.patch("stockdata.trading_calendar.TradingCalendar.learn"):
+        results = {}
+        runs = {
+            "engine": run_engine,
+            "pipeline, 1 writer": lambda held: run_pipeline(held, 1),
+            "pipeline, 2 writers": lambda held: run_pipeline(held, 2),
+        }
+        for name, run in runs.items():
+            held = Held()
+            started = time.perf_counter()
+            run(held)
+            results[name] = (time.perf_counter() - started, held.peak)
+
+    for name, (wall, peak) in results.items():
+        print(f"{name:20} {wall:7.2f}s {peak:10}")
+
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:4]))
@@ -0,0 +1,165 @@
+import threading
+import time
+import typing
+
+import pandas as pd
+from loguru import logger
+
+from stockdata.config import MYSQL_BATCH_ROWS, MYSQL_BATCH_SECONDS
+from stockdata.metrics import metrics
+from . import manifest
+from .db import publish2mysql_by_dates, stage2mysql, update2mysql_by_sql
+
+
+class _Load(typing.NamedTuple):
+    date: str
+    market: str
+    df: pd.DataFrame
+    digest: str
+    publish: bool
+
+
+class BatchWriter:
+    """
+    Buffers the cleaned markets of many dates of one table and writes them together
+
+    A backfill writes thousands of small per-date loads, each paying for its own
+    staging table, publish transaction and manifest commit. The writer holds the
+    loads until `max_rows` rows or the oldest is `max_seconds` old, then writes
+    them at once: one staging pass and one publish for the published dates, one
+    chunked upsert for the others. Each (date, market) still gets its own manifest
+    entry, with its own row count and content hash, recorded only once its rows are written.
+
+    Safe to share between the write workers of a pipeline, a flush runs in the
+    thread whose add() crossed a threshold while the others keep buffering.
+    Dates that could not be written are left out of the manifest and reported by
+    close(), which raises so the run does not end as a success.
+    """
+
+    def __init__(self, router, table: str, max_rows: int = MYSQL_BATCH_ROWS, max_seconds: float = MYSQL_BATCH_SECONDS):
+        self.router = router
+        self.table = table
+        self.max_rows = max_rows
+        self.max_seconds = max_seconds
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._loads: typing.List[_Load] = []
+        self._rows = 0
+        self._oldest = None
+        self._failed: typing.List[str] = []
+
+    def add(self, date: str, frames: typing.Dict[str, pd.DataFrame], publish: bool) -> None:
+        """
+        Buffer the markets of a date, as chosen by markets_to_load
+
+        Args:
+            date: 'YYYY-MM-DD'
+            frames: {market: cleaned rows of the date}
+            publish: Replace the date with these markets (every market of the date), else upsert them
+        """
+
+        # Hashed here, in the caller's thread, rather than in the flush
+        loads = [_Load(date, market, df, manifest.content_hash(df), publish) for market, df in frames.items()]
+
+        with self._lock:
+            self._loads.extend(loads)
+            self._rows += sum(len(load.df) for load in loads)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+
+            if self._rows >= self.max_rows:
+                reason = "rows"
+            elif time.monotonic() - self._oldest >= self.max_seconds:
+                reason = "time"
+            else:
+                return
+
+            batch = self._take()
+
+        self._flush(batch, reason)
+
+    def close(self) -> None:
+        """
+        Write whatever is still buffered, the end of the run
+
+        Raises:
+            RuntimeError: Some dates were not written, they are fetched again next run
+        """
+
+        with self._lock:
+            batch = self._take()
+
+        self._flush(batch, "final")
+
+        if self._failed:
+            failed = sorted(self._failed)
+            raise RuntimeError(f"{self.table}: {len(failed)} dates not written ({', '.join(failed)})")
+
+    def _take(self) -> typing.List[_Load]:
+        batch, self._loads = self._loads, []
+        self._rows, self._oldest = 0, None
+
+        return batch
+
+    def _flush(self, batch: typing.List[_Load], reason: str) -> None:
+        if not batch:
+            return
+
+        dates = sorted({load.date for load in batch})
+
+        # One flush at a time, they would share the publish staging table of the connection otherwise
+        with self._flush_lock:
+            started = time.perf_counter()
+            written = self._write(batch)
+
+            # A date failing the publish checks would hold back the whole batch, so write date by date instead
+            if not written and len(dates) > 1:
+                logger.warning(f"{self.table}: batch of {len(dates)} dates not written, retrying date by date")
+                metrics.inc("db_batch_fallbacks_total", table=self.table)
+                failed = [date for date in dates if not self._write([load for load in batch if load.date == date])]
+            else:
+                failed = [] if written else dates
+
+            if failed:
+                logger.error(f"{self.table}: {len(failed)} dates not written: {', '.join(failed)}")
+                metrics.inc("db_batch_failed_dates_total", len(failed), table=self.table)
+                self._failed.extend(failed)
+
+        rows = sum(len(load.df) for load in batch)
+        metrics.inc("db_batch_flushes_total", table=self.table, reason=reason)
+        metrics.inc("db_batch_dates_total", len(dates), table=self.table)
+        metrics.inc("db_batch_rows_total", rows, table=self.table)
+        logger.info(
+            f"{self.table}: flushed {rows} rows of {len(dates)} dates ({dates[0]}..{dates[-1]}, {reason}) "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+
+    def _write(self, batch: typing.List[_Load]) -> bool:
+        """
+        Write the loads and record them in the manifest, on one connection
+        (the staging table belongs to it)
+        """
+
+        entries = [(self.table, load.market, load.date, len(load.df), load.digest) for load in batch]
+
+        published = [load for load in batch if load.publish]
+        upserted = [load for load in batch if not load.publish]
+
+        with self.router.connection(self.table) as conn:
+            if published:
+                for i, load in enumerate(published):
+                    if not stage2mysql(load.df, self.table, conn, reset=i == 0):
+                        return False
+
+                row_counts = {}
+                for load in published:
+                    row_counts[load.date] = row_counts.get(load.date, 0) + len(load.df)
+
+                if not publish2mysql_by_dates(self.table, row_counts, list(published[0].df.columns), conn):
+                    return False
+
+            if upserted and not update2mysql_by_sql(pd.concat([load.df for load in upserted], ignore_index=True), self.table, conn):
+                return False
+
+            return manifest.record_many(entries, conn)
@@ -1,5 +1,6 @@
+import json
 import pymysql
-from typing import Any
+from typing import Any, Dict
 
 from stockdata.config import (
     MYSQL_DATA_USER,
@@ -7,36 +8,92 @@ from stockdata.config import (
     MYSQL_DATA_HOST,
     MYSQL_DATA_PORT,
     MYSQL_DATA_DATABASE,
+    MYSQL_TARGETS,
+    MYSQL_ROUTES,
 )
 
 
-def get_mysql_stockdata_conn() -> Any:
+# Target of the tables MYSQL_ROUTES does not mention, the MYSQL_DATA_* database
+DEFAULT_TARGET = "stockdata"
+
+
+def mysql_targets() -> Dict[str, Dict[str, Any]]:
     """
-    Get MySQL stockdata database connetcion
-    
+    Connection settings of every MySQL target: "stockdata" from MYSQL_DATA_*,
+    plus the targets of MYSQL_TARGETS, whose missing fields default to MYSQL_DATA_*
+    """
+
+    default = {
+        "host": MYSQL_DATA_HOST,
+        "port": MYSQL_DATA_PORT,
+        "user": MYSQL_DATA_USER,
+        "password": MYSQL_DATA_PASSWORD,
+        "database": MYSQL_DATA_DATABASE,
+    }
+
+    targets = {DEFAULT_TARGET: default}
+    for name, settings in json.loads(MYSQL_TARGETS).items():
+        unknown = set(settings) - set(default)
+        if unknown:
+            raise ValueError(f"MYSQL_TARGETS {name}: unknown settings {sorted(unknown)}")
+        targets[name] = {**default, **settings, "port": int(settings.get("port", default["port"]))}
+
+    return targets
+
+
+def mysql_routes() -> Dict[str, str]:
+    """
+    {table: target} of MYSQL_ROUTES, every target checked to exist
+    """
+
+    routes = json.loads(MYSQL_ROUTES)
+    targets = mysql_targets()
+
+    for table, target in routes.items():
+        if target not in targets:
+            raise ValueError(f"MYSQL_ROUTES {table}: unknown target {target}, expected one of {list(targets)}")
+
+    return routes
+
+
+def get_mysql_conn(target: str = DEFAULT_TARGET) -> Any:
+    """
+    Get a connection to a MySQL target
+
+    Args:
+        target: Name of the target, a key of mysql_targets()
+
     Returns:
         pymysql.connections.Connection: database connection object
-        
-    Connection informations:
-    - user: root
-    - password: test
-    - host: localhost
-    - port: 3306
-    - database: stockdata
     """
 
     try:
         connection = pymysql.connect(
-            host= MYSQL_DATA_HOST,
-            port= MYSQL_DATA_PORT,
-            user= MYSQL_DATA_USER ,
-            password= MYSQL_DATA_PASSWORD,
-            database= MYSQL_DATA_DATABASE,
+            **mysql_targets()[target],
             charset='utf8mb4',
+            local_infile=True,
             cursorclass=pymysql.cursors.DictCursor
         )
         return connection
-    
+
     except Exception as e:
-        print(f"Error exists while connecting database: {str(e)}")
+        print(f"Error exists while connecting database {target}: {str(e)}")
         raise
+
+
+def get_mysql_stockdata_conn() -> Any:
+    """
+    Get MySQL stockdata database connetcion
+
+    Returns:
+        pymysql.connections.Connection: database connection object
+
+    Connection informations:
+    - user: root
+    - password: test
+    - host: localhost
+    - port: 3306
+    - database: stockdata
+    """
+
+    return get_mysql_conn(DEFAULT_TARGET)
@@ -1,66 +1,221 @@
+import contextlib
+import csv
+import os
+import tempfile
+import time
 import typing
 from typing import List
 import pandas as pd
 import pymysql
 from loguru import logger
 
+from stockdata.config import MYSQL_BULK_LOAD_TABLES, MYSQL_PUBLISH_TABLES, MYSQL_WRITE_CHUNK_ROWS
+from stockdata.metrics import metrics
+from stockdata.schema.dataset import DATASET_SCHEMAS
 
-def update2mysql_by_sql(df: pd.DataFrame, table: str, mysql_conn):
+
+def bulk_load_enabled(table: str) -> bool:
+    """
+    True when a table is configured to be written with LOAD DATA LOCAL INFILE
+    """
+
+    tables = {name.strip() for name in MYSQL_BULK_LOAD_TABLES.split(",") if name.strip()}
+
+    return "*" in tables or table in tables
+
+
+@contextlib.contextmanager
+def csv_buffer(df: pd.DataFrame) -> typing.Iterator[str]:
+    """
+    Write a DataFrame as CSV to an in-memory file, and yield a path the MySQL client can open
+
+    Uses an anonymous memory file (memfd) where the OS has one, a temporary file elsewhere.
+    Missing values are written as an unquoted NULL, read back as SQL NULL.
+    """
+
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create("stockdata_load")
+        path = f"/proc/self/fd/{fd}"
+    else:
+        fd, path = tempfile.mkstemp(suffix=".csv")
+
+    try:
+        with os.fdopen(fd, "wb") as f:
+            df.to_csv(f, header=False, index=False, na_rep="NULL", quoting=csv.QUOTE_MINIMAL, lineterminator="\n", encoding="utf-8")
+            f.flush()
+
+            # The client reads the buffer through its path while the descriptor is still open
+            yield path
+
+    finally:
+        if not path.startswith("/proc/self/fd/"):
+            os.remove(path)
+
+
+def load_data(cursor, table: str, df: pd.DataFrame) -> None:
+    """
+    Send the rows of a DataFrame into a table with LOAD DATA LOCAL INFILE, without committing
+    """
+
+    columns = ", ".join(f'`{col}`' for col in df.columns)
+
+    with csv_buffer(df) as path:
+        cursor.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET utf8mb4 "
+            f"FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' "
+            f"LINES TERMINATED BY '\\n' ({columns})",
+            (path,),
+        )
+
+
+def create_staging(cursor, staging: str, table: str) -> None:
+    """
+    Create (or empty) a temporary table with the columns of `table`, private to this connection
+
+    No keys or partitions are copied, so it can be filled with anything and checked afterwards.
     """
-    Upload DataFrame to MySQL using SQL INSERT
+
+    cursor.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} SELECT * FROM {table} WHERE 1 = 0")
+    cursor.execute(f"TRUNCATE TABLE {staging}")
+
+
+def load2mysql_by_infile(df: pd.DataFrame, table: str, mysql_conn, chunk_rows: int = MYSQL_WRITE_CHUNK_ROWS):
     """
+    Upload DataFrame to MySQL using LOAD DATA LOCAL INFILE
+
+    The rows are streamed from an in-memory CSV into a temporary staging
+    table, then merged into the target with INSERT ... SELECT ... ON DUPLICATE KEY UPDATE.
+    Like update2mysql_by_sql, `chunk_rows` rows are loaded and committed at a
+    time and counted in db_rows_written_total.
+    """
+
+    staging = f"_staging_{table}"
+    columns = ", ".join(f'`{col}`' for col in df.columns)
+    updates = ", ".join(f'`{col}` = s.`{col}`' for col in update_columns(table, df.columns) or df.columns)
+
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
 
-    if len(df) > 0:
         try:
             
             # Create a cursor
             with mysql_conn.cursor() as cursor:
                 
-                colname = ",".join(f'`{col}`' for col in df.columns)
-                sql = f"INSERT INTO {table} ({colname}) VALUES ({', '.join(['%s'] * len(df.columns))})"
-                
-                # Insert the data
-                records = df.to_records(index=False).tolist()
-                cursor.executemany(sql, records)
+                create_staging(cursor, staging, table)
+                load_data(cursor, staging, chunk)
+                cursor.execute(
+                    f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} AS s "
+                    f"ON DUPLICATE KEY UPDATE {updates}"
+                )
+                written = count_written(cursor.rowcount, len(chunk))
                 
-                # Commit the transaction
+                # Commit the chunk
                 mysql_conn.commit()
-            
-            return True
         
         except Exception as e:
             
-            logger.error(f"MySQL insertion error: {type(e).__name__}: {e}")
+            logger.error(f"MySQL bulk load error: {type(e).__name__}: {e}")
             mysql_conn.rollback()
-           
+            
             return False
+        
+        metrics.inc("db_bulk_load_rows_total", len(chunk), table=table)
+        report_written(table, written)
     
     return True
 
-def update2mysql_by_sql_for_info(df: pd.DataFrame, table: str, mysql_conn):
+
+def natural_key(table: str) -> typing.Tuple[str, ...]:
+    """
+    Key columns of a dataset table, empty for tables without a dataset schema
     """
-    Upload DataFrame to MySQL using SQL INSERT
+
+    schema = DATASET_SCHEMAS.get(table)
+
+    return schema.natural_key if schema is not None else ()
+
+
+def update_columns(table: str, columns: typing.Iterable[str]) -> List[str]:
+    """
+    Columns rewritten when an upsert meets an existing row: every column but the key
+    """
+
+    key = set(natural_key(table))
+
+    return [col for col in columns if col not in key]
+
+
+def count_written(rowcount: int, rows: int) -> typing.Tuple[int, int, int]:
+    """
+    (inserted, updated, unchanged) rows of an INSERT ... ON DUPLICATE KEY UPDATE of `rows` rows
+
+    MySQL reports 1 affected row per inserted row, 2 per updated row and 0 for
+    an existing row that already held the values. Rows beyond one each are
+    updates, the inserts and unchanged rows are what is left.
+    """
+
+    updated = min(max(rowcount - rows, 0), rows)
+    inserted = min(max(rowcount - 2 * updated, 0), rows - updated)
+
+    return inserted, updated, rows - inserted - updated
+
+
+def report_written(table: str, written: typing.Tuple[int, int, int]) -> None:
+    """
+    Count the rows of an upsert in db_rows_written_total, by result
+    """
+
+    for result, rows in zip(("inserted", "updated", "unchanged"), written):
+        metrics.inc("db_rows_written_total", rows, table=table, result=result)
+
+
+def insert_values(cursor, table: str, df: pd.DataFrame, suffix: str = "") -> None:
+    """
+    Send the rows of a DataFrame as one multi-row INSERT, without committing
+
+    A single statement per call (rather than executemany's batches) makes
+    the cursor's rowcount cover the whole chunk.
+    """
+
+    colname = ",".join(f'`{col}`' for col in df.columns)
+    placeholders = f"({', '.join(['%s'] * len(df.columns))})"
+
+    values = ",".join(cursor.mogrify(placeholders, record) for record in df.to_records(index=False).tolist())
+    cursor.execute(f"INSERT INTO {table} ({colname}) VALUES {values}{suffix}")
+
+
+def update2mysql_by_sql(df: pd.DataFrame, table: str, mysql_conn, chunk_rows: int = MYSQL_WRITE_CHUNK_ROWS):
+    """
+    Upload DataFrame to MySQL using SQL INSERT ... ON DUPLICATE KEY UPDATE on the table's natural key,
+    or LOAD DATA for the tables in MYSQL_BULK_LOAD_TABLES
+
+    Rows are sent and committed `chunk_rows` at a time, so a failure only rolls
+    back its chunk and loading the same rows again just rewrites them.
+    Inserted, updated and unchanged rows are counted in db_rows_written_total.
+
+    Returns:
+        bool: True when every chunk was written
     """
 
-    if len(df) > 0:
+    if bulk_load_enabled(table):
+        return load2mysql_by_infile(df, table, mysql_conn)
+
+    updates = ", ".join(f'`{col}`=VALUES(`{col}`)' for col in update_columns(table, df.columns))
+    upsert = f" ON DUPLICATE KEY UPDATE {updates}" if natural_key(table) and updates else ""
+
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+
         try:
             
             # Create a cursor
             with mysql_conn.cursor() as cursor:
                 
-                colname = ",".join(f'`{col}`' for col in df.columns)
-                update_cols = ['StockName', 'MarketType']
-                sql = f"INSERT INTO {table} ({colname}) VALUES ({', '.join(['%s']*len(df.columns))}) ON DUPLICATE KEY UPDATE {', '.join([f'{c}=VALUES({c})' for c in update_cols])}"
-
-                
-                # Insert the data
-                records = df.to_records(index=False).tolist()
-                cursor.executemany(sql, records)
+                insert_values(cursor, table, chunk, upsert)
+                written = count_written(cursor.rowcount, len(chunk))
                 
-                # Commit the transaction
+                # Commit the chunk
                 mysql_conn.commit()
-            
-            return True
         
         except Exception as e:
             
@@ -68,5 +223,190 @@ def update2mysql_by_sql_for_info(df: pd.DataFrame, table: str, mysql_conn):
             mysql_conn.rollback()
            
             return False
+        
+        report_written(table, written)
     
-    return True
\ No newline at end of file
+    return True
+
+def update2mysql_by_sql_for_info(df: pd.DataFrame, table: str, mysql_conn):
+    """
+    Upload stock info to MySQL, updating name, market and industry of known StockIDs
+    """
+
+    return update2mysql_by_sql(df, table, mysql_conn)
+
+def publish_enabled(table: str) -> bool:
+    """
+    True when the dated loads of a table go through a staging table and are published per date
+    """
+
+    tables = {name.strip() for name in MYSQL_PUBLISH_TABLES.split(",") if name.strip()}
+
+    return "*" in tables or table in tables
+
+
+def stage2mysql(df: pd.DataFrame, table: str, mysql_conn, reset: bool = False):
+    """
+    Add rows to the publish staging table of `table`, nothing is visible to readers yet
+
+    Args:
+        df: Rows of the date being loaded
+        table: Live table the rows are published to
+        reset: Empty the staging table first, for the first batch of a date
+    """
+
+    staging = f"_publish_{table}"
+
+    try:
+
+        # Create a cursor
+        with mysql_conn.cursor() as cursor:
+
+            if reset:
+                create_staging(cursor, staging, table)
+
+            if bulk_load_enabled(table):
+                load_data(cursor, staging, df)
+            else:
+                for start in range(0, len(df), MYSQL_WRITE_CHUNK_ROWS):
+                    insert_values(cursor, staging, df.iloc[start:start + MYSQL_WRITE_CHUNK_ROWS])
+
+        mysql_conn.commit()
+
+        return True
+
+    except Exception as e:
+
+        logger.error(f"MySQL staging error: {type(e).__name__}: {e}")
+        mysql_conn.rollback()
+
+        return False
+
+
+def publish2mysql_by_date(table: str, date: str, columns: List[str], row_count: int, mysql_conn):
+    """
+    Replace the rows of a date in `table` with the staged rows, in one short transaction
+
+    The staged rows are checked first: expected row count, only that date and
+    unique natural keys. Readers (InnoDB consistent reads) see either the
+    previous rows of the date or all of the new ones, and the live table is
+    only written by one DELETE and one INSERT ... SELECT from the local staging table.
+
+    Args:
+        table: Live table
+        date: 'YYYY-MM-DD'
+        columns: Staged columns
+        row_count: Rows staged by the caller
+    """
+
+    return publish2mysql_by_dates(table, {date: row_count}, columns, mysql_conn)
+
+
+def publish2mysql_by_dates(table: str, row_counts: typing.Dict[str, int], columns: List[str], mysql_conn):
+    """
+    Replace the rows of several dates in `table` with the staged rows, in one transaction
+
+    Same checks as publish2mysql_by_date, per date: each date staged with its
+    expected row count and unique natural keys, and no other date staged.
+
+    Args:
+        table: Live table
+        row_counts: {'YYYY-MM-DD': rows staged by the caller}
+        columns: Staged columns
+    """
+
+    staging = f"_publish_{table}"
+    key = ", ".join(f'`{col}`' for col in natural_key(table))
+    colname = ", ".join(f'`{col}`' for col in columns)
+    dates = sorted(row_counts)
+
+    try:
+
+        # Create a cursor
+        with mysql_conn.cursor() as cursor:
+
+            cursor.execute(
+                f"SELECT `Date` AS `date`, COUNT(*) AS `staged`, COUNT(DISTINCT {key or colname}) AS `distinct_keys` "
+                f"FROM {staging} GROUP BY `Date`"
+            )
+            staged = {str(row["date"]): row for row in cursor.fetchall()}
+
+            problems = []
+            for date, row_count in row_counts.items():
+                check = staged.get(date, {"staged": 0, "distinct_keys": 0})
+                if check["staged"] != row_count:
+                    problems.append(f"{date}: {check['staged']} rows staged, {row_count} expected")
+                if key and check["distinct_keys"] != check["staged"]:
+                    problems.append(f"{date}: {check['staged'] - check['distinct_keys']} duplicate keys")
+
+            other_dates = sum(check["staged"] for date, check in staged.items() if date not in row_counts)
+            if other_dates > 0:
+                problems.append(f"{other_dates} rows of another date")
+
+            if problems:
+                logger.error(f"Publishing {table} {dates[0]}..{dates[-1]} rejected: {'; '.join(problems)}")
+                metrics.inc("db_publish_rejected_total", table=table)
+
+                return False
+
+            started = time.perf_counter()
+
+            cursor.execute(f"DELETE FROM {table} WHERE `Date` IN ({', '.join(['%s'] * len(dates))})", dates)
+            cursor.execute(f"INSERT INTO {table} ({colname}) SELECT {colname} FROM {staging}")
+
+            # Commit the transaction
+            mysql_conn.commit()
+
+            metrics.set("db_publish_seconds", time.perf_counter() - started, table=table)
+            metrics.inc("db_published_rows_total", sum(row_counts.values()), table=table)
+
+            cursor.execute(f"TRUNCATE TABLE {staging}")
+
+        return True
+
+    except Exception as e:
+
+        logger.error(f"MySQL publish error: {type(e).__name__}: {e}")
+        mysql_conn.rollback()
+
+        return False
+
+
+def delete_mysql_by_key(table: str, column: str, values: List, mysql_conn):
+    """
+    Delete the rows whose key column is one of the given values
+    """
+
+    if len(values) > 0:
+        try:
+
+            # Create a cursor
+            with mysql_conn.cursor() as cursor:
+
+                sql = f"DELETE FROM {table} WHERE `{column}` IN ({', '.join(['%s'] * len(values))})"
+                cursor.execute(sql, list(values))
+
+                # Commit the transaction
+                mysql_conn.commit()
+
+            return True
+
+        except Exception as e:
+
+            logger.error(f"MySQL deletion error: {type(e).__name__}: {e}")
+            mysql_conn.rollback()
+
+            return False
+
+    return True
+
+def read_mysql_by_sql(sql: str, mysql_conn, params: typing.Sequence = None) -> pd.DataFrame:
+    """
+    Run a SELECT and return the rows as a DataFrame
+    """
+
+    with mysql_conn.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    return pd.DataFrame(list(rows))
@@ -0,0 +1,329 @@
+import datetime
+import re
+import typing
+from typing import Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from stockdata.config import MYSQL_PARTITION_FIRST_YEAR
+from stockdata.metrics import metrics
+from stockdata.schema.dataset import DATASET_SCHEMAS, field_types
+
+
+# Column types of the model field types, BIGINT and DOUBLE hold what pandas int64 and float64 hold
+SQL_TYPES = {int: "BIGINT", float: "DOUBLE", bool: "TINYINT(1)"}
+
+# VARCHAR lengths of string columns, short key columns keep the primary key and every secondary index small
+STRING_LENGTHS = {
+    "StockID": 16,
+    "FuturesID": 16,
+    "ContractDate": 16,
+    "TradingSession": 16,
+    "Note": 255,
+}
+
+# Suffixes of the tables a rebuild goes through, the previous table is kept until the next rebuild
+REBUILD_SUFFIX = "__migrate"
+BACKUP_SUFFIX = "__before_migrate"
+
+PARTITION_NAME = re.compile(r"^p(\d{4})$")
+
+
+def column_type(name: str, kind: type) -> str:
+    """
+    MySQL type of a model field, e.g. ("Date", str) -> "DATE", ("StockID", str) -> "VARCHAR(16)"
+    """
+
+    if name == "Date":
+        return "DATE"
+
+    if kind is str:
+        return f"VARCHAR({STRING_LENGTHS.get(name, 64)})"
+
+    return SQL_TYPES[kind]
+
+
+def table_columns(table: str) -> Dict[str, Tuple[str, bool]]:
+    """
+    {column: (MySQL type, nullable)} of a dataset table, in the field order of its model
+    """
+
+    return {
+        name: (column_type(name, kind), nullable)
+        for name, (kind, nullable) in field_types(DATASET_SCHEMAS[table]).items()
+    }
+
+
+def is_dated(table: str) -> bool:
+    return "Date" in DATASET_SCHEMAS[table].model_fields
+
+
+def partition_years(today: Optional[datetime.date] = None) -> range:
+    """
+    Years with their own partition: MYSQL_PARTITION_FIRST_YEAR up to next year,
+    so the partition of January exists before the first run of the year
+    """
+
+    today = today or datetime.date.today()
+
+    return range(MYSQL_PARTITION_FIRST_YEAR, today.year + 2)
+
+
+def partition_ranges(years: typing.Iterable[int]) -> List[Tuple[str, Optional[str], str]]:
+    """
+    (name, lower bound, VALUES LESS THAN) of each partition, the last one (pmax) catches any later date
+    """
+
+    ranges, lower = [], None
+    for year in years:
+        upper = f"'{year + 1}-01-01'"
+        ranges.append((f"p{year}", lower, upper))
+        lower = upper
+
+    ranges.append(("pmax", lower, "MAXVALUE"))
+
+    return ranges
+
+
+def partition_clause(ranges: List[Tuple[str, Optional[str], str]]) -> str:
+    return ", ".join(f"PARTITION {name} VALUES LESS THAN ({upper})" for name, _, upper in ranges)
+
+
+def create_table_sql(table: str, name: Optional[str] = None, years: Optional[range] = None) -> str:
+    """
+    CREATE TABLE of a dataset table, derived from its model in schema/dataset.py
+
+    The primary key is the model's natural_key, which starts with the column the API
+    filters on (StockID or FuturesID) followed by Date: InnoDB clusters rows on it, so
+    `WHERE StockID = %s AND Date BETWEEN ...` reads one contiguous range and gets every
+    column from it. Dated tables also get a Date index for the date-at-a-time writes
+    and are RANGE partitioned by year, so ranges only open the years they cover.
+
+    Args:
+        table: Dataset table, a key of DATASET_SCHEMAS
+        name: Name of the created table, defaults to `table`
+        years: Years with their own partition, defaults to partition_years()
+    """
+
+    definitions = [
+        f"`{column}` {sql_type}{'' if nullable else ' NOT NULL'}"
+        for column, (sql_type, nullable) in table_columns(table).items()
+    ]
+    definitions.append(f"PRIMARY KEY ({', '.join(f'`{col}`' for col in DATASET_SCHEMAS[table].natural_key)})")
+
+    sql = f"CREATE TABLE IF NOT EXISTS {name or table} ({', '.join(definitions)}"
+
+    if not is_dated(table):
+        return sql + ") ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+
+    sql += ", KEY `idx_date` (`Date`)) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"
+    ranges = partition_ranges(years if years is not None else partition_years())
+
+    return sql + f" PARTITION BY RANGE COLUMNS(`Date`) ({partition_clause(ranges)})"
+
+
+def table_state(cursor, table: str) -> Optional[dict]:
+    """
+    Columns, primary key, indexes and partitions of an existing table, None if it does not exist
+    """
+
+    cursor.execute(
+        "SELECT COLUMN_NAME AS `name`, COLUMN_TYPE AS `type`, IS_NULLABLE AS `nullable` "
+        "FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+        "ORDER BY ORDINAL_POSITION",
+        (table,),
+    )
+    columns = {row["name"]: (row["type"].upper(), row["nullable"] == "YES") for row in cursor.fetchall()}
+    if not columns:
+        return None
+
+    cursor.execute(
+        "SELECT INDEX_NAME AS `name`, COLUMN_NAME AS `column` FROM information_schema.STATISTICS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s ORDER BY INDEX_NAME, SEQ_IN_INDEX",
+        (table,),
+    )
+    indexes = {}
+    for row in cursor.fetchall():
+        indexes.setdefault(row["name"], []).append(row["column"])
+
+    cursor.execute(
+        "SELECT PARTITION_NAME AS `name`, PARTITION_METHOD AS `method`, PARTITION_EXPRESSION AS `expression` "
+        "FROM information_schema.PARTITIONS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s "
+        "ORDER BY PARTITION_ORDINAL_POSITION",
+        (table,),
+    )
+    partitions = [row for row in cursor.fetchall() if row["name"]]
+
+    return {
+        "columns": columns,
+        "primary_key": tuple(indexes.pop("PRIMARY", ())),
+        "indexes": indexes,
+        "partitioned_by": (partitions[0]["method"], partitions[0]["expression"].strip("`")) if partitions else None,
+        "partitions": [row["name"] for row in partitions],
+    }
+
+
+def rebuild_reasons(table: str, state: dict) -> List[str]:
+    """
+    Differences from the model definition that need the table to be copied into a new one
+    """
+
+    reasons = []
+
+    expected = table_columns(table)
+    for column, definition in expected.items():
+        current = state["columns"].get(column)
+        if current is not None and current != definition:
+            reasons.append(f"{column} is {current}, expected {definition}")
+
+    if state["primary_key"] != DATASET_SCHEMAS[table].natural_key:
+        reasons.append(f"primary key {state['primary_key']}, expected {DATASET_SCHEMAS[table].natural_key}")
+
+    partitioned_by = ("RANGE COLUMNS", "Date") if is_dated(table) else None
+    if state["partitioned_by"] != partitioned_by:
+        reasons.append(f"partitioned by {state['partitioned_by']}, expected {partitioned_by}")
+
+    return reasons
+
+
+def rebuild_statements(table: str, state: dict, years: range) -> List[str]:
+    """
+    Copy a table into a new one with the model definition, then swap them in one RENAME
+
+    Rows are copied one partition range at a time, each statement is committed on
+    its own. Rows repeating a key (possible without a primary key) keep the last copy,
+    like the upserts do, and strict mode still rejects values that do not fit.
+    """
+
+    rebuilt, backup = f"{table}{REBUILD_SUFFIX}", f"{table}{BACKUP_SUFFIX}"
+    columns = [col for col in table_columns(table) if col in state["columns"]]
+    colnames = ", ".join(f"`{col}`" for col in columns)
+    updates = ", ".join(f"`{col}` = VALUES(`{col}`)" for col in columns)
+
+    statements = [f"DROP TABLE IF EXISTS {rebuilt}", create_table_sql(table, rebuilt, years)]
+
+    if is_dated(table) and "Date" in state["columns"]:
+        ranges = partition_ranges(years)
+    else:
+        ranges = [(None, None, "MAXVALUE")]
+
+    for _, lower, upper in ranges:
+        bounds = [f"`Date` >= {lower}" if lower else "", f"`Date` < {upper}" if upper != "MAXVALUE" else ""]
+        where = " AND ".join(bound for bound in bounds if bound)
+        statements.append(
+            f"INSERT INTO {rebuilt} ({colnames}) SELECT {colnames} FROM {table}"
+            f"{f' WHERE {where}' if where else ''} ON DUPLICATE KEY UPDATE {updates}"
+        )
+
+    statements += [
+        f"DROP TABLE IF EXISTS {backup}",
+        f"RENAME TABLE {table} TO {backup}, {rebuilt} TO {table}",
+    ]
+
+    return statements
+
+
+def plan(cursor, table: str, years: Optional[range] = None, rebuild: bool = False) -> List[str]:
+    """
+    Statements bringing a table to the definition of its model, empty when it already matches
+
+    - missing table: CREATE TABLE
+    - different column types, primary key or partitioning: rebuild (rebuild_statements), only with `rebuild`
+    - missing columns or Date index: ALTER TABLE ... ADD
+    - years without a partition yet: REORGANIZE PARTITION pmax, which only holds future dates
+
+    Raises:
+        RuntimeError: The table needs a rebuild and `rebuild` is not set
+    """
+
+    years = years if years is not None else partition_years()
+    state = table_state(cursor, table)
+
+    if state is None:
+        return [create_table_sql(table, years=years)]
+
+    reasons = rebuild_reasons(table, state)
+    if reasons:
+        # A rebuild copies the whole table and loses rows written during the copy, never run it unattended
+        if not rebuild:
+            raise RuntimeError(f"{table} needs a rebuild ({'; '.join(reasons)}), run migrate --rebuild with the crawls stopped")
+
+        logger.info(f"{table} needs a rebuild: {'; '.join(reasons)}")
+        return rebuild_statements(table, state, years)
+
+    statements = []
+
+    additions = [
+        f"ADD COLUMN `{column}` {sql_type}{'' if nullable else ' NOT NULL'}"
+        for column, (sql_type, nullable) in table_columns(table).items()
+        if column not in state["columns"]
+    ]
+    if is_dated(table) and ["Date"] not in state["indexes"].values():
+        additions.append("ADD KEY `idx_date` (`Date`)")
+    if additions:
+        statements.append(f"ALTER TABLE {table} {', '.join(additions)}")
+
+    if is_dated(table):
+        existing = [int(match.group(1)) for match in map(PARTITION_NAME.match, state["partitions"]) if match]
+        missing = [year for year in years if not existing or year > max(existing)]
+
+        if missing and "pmax" in state["partitions"]:
+            ranges = partition_ranges(missing)
+            statements.append(f"ALTER TABLE {table} REORGANIZE PARTITION pmax INTO ({partition_clause(ranges)})")
+
+    return statements
+
+
+def migrate(
+    mysql_conn,
+    tables: Optional[typing.Iterable[str]] = None,
+    dry_run: bool = False,
+    rebuild: bool = False,
+) -> bool:
+    """
+    Create or update dataset tables to the definitions derived from their models
+
+    Idempotent: tables already matching their model are left alone, so it can run
+    before every load. Without `rebuild` only additive statements run and a table
+    that needs a rebuild fails the migration. A rebuilt table keeps its previous
+    version as <table>__before_migrate.
+
+    Args:
+        mysql_conn: Database connection
+        tables: Tables to migrate, defaults to every dataset table
+        dry_run: Only log the statements
+        rebuild: Allow copying tables whose types, primary key or partitioning changed
+
+    Returns:
+        bool: Whether every statement succeeded
+    """
+
+    years = partition_years()
+
+    for table in tables or DATASET_SCHEMAS:
+        if table not in DATASET_SCHEMAS:
+            logger.error(f"Unknown table {table}, expected one of {list(DATASET_SCHEMAS)}")
+            return False
+
+        try:
+            with mysql_conn.cursor() as cursor:
+                statements = plan(cursor, table, years, rebuild)
+
+                if not statements:
+                    logger.info(f"{table} is up to date")
+
+                for sql in statements:
+                    logger.info(f"{table}: {sql}")
+                    if dry_run:
+                        continue
+
+                    cursor.execute(sql)
+                    mysql_conn.commit()
+                    metrics.inc("ddl_statements_total", table=table)
+
+        except Exception as e:
+            logger.error(f"Migrating {table} failed: {e}")
+            mysql_conn.rollback()
+            return False
+
+    return True
@@ -0,0 +1,161 @@
+import hashlib
+import typing
+from typing import List, Set
+
+import pandas as pd
+from loguru import logger
+
+
+# Markets each dataset is loaded from, a date is complete once every market is in the manifest
+DATASET_MARKETS = {
+    "taiwan_stock_price": ("twse", "tpex"),
+    "taiwan_institutional_investor": ("twse", "tpex"),
+    "taiwan_margin_short_sale": ("twse", "tpex"),
+    "taiwan_future_daily": ("taifex",),
+    "taiwan_share_holding": ("tdcc",),
+}
+
+
+def content_hash(df: pd.DataFrame) -> str:
+    """
+    sha256 of the values of a DataFrame, independent of its index
+    """
+
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+
+
+def create_manifest_table(mysql_conn):
+    """
+    Create the ingest_manifest table if missing
+    """
+
+    with mysql_conn.cursor() as cursor:
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_manifest ("
+            "`TableName` VARCHAR(64) NOT NULL, "
+            "`Market` VARCHAR(16) NOT NULL, "
+            "`Date` DATE NOT NULL, "
+            "`RowCount` INT NOT NULL, "
+            "`ContentHash` CHAR(64) NOT NULL, "
+            "`LoadedAt` DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+            "PRIMARY KEY (`TableName`, `Date`, `Market`))"
+        )
+    mysql_conn.commit()
+
+
+def record(table: str, market: str, date: str, row_count: int, digest: str, mysql_conn):
+    """
+    Record that row_count rows, hashing to digest, of a (table, market, date) were loaded
+    """
+
+    return record_many([(table, market, date, row_count, digest)], mysql_conn)
+
+
+def record_many(entries: typing.List[typing.Tuple[str, str, str, int, str]], mysql_conn):
+    """
+    Record several loads at once, each entry a (table, market, date, row_count, digest), in one commit
+    """
+
+    try:
+        with mysql_conn.cursor() as cursor:
+            cursor.executemany(
+                "INSERT INTO ingest_manifest (`TableName`, `Market`, `Date`, `RowCount`, `ContentHash`) "
+                "VALUES (%s, %s, %s, %s, %s) "
+                "ON DUPLICATE KEY UPDATE `RowCount` = VALUES(`RowCount`), "
+                "`ContentHash` = VALUES(`ContentHash`), `LoadedAt` = CURRENT_TIMESTAMP",
+                entries,
+            )
+        mysql_conn.commit()
+
+        return True
+
+    except Exception as e:
+
+        logger.error(f"Manifest update error: {type(e).__name__}: {e}")
+        mysql_conn.rollback()
+
+        return False
+
+
+def record_load(table: str, market: str, date: str, df: pd.DataFrame, mysql_conn):
+    """
+    Record that the rows of a (table, market, date) were loaded
+    """
+
+    return record(table, market, date, len(df), content_hash(df), mysql_conn)
+
+
+def combined_hash(digests: typing.Iterable[str]) -> str:
+    """
+    sha256 over the content hashes of the chunks of one load, in order
+    """
+
+    return hashlib.sha256("".join(digests).encode()).hexdigest()
+
+
+def loaded_markets(table: str, date: str, mysql_conn) -> Set[str]:
+    """
+    Markets of a (table, date) already loaded
+    """
+
+    with mysql_conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT `Market` FROM ingest_manifest WHERE `TableName` = %s AND `Date` = %s",
+            (table, date),
+        )
+        rows = cursor.fetchall()
+
+    return {row["Market"] for row in rows}
+
+
+def loaded_dates(table: str, start_date: str, end_date: str, mysql_conn) -> Set[str]:
+    """
+    Dates between start_date and end_date for which every market of the table was loaded
+    """
+
+    markets = DATASET_MARKETS.get(table, ())
+
+    with mysql_conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT `Date` FROM ingest_manifest "
+            "WHERE `TableName` = %s AND `Date` BETWEEN %s AND %s "
+            "GROUP BY `Date` HAVING COUNT(DISTINCT `Market`) >= %s",
+            (table, start_date, end_date, len(markets)),
+        )
+        rows = cursor.fetchall()
+
+    return {str(row["Date"]) for row in rows}
+
+
+def missing_dates(expected: List[str], loaded: Set[str]) -> List[str]:
+    """
+    Expected dates (sorted) that were not loaded
+    """
+
+    missing = set(expected) - loaded
+
+    return [date for date in expected if date in missing]
+
+
+def date_ranges(expected: List[str], missing: List[str]) -> List[typing.Tuple[str, str]]:
+    """
+    Group missing dates into runs of consecutive expected dates
+
+    Args:
+        expected: All expected dates, sorted
+        missing: Missing dates, a sorted subset of expected
+
+    Returns:
+        list of (first date, last date)
+    """
+
+    position = {date: i for i, date in enumerate(expected)}
+    ranges = []
+
+    for date in missing:
+        if ranges and position[date] == position[ranges[-1][1]] + 1:
+            ranges[-1] = (ranges[-1][0], date)
+        else:
+            ranges.append((date, date))
+
+    return ranges
@@ -1,105 +1,252 @@
+import contextlib
+import functools
+import threading
 import time
 import typing
 from loguru import logger
 import pymysql
 
 from pymysql.connections import Connection
-from .clients import get_mysql_stockdata_conn
+from .clients import DEFAULT_TARGET, get_mysql_conn, mysql_routes, mysql_targets
+from stockdata.config import (
+    MYSQL_POOL_SIZE,
+    MYSQL_POOL_TIMEOUT,
+    MYSQL_POOL_IDLE_PING,
+    MYSQL_RECONNECT_RETRIES,
+    MYSQL_RECONNECT_BACKOFF,
+    MYSQL_RECONNECT_BACKOFF_MAX,
+)
+from stockdata.metrics import metrics
 
 
-def check_alive(connect: Connection) -> None:
+def check_alive(connect: Connection) -> bool:
     """
-    Check if the connection is alive
-    
+    Check if the connection is alive, with a COM_PING instead of a query
+
     Args:
         connect: PyMySQL object
     """
-    with connect.cursor() as cursor:
-        cursor.execute("SELECT 1 + 1")
+    try:
+        connect.ping(reconnect=False)
+        return True
+
+    except Exception as e:
+        logger.info(f"MySQL connection lost: {e}")
+        return False
 
-def reconnect(connect_func: typing.Callable[[], Connection]) -> Connection:
+
+def connect_with_backoff(connect_func: typing.Callable[[], Connection], pool: str) -> Connection:
     """
-    Reconnecting
-    
+    Connect, retrying MYSQL_RECONNECT_RETRIES times with exponential backoff
+
     Args:
-        connect_func: get_mysql_stockdata_conn (client) 
-    
+        connect_func: Opens a connection, e.g. get_mysql_stockdata_conn (client)
+        pool: Pool name, used in the log and as the metrics label
+
     Returns:
         Connection: new connection
+
+    Raises:
+        The error of the last attempt once the retries are exhausted
     """
-    try:
-        connect = connect_func()
-        return connect
-    
-    except Exception as e:
-        logger.info(
-            f"{connect_func.__name__} reconnect error {e}"
-        )
-        return None
+    for attempt in range(MYSQL_RECONNECT_RETRIES + 1):
+        try:
+            connect = connect_func()
+            metrics.inc("db_connects_total", pool=pool, result="ok")
+            return connect
+
+        except Exception as e:
+            metrics.inc("db_connects_total", pool=pool, result="failed")
+            if attempt == MYSQL_RECONNECT_RETRIES:
+                raise
+
+            delay = min(MYSQL_RECONNECT_BACKOFF * 2 ** attempt, MYSQL_RECONNECT_BACKOFF_MAX)
+            logger.info(f"{pool} connect error {e}, retry in {delay:.1f}s")
+            time.sleep(delay)
 
-def check_connect_alive(connect: Connection,connect_func: typing.Callable[[], Connection]) -> Connection:
+
+class ConnectionPool:
     """
-    Checking connection status and reconnecting when necessary
-    
-    Args:
-        connect: Current database connection
-        connect_func: get_mysql_stockdata_conn (client)
-    
-    Returns:
-        Connection: Valid database connection
+    A few MySQL connections shared by the threads of a run
+
+    Connections are opened on demand up to `size` and handed out one caller at
+    a time. A connection idle for more than `idle_ping` seconds is pinged before
+    it is handed out again, a busy one is trusted: a connection that fails
+    mid-statement is discarded when it comes back, and the next caller gets a new one.
     """
-    
-    if connect:
+
+    def __init__(
+        self,
+        connect_func: typing.Callable[[], Connection],
+        name: str,
+        size: int = MYSQL_POOL_SIZE,
+        timeout: float = MYSQL_POOL_TIMEOUT,
+        idle_ping: float = MYSQL_POOL_IDLE_PING,
+    ):
+        self.connect_func = connect_func
+        self.name = name
+        self.size = size
+        self.timeout = timeout
+        self.idle_ping = idle_ping
+
+        self._cond = threading.Condition()
+        self._idle: typing.List[typing.Tuple[Connection, float]] = []
+        self._open = 0
+
+    def _report(self) -> None:
+        metrics.set("db_pool_connections", self._open, pool=self.name, state="open")
+        metrics.set("db_pool_connections", len(self._idle), pool=self.name, state="idle")
+
+    def acquire(self) -> Connection:
+        """
+        Take a connection, waiting up to `timeout` seconds for one to be released
+
+        Raises:
+            TimeoutError: Every connection stayed in use
+        """
+        started = time.monotonic()
+
+        with self._cond:
+            while not self._idle and self._open >= self.size:
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    metrics.inc("db_pool_timeouts_total", pool=self.name)
+                    raise TimeoutError(f"No {self.name} connection released within {self.timeout}s")
+                self._cond.wait(remaining)
+
+            if self._idle:
+                # Most recently used first, the least likely to need a ping
+                connect, last_used = self._idle.pop()
+            else:
+                connect, last_used = None, None
+                self._open += 1
+            self._report()
+
+        waited = time.monotonic() - started
+        metrics.inc("db_pool_acquires_total", pool=self.name)
+        metrics.inc("db_pool_wait_seconds_total", waited, pool=self.name)
+
         try:
-            check_alive(connect)
+            if connect is not None and time.monotonic() - last_used > self.idle_ping:
+                metrics.inc("db_pool_pings_total", pool=self.name)
+                if not check_alive(connect):
+                    self._close(connect)
+                    connect = None
+                    metrics.inc("db_reconnects_total", pool=self.name)
+
+            if connect is None:
+                connect = connect_with_backoff(self.connect_func, self.name)
+
             return connect
-        
-        except Exception as e:
-            logger.info(f"{connect_func.__name__} connect, error: {e}")
-            
-            try:
-                connect.close()
-            
-            except:
-                pass
-            
-            time.sleep(1)
-            connect = reconnect(connect_func)
-            
-            return check_connect_alive(connect, connect_func)
-    else:
-        connect = reconnect(connect_func)
-        
-        return check_connect_alive(connect, connect_func)
+
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self._report()
+                self._cond.notify()
+            raise
+
+    def release(self, connect: Connection, broken: bool = False) -> None:
+        """
+        Give a connection back, closing it instead when it is broken
+        """
+        if broken:
+            self._close(connect)
+
+        with self._cond:
+            if broken:
+                self._open -= 1
+            else:
+                self._idle.append((connect, time.monotonic()))
+            self._report()
+            self._cond.notify()
+
+    @contextlib.contextmanager
+    def connection(self) -> typing.Iterator[Connection]:
+        """
+        Hold a connection for the duration of a with block
+
+        What the block left uncommitted is rolled back before the connection goes
+        back to the pool, so the next borrower starts a fresh transaction: a
+        read-only block would otherwise keep its REPEATABLE READ snapshot (stale
+        manifest reads) and its metadata locks (queueing DDL). The connection is
+        discarded when the error came from the connection itself or the rollback fails.
+        """
+        connect = self.acquire()
+        broken = False
+
+        try:
+            yield connect
+
+        except BaseException as e:
+            broken = isinstance(e, (pymysql.err.OperationalError, pymysql.err.InterfaceError))
+            raise
+
+        finally:
+            if not broken:
+                try:
+                    connect.rollback()
+                except Exception:
+                    broken = True
+            self.release(connect, broken)
+
+    @staticmethod
+    def _close(connect: Connection) -> None:
+        try:
+            connect.close()
+
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        """
+        Close the idle connections
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._report()
+
+        for connect, _ in idle:
+            self._close(connect)
+
 
 class Router:
     def __init__(self):
         """
-        Initialize Router
+        Initialize Router: one pool per MySQL target, opened once a table routed to it is used
         """
-        
-        self._mysql_stockdata_conn = (get_mysql_stockdata_conn())
-    
-    def check_mysql_stockdata_conn_alive(self) -> Connection:
+
+        self.routes = mysql_routes()
+        self._pools = {
+            target: ConnectionPool(functools.partial(get_mysql_conn, target), target)
+            for target in mysql_targets()
+        }
+
+    def target(self, table: typing.Optional[str] = None) -> str:
         """
-        Check connection status
+        Target a table is routed to (MYSQL_ROUTES), "stockdata" when not routed
         """
 
-        self._mysql_stockdata_conn = check_connect_alive(self._mysql_stockdata_conn, get_mysql_stockdata_conn)
-        
-        return self._mysql_stockdata_conn
-    
-    @property # Convert method to attribute
-    def mysql_stockdata_conn(self) -> Connection:
+        return self.routes.get(table, DEFAULT_TARGET)
+
+    def connection(self, table: typing.Optional[str] = None) -> typing.ContextManager[Connection]:
         """
-        Use a property to ensure that every time a connection is accessed, 
-        it first goes through a "check alive" process to verify if the connection is active.
+        Hold a connection to the target of a table for a with block, each thread should take its own:
+
+            with router.connection("taiwan_stock_price") as conn:
+                update2mysql_by_sql(df, "taiwan_stock_price", conn)
+
+        Work that spans several statements on connection state (temporary staging
+        tables, an open transaction) must stay inside one block. The ingest manifest
+        of a table lives on the table's target, so the same connection records its loads.
         """
 
-        return self.check_mysql_stockdata_conn_alive()
-    
+        return self._pools[self.target(table)].connection()
+
     def close_connection(self):
         """
-        Close connection
+        Close connections
         """
-        self._mysql_stockdata_conn.close()
\ No newline at end of file
+        for pool in self._pools.values():
+            pool.close()
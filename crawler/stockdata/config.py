@@ -5,3 +5,92 @@ MYSQL_DATA_USER = os.environ.get("MYSQL_DATA_USER", "root")
 MYSQL_DATA_PASSWORD = os.environ.get("MYSQL_DATA_PASSWORD", "test")
 MYSQL_DATA_PORT = int(os.environ.get("MYSQL_DATA_PORT", "3307"))
 MYSQL_DATA_DATABASE = os.environ.get("MYSQL_DATA_DATABASE", "stockdata")
+
+# Extra MySQL targets and the tables routed to them, as JSON (the API reads the same two settings):
+# MYSQL_TARGETS='{"holding": {"host": "mysql-holding", "port": 3306}}', fields left out default to MYSQL_DATA_*
+# MYSQL_ROUTES='{"taiwan_share_holding": "holding"}', other tables stay on the "stockdata" target
+MYSQL_TARGETS = os.environ.get("MYSQL_TARGETS", "{}")
+MYSQL_ROUTES = os.environ.get("MYSQL_ROUTES", "{}")
+
+# Tables written with LOAD DATA LOCAL INFILE through a staging table instead of INSERT executemany,
+# comma separated or "*" for every table (the MySQL server needs local_infile=ON)
+MYSQL_BULK_LOAD_TABLES = os.environ.get("MYSQL_BULK_LOAD_TABLES", "")
+
+# Rows per upsert statement, each chunk is committed on its own
+MYSQL_WRITE_CHUNK_ROWS = int(os.environ.get("MYSQL_WRITE_CHUNK_ROWS", "5000"))
+
+# Tables whose dated loads are staged and published one date at a time (every market at once),
+# comma separated, "*" for every table or empty to write each market straight into the table
+MYSQL_PUBLISH_TABLES = os.environ.get("MYSQL_PUBLISH_TABLES", "*")
+
+# Backfills buffer the loads of many dates of a table and write them at once, once this many rows
+# are buffered or the oldest buffered date is this many seconds old (checked as dates come in)
+MYSQL_BATCH_ROWS = int(os.environ.get("MYSQL_BATCH_ROWS", "50000"))
+MYSQL_BATCH_SECONDS = float(os.environ.get("MYSQL_BATCH_SECONDS", "60"))
+
+# Connection pool of the Router: connections kept open, seconds a caller waits for one,
+# and idle seconds after which a connection is pinged before it is handed out again
+MYSQL_POOL_SIZE = int(os.environ.get("MYSQL_POOL_SIZE", "4"))
+MYSQL_POOL_TIMEOUT = float(os.environ.get("MYSQL_POOL_TIMEOUT", "60"))
+MYSQL_POOL_IDLE_PING = float(os.environ.get("MYSQL_POOL_IDLE_PING", "30"))
+
+# Reconnect attempts after a failed connect, waiting MYSQL_RECONNECT_BACKOFF seconds doubled per attempt (at most the max)
+MYSQL_RECONNECT_RETRIES = int(os.environ.get("MYSQL_RECONNECT_RETRIES", "5"))
+MYSQL_RECONNECT_BACKOFF = float(os.environ.get("MYSQL_RECONNECT_BACKOFF", "0.5"))
+MYSQL_RECONNECT_BACKOFF_MAX = float(os.environ.get("MYSQL_RECONNECT_BACKOFF_MAX", "30"))
+
+# Dated tables are partitioned by year on Date, the first partition also holds every earlier year
+MYSQL_PARTITION_FIRST_YEAR = int(os.environ.get("MYSQL_PARTITION_FIRST_YEAR", "2004"))
+
+# Local state shared between crawler runs (mount one volume to share it between containers)
+CRAWLER_STATE_DIR = os.environ.get("CRAWLER_STATE_DIR", os.path.join(os.path.expanduser("~"), ".stockdata"))
+
+# Crawler HTTP settings
+CRAWLER_CONCURRENCY = int(os.environ.get("CRAWLER_CONCURRENCY", "4"))
+CRAWLER_HOST_CONCURRENCY = int(os.environ.get("CRAWLER_HOST_CONCURRENCY", "1"))
+CRAWLER_POOL_SIZE = int(os.environ.get("CRAWLER_POOL_SIZE", "10"))
+CRAWLER_TIMEOUT = float(os.environ.get("CRAWLER_TIMEOUT", "30"))
+
+# Date range pipeline: workers of the transform (validation) and write stages, the fetch stage
+# uses CRAWLER_CONCURRENCY, and results each stage may queue up before the next one takes them
+CRAWLER_TRANSFORM_WORKERS = int(os.environ.get("CRAWLER_TRANSFORM_WORKERS", "1"))
+CRAWLER_WRITE_WORKERS = int(os.environ.get("CRAWLER_WRITE_WORKERS", "1"))
+CRAWLER_QUEUE_SIZE = int(os.environ.get("CRAWLER_QUEUE_SIZE", "2"))
+
+# Per-host token bucket, default one request every 5 seconds per host
+# Override single hosts with "host=rate:burst,host=rate:burst"
+CRAWLER_RATE = float(os.environ.get("CRAWLER_RATE", "0.2"))
+CRAWLER_BURST = float(os.environ.get("CRAWLER_BURST", "1"))
+CRAWLER_RATE_LIMITS = os.environ.get("CRAWLER_RATE_LIMITS", "")
+
+# Where buckets live: "local" (this process only), "sqlite", "sqlite:///path" or "redis://host:port/db"
+CRAWLER_RATE_BACKEND = os.environ.get("CRAWLER_RATE_BACKEND", "sqlite")
+
+# Adaptive pacing, learns each host's rate starting from the rates above
+CRAWLER_PACING = os.environ.get("CRAWLER_PACING", "1") == "1"
+CRAWLER_PACING_MIN_RATE = float(os.environ.get("CRAWLER_PACING_MIN_RATE", "0.05"))
+CRAWLER_PACING_MAX_RATE = float(os.environ.get("CRAWLER_PACING_MAX_RATE", "2"))
+CRAWLER_PACING_STEP = float(os.environ.get("CRAWLER_PACING_STEP", "0.01"))
+CRAWLER_PACING_BACKOFF = float(os.environ.get("CRAWLER_PACING_BACKOFF", "0.5"))
+CRAWLER_RETRIES = int(os.environ.get("CRAWLER_RETRIES", "2"))
+
+# Raw response archive, used by the "reparse" task to rebuild tables without network access
+CRAWLER_ARCHIVE = os.environ.get("CRAWLER_ARCHIVE", "1") == "1"
+CRAWLER_ARCHIVE_DIR = os.environ.get("CRAWLER_ARCHIVE_DIR", os.path.join(CRAWLER_STATE_DIR, "archive"))
+CRAWLER_REPARSE_WORKERS = int(os.environ.get("CRAWLER_REPARSE_WORKERS", str(os.cpu_count() or 1)))
+
+# Trading calendar: extra holidays / sessions (comma separated 'YYYY-MM-DD') and
+# the day Saturday sessions ended, Saturdays before it are still crawled
+TRADING_CALENDAR_HOLIDAYS = os.environ.get("TRADING_CALENDAR_HOLIDAYS", "")
+TRADING_CALENDAR_SESSIONS = os.environ.get("TRADING_CALENDAR_SESSIONS", "")
+TRADING_SATURDAY_UNTIL = os.environ.get("TRADING_SATURDAY_UNTIL", "2007-01-01")
+
+# Rows failing schema validation are dropped, and also written as CSV under this directory when set
+QUARANTINE_DIR = os.environ.get("QUARANTINE_DIR", "")
+
+# Delistings of a market are not applied when they are more than this share of its stored stocks
+# (a truncated ISIN page looks like a mass delisting), nor when rows of its page were quarantined
+STOCK_INFO_MAX_REMOVED_SHARE = float(os.environ.get("STOCK_INFO_MAX_REMOVED_SHARE", "0.02"))
+
+# Rows per chunk when streaming the TDCC share holding CSV into MySQL
+TDCC_CHUNK_ROWS = int(os.environ.get("TDCC_CHUNK_ROWS", "50000"))
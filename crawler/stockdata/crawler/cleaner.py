@@ -0,0 +1,132 @@
+import typing
+
+import numpy as np
+import pandas as pd
+
+from stockdata.metrics import metrics
+
+
+# Characters dropped from exchange numbers: thousands separators, "+" signs,
+# the "X" no-price-limit marker and whitespace (incl. the non-breaking space of HTML tables)
+NOISE = str.maketrans("", "", ",+X \t\r\n\xa0\u3000")
+
+# Placeholders the exchanges print instead of a number (no trade, ex-rights / ex-dividend day), read as 0
+PLACEHOLDERS = {"", "-", "--", "---", "----", "除權息", "除息", "除權"}
+
+
+def parse_column(values: typing.Iterable, dtype: str = "float64") -> np.ndarray:
+    """
+    Parse raw exchange numbers (any iterable, e.g. one column of a JSON table) into a typed array
+
+    The column is parsed whole. Almost every column only carries thousands
+    separators: they are removed and the column cast in one go. Otherwise
+    pd.to_numeric parses it, and the strings it rejects get the noise
+    characters stripped with str.translate and placeholders masked as 0.
+    Values that are neither numbers nor known placeholders become NaN, an int
+    column holding one is returned as float64 so check_schema can quarantine the row.
+    """
+
+    if not isinstance(values, np.ndarray):
+        values = list(values)
+    cells = np.empty(len(values), dtype=object)
+    cells[:] = values
+    raw = pd.Series(cells, copy=False)
+
+    # Strings lose their separators, other cells (numbers, None) are left to pd.to_numeric
+    try:
+        text = raw.str.replace(",", "", regex=False)
+    except AttributeError:
+        # Not a single string, e.g. numbers read from a CSV
+        text = pd.Series(None, index=raw.index, dtype=object)
+
+    strings = text.notna().to_numpy()
+    if strings.all():
+        try:
+            # int() and float() already accept surrounding whitespace and a leading "+"
+            numbers = text.to_numpy().astype(dtype)
+            if numbers.dtype.kind != "f" or not np.isnan(numbers).any():
+                return numbers
+        except (ValueError, TypeError, OverflowError):
+            pass
+
+    numbers = pd.to_numeric(text.where(strings, raw), errors="coerce").to_numpy()
+
+    # Only the strings pd.to_numeric rejected are looked at again: noise stripped, placeholders read as 0
+    retry = strings & np.isnan(numbers) if numbers.dtype.kind == "f" else np.zeros(len(numbers), dtype=bool)
+    if retry.any():
+        stripped = text[retry].str.translate(NOISE)
+        stripped = stripped.mask(stripped.isin(PLACEHOLDERS), "0")
+
+        numbers = numbers.copy()
+        numbers[retry] = pd.to_numeric(stripped, errors="coerce").to_numpy(dtype="float64")
+
+    invalid = np.isnan(numbers) if numbers.dtype.kind == "f" else np.zeros(len(numbers), dtype=bool)
+
+    if np.dtype(dtype).kind in "iu" and numbers.dtype.kind == "f":
+        # Ints written as floats, e.g. "1,000.00", keep their integer part
+        invalid |= np.isinf(numbers)
+        numbers = np.trunc(numbers)
+
+    if invalid.any():
+        metrics.inc("cleaner_invalid_values_total", int(invalid.sum()))
+        return np.where(invalid, np.nan, numbers).astype("float64")
+
+    return numbers.astype(dtype)
+
+
+def to_number(values: pd.Series, dtype: str = "float64") -> pd.Series:
+    """
+    Parse a column of exchange numbers in one pass
+
+    Each cell is parsed once, straight into a typed array. Placeholders such as
+    "--", "----", "除權息" or "" become 0, like the old chained replaces did,
+    anything else that is not a number becomes NaN.
+
+    Args:
+        values: Raw column, strings or numbers
+        dtype: Output dtype, e.g. "int64" or "float64"
+    """
+
+    if values.dtype.kind in "iuf":
+        return values.astype(dtype) if values.notna().all() else values.astype("float64")
+
+    return pd.Series(parse_column(values.to_numpy(), dtype), index=values.index, name=values.name)
+
+
+def clean_numeric(df: pd.DataFrame, columns: typing.Dict[str, str]) -> pd.DataFrame:
+    """
+    Parse several numeric columns in place
+
+    Args:
+        df: DataFrame owning the columns
+        columns: {column: dtype}
+    """
+
+    for col, dtype in columns.items():
+        # Columns decode.frame already parsed are left as they are
+        if df[col].dtype != dtype:
+            df[col] = to_number(df[col], dtype)
+
+    return df
+
+
+def _is_minus(cell: typing.Any) -> bool:
+    if not isinstance(cell, str):
+        return False
+
+    text = cell.partition(">")[2].partition("<")[0] if ">" in cell else cell
+
+    return text.strip() == "-"
+
+
+def apply_sign(sign: pd.Series, values: pd.Series) -> pd.Series:
+    """
+    Negate the values whose sign cell is a minus
+
+    TWSE wraps the direction of a price change in HTML, e.g. <p style= color:green>-</p>,
+    plain "-" cells are handled the same way.
+    """
+
+    negative = np.array([_is_minus(cell) for cell in sign.to_numpy()], dtype=bool)
+
+    return values.where(~negative, -values)
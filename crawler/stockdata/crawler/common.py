@@ -0,0 +1,86 @@
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Type
+
+import pandas as pd
+from stockdata.schema.dataset import check_schema
+
+
+def crawl_and_check(crawl: typing.Callable[[str], pd.DataFrame], date: str, schema: Type, name: str) -> pd.DataFrame:
+    """
+    Crawl one market and validate it against the schema
+    """
+
+    print(f"Start_crawl_{name}_{date}_data...")
+    df = crawl(date)
+
+    return check_schema(df, schema)
+
+
+def crawl_markets(
+    crawl_twse: typing.Callable[[str], pd.DataFrame],
+    crawl_tpex: typing.Callable[[str], pd.DataFrame],
+    date: str,
+    schema: Type,
+    name: str,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Crawl TWSE and TPEX of a date at the same time
+
+    The two markets live on different hosts, each with its own rate limit, so
+    both downloads run concurrently and the schema validation of the first
+    market to arrive overlaps the download of the other.
+
+    Args:
+        crawl_twse: TWSE crawler taking a 'YYYY-MM-DD' date
+        crawl_tpex: TPEX crawler taking a 'YYYY-MM-DD' date
+        date: Date in format 'YYYY-MM-DD'
+        schema: Pydantic model both markets are validated against
+        name: Dataset name used in progress messages, e.g. "institutional", may be empty
+
+    Returns:
+        Tuple of (df_twse, df_tpex)
+    """
+
+    suffix = f"_{name}" if name else ""
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="market") as executor:
+        twse = executor.submit(crawl_and_check, crawl_twse, date, schema, f"twse{suffix}")
+        tpex = executor.submit(crawl_and_check, crawl_tpex, date, schema, f"tpex{suffix}")
+
+        return twse.result(), tpex.result()
+
+
+def fetch_markets(
+    crawl_twse: typing.Callable[[str], pd.DataFrame],
+    crawl_tpex: typing.Callable[[str], pd.DataFrame],
+    date: str,
+    name: str,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Download and parse TWSE and TPEX of a date at the same time, without validating them
+
+    The network half of crawl_markets, for pipelines that validate in a separate stage.
+    """
+
+    suffix = f"_{name}" if name else ""
+
+    def crawl(crawl_market, market):
+        print(f"Start_crawl_{market}{suffix}_{date}_data...")
+        return crawl_market(date)
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="market") as executor:
+        twse = executor.submit(crawl, crawl_twse, "twse")
+        tpex = executor.submit(crawl, crawl_tpex, "tpex")
+
+        return twse.result(), tpex.result()
+
+
+def check_markets(frames: Tuple[pd.DataFrame, pd.DataFrame], schema: Type) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Validate the (df_twse, df_tpex) of fetch_markets against the schema
+    """
+
+    df_twse, df_tpex = frames
+
+    return check_schema(df_twse, schema), check_schema(df_tpex, schema)
@@ -0,0 +1,96 @@
+import typing
+
+import numpy as np
+import orjson
+import pandas as pd
+import requests
+
+from stockdata.crawler.cleaner import parse_column
+from stockdata.metrics import metrics
+
+
+def payload(response: requests.Response) -> typing.Any:
+    """
+    Decode a JSON response once with orjson, straight from the raw bytes
+
+    Crawlers keep the returned object instead of calling response.json()
+    again, which would decode the text and parse the whole payload each time.
+    """
+
+    data = orjson.loads(response.content)
+    metrics.inc("decode_bytes_total", len(response.content))
+
+    return data
+
+
+def frame(
+    rows: typing.Sequence[typing.Sequence[typing.Any]],
+    columns: typing.Sequence[typing.Any],
+    dtypes: typing.Optional[typing.Dict[typing.Any, str]] = None,
+    names: typing.Optional[typing.Dict[typing.Any, str]] = None,
+) -> pd.DataFrame:
+    """
+    Build a DataFrame from a JSON table (list of rows), each kept column parsed once into its final array
+
+    Args:
+        rows: Table rows, e.g. MI_INDEX data9 or TPEX tables[0].data
+        columns: Labels of the row positions, e.g. the table's fields
+        dtypes: {label: dtype} of numeric columns, parsed straight into
+            int64 / float64 arrays by the shared cleaner, other columns stay strings
+        names: {label: column name} of the columns to keep, in output order.
+            The other fields are never built. Every column under its label by default
+
+    Returns:
+        pd.DataFrame: one column per kept label, rows shorter than `columns`
+        (e.g. footnote rows) are padded with None
+    """
+
+    dtypes = dtypes or {}
+    names = names if names is not None else {label: label for label in columns}
+    if len(rows) == 0:
+        return pd.DataFrame(columns=list(names.values()))
+
+    width = len(columns)
+    short = sum(1 for row in rows if len(row) < width)
+    if short:
+        metrics.inc("decode_ragged_rows_total", short)
+
+    positions = {label: i for i, label in enumerate(columns)}
+
+    def cells(label):
+        i = positions[label]
+        if short:
+            return [row[i] if i < len(row) else None for row in rows]
+        return [row[i] for row in rows]
+
+    # The columns of a dtype are written straight into one 2D block, which
+    # pandas keeps as is, instead of being copied together once the frame is built
+    groups: typing.Dict[str, list] = {}
+    for label in names:
+        groups.setdefault(dtypes.get(label, "object"), []).append(label)
+
+    parts = []
+    for dtype, labels in groups.items():
+        block = np.empty((len(labels), len(rows)), dtype=dtype)
+        filled = []
+        for label in labels:
+            if dtype == "object":
+                block[len(filled)] = cells(label)
+                filled.append(label)
+                continue
+
+            values = parse_column(cells(label), dtype)
+            if values.dtype == block.dtype:
+                block[len(filled)] = values
+                filled.append(label)
+            else:
+                # An int column holding invalid values comes back as float64
+                parts.append(pd.DataFrame({names[label]: values}, copy=False))
+
+        if filled:
+            parts.append(pd.DataFrame(block[:len(filled)].T, columns=[names[label] for label in filled], copy=False))
+
+    df = pd.concat(parts, axis=1, copy=False) if len(parts) > 1 else parts[0]
+    order = list(names.values())
+
+    return df if list(df.columns) == order else df[order]
@@ -1,8 +1,11 @@
 import io
 import typing
 import pandas as pd
-import time
-import requests
+from typing import List, Tuple
+from stockdata import trading_calendar
+from stockdata.fetch import client
+from stockdata.crawler.cleaner import clean_numeric
+from stockdata.fetch.archive import ArchiveMiss
 from stockdata.schema.dataset import check_schema, TaiwanFuturesDaily
 
 def futures_header():
@@ -19,9 +22,9 @@ def futures_header():
         "Referer": "https://www.taifex.com.tw/cht/3/dlFutDailyMarketView",
     }
 
-def crawler_futures(date: str) -> pd.DataFrame:
+def crawler_futures(date: str, end_date: str = None) -> pd.DataFrame:
     """
-    Crawl taifex data
+    Crawl taifex data, from `date` to `end_date` (a single day by default)
     """
 
     url = "https://www.taifex.com.tw/cht/3/futDataDown"
@@ -29,12 +32,11 @@ def crawler_futures(date: str) -> pd.DataFrame:
         "down_type": "1",
         "commodity_id": "all",
         "queryStartDate": date.replace("-", "/"),
-        "queryEndDate": date.replace("-", "/"),
+        "queryEndDate": (end_date or date).replace("-", "/"),
     }
     
-    # To avoid being banned by taifex, sleep for 5 seconds before each request
-    time.sleep(5)
-    resp = requests.post(url, headers=futures_header(), data=form_data)
+    # To avoid being banned by taifex, requests are spaced out per host by the fetch client
+    resp = client.post(url, headers=futures_header(), data=form_data)
     
     if resp.ok and resp.content: # if HTTP 200 and not empty
         
@@ -92,31 +94,115 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
     else:
         df["TradingSession"] = "Position"
     
-    # Convert - to 0
-    for col in ["Open", "Max", "Min", "Close", "Change", "ChangePer", "Volume", "SettlementPrice", "OpenInterest"]:
-        df[col] = df[col].replace("-", "0").astype(float)
-    
-    # Fill NA to 0
+    # Fill NA (empty cells) to 0
     df = df.fillna(0)
     
+    # Convert - to 0, other values that are not numbers become NaN and fail validation
+    df = clean_numeric(df, {
+        col: "float64"
+        for col in ["Open", "Max", "Min", "Close", "Change", "ChangePer", "Volume", "SettlementPrice", "OpenInterest"]
+    })
+    
     return df
 
 
-def future_pipeline(date: str) -> pd.DataFrame:
+def process_data(df: pd.DataFrame, date: str) -> pd.DataFrame:
     """
-    Crawl pipeline
+    Convert one day of raw taifex data to the TaiwanFuturesDaily schema
     """
-    
-    
-    print(f"Start_crawl_taifex_{date}_data...")
-    df = crawler_futures(date)
 
-    df = colname_zh2en(df.copy())
-    df = clean_data(df.copy())
+    df = colname_zh2en(df)
+    df = clean_data(df)
             
     df["Date"] = date
     
     # Check columns type
-    df = check_schema(df.copy(), TaiwanFuturesDaily)
+    df = check_schema(df, TaiwanFuturesDaily)
    
     return df
+
+
+def future_pipeline(date: str) -> pd.DataFrame:
+    """
+    Crawl pipeline
+    """
+    
+    
+    print(f"Start_crawl_taifex_{date}_data...")
+    df = crawler_futures(date)
+
+    return process_data(df, date)
+
+
+def future_fetch(date: str) -> pd.DataFrame:
+    """
+    Fetch stage of future_pipeline: the raw taifex download of a date
+    """
+
+    print(f"Start_crawl_taifex_{date}_data...")
+
+    return crawler_futures(date)
+
+
+def future_transform(date: str, df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Transform stage of future_pipeline: clean and validate what future_fetch returned
+    """
+
+    return process_data(df, date)
+
+
+def month_list(start_date: str, end_date: str) -> List[str]:
+    """
+    List the months ('YYYY-MM') touched by a date range
+    """
+
+    return pd.period_range(start_date, end_date, freq="M").strftime("%Y-%m").tolist()
+
+
+def month_bounds(month: str) -> Tuple[str, str]:
+    """
+    First and last day of a month, the last day capped at today since taifex rejects future dates
+    """
+
+    period = pd.Period(month, freq="M")
+    end = min(period.end_time.date(), trading_calendar.today_taipei())
+
+    return period.start_time.strftime("%Y-%m-%d"), end.strftime("%Y-%m-%d")
+
+
+def future_month_pipeline(month: str) -> List[Tuple[str, pd.DataFrame]]:
+    """
+    Crawl pipeline for a whole month in one download (taifex serves at most one month per request)
+
+    Args:
+        month: 'YYYY-MM'
+
+    Returns:
+        list of (date, DataFrame), one entry per trading day in the download
+    """
+
+    start_date, end_date = month_bounds(month)
+    print(f"Start_crawl_taifex_{start_date}_{end_date}_data...")
+
+    try:
+        df = crawler_futures(start_date, end_date)
+
+    except ArchiveMiss:
+        # Reparsing a month the daily job crawled day by day
+        days = []
+        for date in trading_calendar.get_calendar().trading_days(start_date, end_date):
+            try:
+                days.append((date, future_pipeline(date)))
+            except ArchiveMiss:
+                continue
+        return days
+
+    if df.empty:
+        return []
+
+    # Split the download by trading date, e.g. 2024/01/02
+    return [
+        (trade_date.replace("/", "-"), process_data(df_date, trade_date.replace("/", "-")))
+        for trade_date, df_date in df.groupby("交易日期", sort=True)
+    ]
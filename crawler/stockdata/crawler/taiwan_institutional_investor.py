@@ -1,7 +1,9 @@
 import typing
 import pandas as pd
-import requests
-import time
+from stockdata.fetch import client
+from stockdata.crawler.common import check_markets, crawl_markets, fetch_markets
+from stockdata.crawler import decode
+from stockdata.crawler.cleaner import clean_numeric
 from typing import Tuple
 from stockdata.schema.dataset import check_schema, TaiwanInstitutionalInvestor
 
@@ -37,48 +39,43 @@ def tpex_header():
     }
 
 
-def colname_zh2en(df: pd.DataFrame, colname: typing.List[str]) -> pd.DataFrame:
-    """
-    Convert Chinese column names to English
-    """
-    institutional_investors = {
-        "證券代號": "StockID",
-        "證券名稱": "StockName",
-        "外陸資買進股數(不含外資自營商)": "ForeignBuy",
-        "外陸資賣出股數(不含外資自營商)": "ForeignSell",
-        "外陸資買賣超股數(不含外資自營商)": "ForeignNet",
-        "外資自營商買進股數": "ForeignDealerBuy",
-        "外資自營商賣出股數": "ForeignDealerSell",
-        "外資自營商買賣超股數": "ForeignDealerNet",
-        "投信買進股數": "InvestmentTrustBuy",
-        "投信賣出股數": "InvestmentTrustSell",
-        "投信買賣超股數": "InvestmentTrustNet",
-        "自營商買賣超股數": "DealerNet",
-        "自營商買進股數(自行買賣)": "DealerSelfBuy",
-        "自營商賣出股數(自行買賣)": "DealerSelfSell",
-        "自營商買賣超股數(自行買賣)": "DealerSelfNet",
-        "自營商買進股數(避險)": "DealerHedgeBuy",
-        "自營商賣出股數(避險)": "DealerHedgeSell",
-        "自營商買賣超股數(避險)": "DealerHedgeNet",
-        "三大法人買賣超股數": "ThreeInstitutionNet",
-    }
-    
-    df.columns = [institutional_investors.get(col, col) for col in colname]
-    
-    return df
+# T86 field names in English
+TWSE_COLUMNS = {
+    "證券代號": "StockID",
+    "證券名稱": "StockName",
+    "外陸資買進股數(不含外資自營商)": "ForeignBuy",
+    "外陸資賣出股數(不含外資自營商)": "ForeignSell",
+    "外陸資買賣超股數(不含外資自營商)": "ForeignNet",
+    "外資自營商買進股數": "ForeignDealerBuy",
+    "外資自營商賣出股數": "ForeignDealerSell",
+    "外資自營商買賣超股數": "ForeignDealerNet",
+    "投信買進股數": "InvestmentTrustBuy",
+    "投信賣出股數": "InvestmentTrustSell",
+    "投信買賣超股數": "InvestmentTrustNet",
+    "自營商買賣超股數": "DealerNet",
+    "自營商買進股數(自行買賣)": "DealerSelfBuy",
+    "自營商賣出股數(自行買賣)": "DealerSelfSell",
+    "自營商買賣超股數(自行買賣)": "DealerSelfNet",
+    "自營商買進股數(避險)": "DealerHedgeBuy",
+    "自營商賣出股數(避險)": "DealerHedgeSell",
+    "自營商買賣超股數(避險)": "DealerHedgeNet",
+    "三大法人買賣超股數": "ThreeInstitutionNet",
+}
+
+
+def twse_names(colname: typing.List[str]) -> typing.Dict[str, str]:
+    """
+    English names of the T86 fields kept, keyed by their Chinese names
+    """
+
+    return {col: TWSE_COLUMNS[col] for col in colname if col in TWSE_COLUMNS}
 
 
 def clear_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     Clear data - remove commas and convert to numeric
     """
-    df = df.replace(",", "", regex=True)
-    
-    for col in df.columns:
-        if col not in ["StockID", "StockName", "Date"]:
-            df[col] = pd.to_numeric(df[col], errors="coerce")
-    
-    return df
+    return clean_numeric(df, {col: "int64" for col in df.columns if col not in ["StockID", "StockName", "Date"]})
 
 
 def convert_date_to_roc(date: str) -> str:
@@ -103,13 +100,11 @@ def crawler_twse(date: str) -> pd.DataFrame:
         "response": "json"
     }
     
-    # To avoid being banned by TWSE, sleep for 5 seconds before each request
-    time.sleep(5)
-    
+    # To avoid being banned by TWSE, requests are spaced out per host by the fetch client
     try:
-        res = requests.get(url, params=params, headers=twse_header(), timeout=30)
+        res = client.get(url, params=params, headers=twse_header(), timeout=30)
         res.raise_for_status()
-        data = res.json()
+        data = decode.payload(res)
         
         if data.get("stat") == "很抱歉，沒有符合條件的資料!":
             return pd.DataFrame()
@@ -117,14 +112,13 @@ def crawler_twse(date: str) -> pd.DataFrame:
         if "data" not in data or not data["data"]:
             return pd.DataFrame()
         
-        df = pd.DataFrame(data["data"], columns=data["fields"])
+        # Fields are built under their English names, share counts parsed straight into typed columns
+        df = decode.frame(data["data"], data["fields"], {col: "int64" for col in data["fields"][2:]}, twse_names(data["fields"]))
         
         if len(df) == 0:
             return pd.DataFrame()
         
-        # Convert column names from Chinese to English
-        df = colname_zh2en(df.copy(), data["fields"])
-        df = clear_data(df.copy())
+        df = clear_data(df)
         df["Date"] = date
         
         return df
@@ -134,32 +128,27 @@ def crawler_twse(date: str) -> pd.DataFrame:
         return pd.DataFrame()
 
 
-def set_tpex_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    Set TPEX column names (positions: 0,1,2,3,4,5,6,7,11,12,13,14,15,16,17,18,19,23)
-    """
-    df.columns = [
-        "StockID",
-        "StockName",
-        "ForeignBuy",
-        "ForeignSell",
-        "ForeignNet",
-        "ForeignDealerBuy",
-        "ForeignDealerSell",
-        "ForeignDealerNet",
-        "InvestmentTrustBuy",
-        "InvestmentTrustSell",
-        "InvestmentTrustNet",
-        "DealerSelfBuy",
-        "DealerSelfSell",
-        "DealerSelfNet",
-        "DealerHedgeBuy",
-        "DealerHedgeSell",
-        "DealerHedgeNet",
-        "ThreeInstitutionNet",
-    ]
-    
-    return df
+# Names of the TPEX 3itrade_hedge fields kept, by position, in the order of the T86 table
+TPEX_COLUMNS = {
+    0: "StockID",
+    1: "StockName",
+    2: "ForeignBuy",
+    3: "ForeignSell",
+    4: "ForeignNet",
+    5: "ForeignDealerBuy",
+    6: "ForeignDealerSell",
+    7: "ForeignDealerNet",
+    11: "InvestmentTrustBuy",
+    12: "InvestmentTrustSell",
+    13: "InvestmentTrustNet",
+    14: "DealerSelfBuy",
+    15: "DealerSelfSell",
+    16: "DealerSelfNet",
+    17: "DealerHedgeBuy",
+    18: "DealerHedgeSell",
+    19: "DealerHedgeNet",
+    23: "ThreeInstitutionNet",
+}
 
 
 def crawler_tpex(date: str) -> pd.DataFrame:
@@ -175,13 +164,11 @@ def crawler_tpex(date: str) -> pd.DataFrame:
         "o": "json"
     }
     
-    # To avoid being banned by TPEX, sleep for 5 seconds before each request
-    time.sleep(5)
-    
+    # To avoid being banned by TPEX, requests are spaced out per host by the fetch client
     try:
-        res = requests.get(url, params=params, headers=tpex_header(), timeout=30)
+        res = client.get(url, params=params, headers=tpex_header(), timeout=30)
         res.raise_for_status()
-        data = res.json()
+        data = decode.payload(res)
         
         tables = data.get("tables", [])
         if not tables or len(tables) == 0:
@@ -191,15 +178,10 @@ def crawler_tpex(date: str) -> pd.DataFrame:
         if not table_data:
             return pd.DataFrame()
         
-        df = pd.DataFrame(table_data)
-        
-        # Keep specific columns by position
-        keep_cols = [0, 1, 2, 3, 4, 5, 6, 7, 11, 12, 13, 14, 15, 16, 17, 18, 19, 23]
-        df = df.iloc[:, keep_cols].copy()
-        
-        # Set column names
-        df = set_tpex_columns(df.copy())
-        df = clear_data(df.copy())
+        # Only the kept positions are built
+        dtypes = {position: "int64" for position in list(TPEX_COLUMNS)[2:]}
+        df = decode.frame(table_data, range(len(table_data[0])), dtypes, TPEX_COLUMNS)
+        df = clear_data(df)
         df["Date"] = date
         
         return df
@@ -219,13 +201,18 @@ def institutional_investor_pipeline(date: str) -> Tuple[pd.DataFrame, pd.DataFra
     Returns:
         Tuple of (df_twse, df_tpex)
     """
-    print(f"Start_crawl_twse_institutional_{date}_data...")
-    df_twse = crawler_twse(date)
-    
-    print(f"Start_crawl_tpex_institutional_{date}_data...")
-    df_tpex = crawler_tpex(date)
-    
-    df_twse = check_schema(df_twse.copy(), TaiwanInstitutionalInvestor)
-    df_tpex = check_schema(df_tpex.copy(), TaiwanInstitutionalInvestor)
-    
-    return df_twse, df_tpex
\ No newline at end of file
+    return crawl_markets(crawler_twse, crawler_tpex, date, TaiwanInstitutionalInvestor, "institutional")
+
+
+def institutional_investor_fetch(date: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Fetch stage of institutional_investor_pipeline: TWSE and TPEX parsed, not validated yet
+    """
+    return fetch_markets(crawler_twse, crawler_tpex, date, "institutional")
+
+
+def institutional_investor_transform(date: str, frames: Tuple[pd.DataFrame, pd.DataFrame]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Transform stage of institutional_investor_pipeline: validate what institutional_investor_fetch returned
+    """
+    return check_markets(frames, TaiwanInstitutionalInvestor)
@@ -1,7 +1,9 @@
 import typing
 import pandas as pd
-import requests
-import time
+from stockdata.fetch import client
+from stockdata.crawler.common import check_markets, crawl_markets, fetch_markets
+from stockdata.crawler import decode
+from stockdata.crawler.cleaner import clean_numeric
 from typing import Tuple
 from stockdata.schema.dataset import check_schema, TaiwanMarginPurchaseShortSale
 from typing import Type
@@ -39,18 +41,32 @@ def tpex_header():
     }
 
 
+# Column names of both markets' tables, in order
+COLUMNS = [
+    "StockID",
+    "StockName",
+    "MarginPurchaseBuy",
+    "MarginPurchaseSell",
+    "MarginPurchaseCashRepayment",
+    "MarginPurchaseYesterdayBalance",
+    "MarginPurchaseTodayBalance",
+    "MarginPurchaseLimit",
+    "ShortSaleBuy",
+    "ShortSaleSell",
+    "ShortSaleCashRepayment",
+    "ShortSaleYesterdayBalance",
+    "ShortSaleTodayBalance",
+    "ShortSaleLimit",
+    "OffsetLoanAndShort",
+    "Note",
+]
+
+
 def clear_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     Clear data - remove commas and convert to numeric
     """
-    for col in df.columns:
-        if col not in ["StockID", "StockName", "Note", "Date"]:
-            df[col] = df[col].replace(",", "", regex=True) \
-                             .replace("--", "0") \
-                             .replace("", "0")
-            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
-    
-    return df
+    return clean_numeric(df, {col: "int64" for col in df.columns if col not in ["StockID", "StockName", "Note", "Date"]})
 
 
 def convert_date_to_roc(date: str) -> str:
@@ -75,75 +91,46 @@ def crawler_twse(date: str) -> pd.DataFrame:
         "response": "json"
     }
     
-    # To avoid being banned by TWSE, sleep for 5 seconds before each request
-    time.sleep(5)
-    
-    res = requests.get(url, params=params, headers=twse_header(), timeout=30)
+    # To avoid being banned by TWSE, requests are spaced out per host by the fetch client
+    res = client.get(url, params=params, headers=twse_header(), timeout=30)
     res.raise_for_status()
-    data = res.json()
+    data = decode.payload(res)
     
     if data.get("stat") == "很抱歉，沒有符合條件的資料":
         return pd.DataFrame()
     
     
-    df = pd.DataFrame(data["tables"][1]["data"], columns=data["tables"][1]["fields"])
+    # Field names repeat between the margin and short sale halves, so columns are labelled by position
+    df = decode.frame(data["tables"][1]["data"], range(16), {col: "int64" for col in range(2, 15)}, dict(enumerate(COLUMNS)))
     
     if len(df) == 0:
         return pd.DataFrame()
     
     df["Date"] = date
-
-    df.columns = [
-        "StockID",
-        "StockName",
-        "MarginPurchaseBuy",
-        "MarginPurchaseSell",
-        "MarginPurchaseCashRepayment",
-        "MarginPurchaseYesterdayBalance",
-        "MarginPurchaseTodayBalance",
-        "MarginPurchaseLimit",
-        "ShortSaleBuy",
-        "ShortSaleSell",
-        "ShortSaleCashRepayment",
-        "ShortSaleYesterdayBalance",
-        "ShortSaleTodayBalance",
-        "ShortSaleLimit",
-        "OffsetLoanAndShort",
-        "Note",
-        "Date"
-    ]
-    
-    df = clear_data(df.copy())
+    df = clear_data(df)
     
     return df
 
 
-def set_tpex_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """
-    Set TPEX column names
-    """
-    df = df[[
-        "代號",             
-        "名稱",             
-        "資買",             
-        "資賣",             
-        "現償",             
-        "前資餘額(張)",     
-        "資餘額",           
-        "資限額",           
-        "券買",             
-        "券賣",             
-        "券償",             
-        "前券餘額(張)",     
-        "券餘額",           
-        "券限額",           
-        "資券相抵(張)",   
-        "備註"
-        ]]
-    
-
-    
-    return df
+# TPEX margin fields kept, in the order of the TWSE table
+TPEX_COLUMNS = [
+    "代號",
+    "名稱",
+    "資買",
+    "資賣",
+    "現償",
+    "前資餘額(張)",
+    "資餘額",
+    "資限額",
+    "券買",
+    "券賣",
+    "券償",
+    "前券餘額(張)",
+    "券餘額",
+    "券限額",
+    "資券相抵(張)",
+    "備註",
+]
 
 
 def crawler_tpex(date: str) -> pd.DataFrame:
@@ -159,41 +146,17 @@ def crawler_tpex(date: str) -> pd.DataFrame:
         "t": "D"
     }
     
-    # To avoid being banned by TPEX, sleep for 5 seconds before each request
-    time.sleep(5)
-    
-    res = requests.get(url, params=params, headers=tpex_header(), timeout=30)
+    # To avoid being banned by TPEX, requests are spaced out per host by the fetch client
+    res = client.get(url, params=params, headers=tpex_header(), timeout=30)
     res.raise_for_status()
-    data = res.json()
-     
-    df = pd.DataFrame(data["tables"][0]["data"], columns=data["tables"][0]["fields"])
+    data = decode.payload(res)
     
-    # Set column names
-    df = set_tpex_columns(df.copy())
+    # Only the kept fields are built, under the names of the TWSE table
+    numeric = {col: "int64" for col in TPEX_COLUMNS if col not in ("代號", "名稱", "備註")}
+    df = decode.frame(data["tables"][0]["data"], data["tables"][0]["fields"], numeric, dict(zip(TPEX_COLUMNS, COLUMNS)))
 
     df["Date"] = date
-    
-    df.columns = [
-        "StockID",
-        "StockName",
-        "MarginPurchaseBuy",
-        "MarginPurchaseSell",
-        "MarginPurchaseCashRepayment",
-        "MarginPurchaseYesterdayBalance",
-        "MarginPurchaseTodayBalance",
-        "MarginPurchaseLimit",
-        "ShortSaleBuy",
-        "ShortSaleSell",
-        "ShortSaleCashRepayment",
-        "ShortSaleYesterdayBalance",
-        "ShortSaleTodayBalance",
-        "ShortSaleLimit",
-        "OffsetLoanAndShort",
-        "Note",
-        "Date"
-    ]
-
-    df = clear_data(df.copy())
+    df = clear_data(df)
      
     return df
 
@@ -208,13 +171,18 @@ def margin_short_sale_pipeline(date: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
     Returns:
         Tuple of (df_twse, df_tpex)
     """
-    print(f"Start_crawl_twse_margin_short_{date}_data...")
-    df_twse = crawler_twse(date)
-    
-    print(f"Start_crawl_tpex_margin_short_{date}_data...")
-    df_tpex = crawler_tpex(date)
-    
-    df_twse = check_schema(df_twse.copy(), TaiwanMarginPurchaseShortSale)
-    df_tpex = check_schema(df_tpex.copy(), TaiwanMarginPurchaseShortSale)
-    
-    return df_twse, df_tpex
\ No newline at end of file
+    return crawl_markets(crawler_twse, crawler_tpex, date, TaiwanMarginPurchaseShortSale, "margin_short")
+
+
+def margin_short_sale_fetch(date: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Fetch stage of margin_short_sale_pipeline: TWSE and TPEX parsed, not validated yet
+    """
+    return fetch_markets(crawler_twse, crawler_tpex, date, "margin_short")
+
+
+def margin_short_sale_transform(date: str, frames: Tuple[pd.DataFrame, pd.DataFrame]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Transform stage of margin_short_sale_pipeline: validate what margin_short_sale_fetch returned
+    """
+    return check_markets(frames, TaiwanMarginPurchaseShortSale)
@@ -1,12 +1,22 @@
+import shutil
+import tempfile
 import typing
 import pandas as pd
-import requests
-import time
-from io import StringIO
+from stockdata.fetch import client
+from stockdata.fetch.snapshot import snapshots, conditional_headers, fingerprint
+from stockdata.config import TDCC_CHUNK_ROWS
+from stockdata.metrics import metrics
 from typing import Optional
 from stockdata.schema.dataset import check_schema, TDCCShareholding
 
 
+# Key of the TDCC file in the snapshot store
+SNAPSHOT_SOURCE = "tdcc_shareholding"
+
+# Open data file of the latest shareholding distribution, replaced every week
+TDCC_URL = "https://opendata.tdcc.com.tw/getOD.ashx?id=1-5"
+
+
 def colname_zh2en(df: pd.DataFrame) -> pd.DataFrame:
     """
     Convert Chinese column names to English
@@ -46,43 +56,119 @@ def clean_security_code(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def crawler_tdcc_shareholding() -> pd.DataFrame:
+def peek_data_date(head: bytes, encoding: str) -> Optional[str]:
+    """
+    資料日期 of the first data row, read from the first bytes of the CSV
+    """
+    
+    lines = head.decode(encoding, errors="ignore").splitlines()
+    
+    return lines[1].split(",")[0].strip() if len(lines) > 1 else None
+
+
+def crawler_tdcc_shareholding(chunk_rows: int = TDCC_CHUNK_ROWS) -> typing.Iterator[pd.DataFrame]:
     """
     Crawl TDCC (Taiwan Depository & Clearing Corporation) shareholding distribution data
-    Downloads CSV containing all stocks' shareholding data for the latest period
+    Streams the CSV containing all stocks' shareholding data for the latest period,
+    yielding it `chunk_rows` rows at a time
+
+    TDCC publishes weekly while the task runs daily: a snapshot equal to the
+    last fully loaded one (HTTP 304, or same 資料日期 and payload hash) yields nothing
     """
     
-    url = "https://opendata.tdcc.com.tw/getOD.ashx?id=1-5"
+    url = TDCC_URL
+    source = SNAPSHOT_SOURCE
+    snapshots.discard(source)
+    
+    # Replayed files are parsed whatever was loaded last
+    previous = None if client.replaying() else snapshots.get(source)
     
     headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+        **conditional_headers(previous),
     }
     
-    # TDCC CSV uses Big5 encoding
-    response = requests.get(url, headers=headers, timeout=30)
-    response.raise_for_status()
+    with client.stream("GET", url, headers=headers, timeout=30) as (response, body):
+        if response.status_code == 304:
+            print(f"TDCC share holding not modified since {previous.data_date}, skipped")
+            metrics.inc("snapshot_unchanged_total", source=source, check="http")
+            return
+        
+        response.raise_for_status()
+
+        # Declared charset, else sniffed from the first bytes (UTF-8 or Big5)
+        head = body.peek(4096)
+        encoding = client.sniff_encoding(response, head)
+        data_date = peek_data_date(head, encoding)
+        
+        with tempfile.SpooledTemporaryFile(max_size=1 << 24) as spool:
+            
+            # Same data date as the last load: hash the payload before parsing anything
+            if previous is not None and data_date == previous.data_date:
+                shutil.copyfileobj(body, spool)
+                digest = body.raw.digest.hexdigest()
+                
+                if digest == previous.sha256:
+                    print(f"TDCC share holding of {data_date} unchanged, skipped")
+                    metrics.inc("snapshot_unchanged_total", source=source, check="fingerprint")
+                    snapshots.save(source, fingerprint(response, data_date, digest))
+                    return
+                
+                print(f"TDCC share holding of {data_date} was republished with different content")
+                metrics.inc("snapshot_revised_total", source=source)
+                spool.seek(0)
+                body = spool
+            
+            # Parse CSV data one chunk at a time, security codes stay text
+            yield from pd.read_csv(body, chunksize=chunk_rows, encoding=encoding, dtype={"證券代號": str})
+            
+            # Reached once every chunk was consumed, saved by confirm_loaded() once the loader published it
+            if not client.replaying():
+                digest = digest if body is spool else body.raw.digest.hexdigest()
+                snapshots.hold(source, fingerprint(response, data_date, digest))
+
+
+def confirm_loaded() -> None:
+    """
+    Save the fingerprint of the TDCC file just read, called by the loader once it is published and recorded
+
+    A load that failed leaves the previous fingerprint, so the next run downloads and loads the file again.
+    """
+    
+    snapshots.commit(SNAPSHOT_SOURCE)
+
+
+def archived_snapshots() -> typing.List[str]:
+    """
+    Fetch times of the distinct TDCC files in the archive, oldest first
+
+    Reparse replays each of them (client.set_replay(True, as_of)), the
+    archive only answers a request with the latest file otherwise.
+    """
     
-    # Parse CSV data
-    df = pd.read_csv(StringIO(response.text))
+    # A file downloaded again without a change is replayed once
+    fetched = {}
+    for entry in client.archived("GET", TDCC_URL):
+        fetched[entry["sha256"]] = entry["fetched_at"]
     
-    return df
+    return sorted(fetched.values())
 
 
-def share_holding_pipeline() -> pd.DataFrame:
+def share_holding_pipeline() -> typing.Iterator[pd.DataFrame]:
     """
     TDCC shareholding data crawling pipeline
+
+    Yields validated chunks, so only one chunk of the file is in memory at a time
     """
     
     print(f"Start_crawl_share_holding_data...")
     
     # Download raw data
-    df = crawler_tdcc_shareholding()
-    
-    # Data transformation pipeline
-    df = colname_zh2en(df.copy())
-    df = format_date(df.copy())
-    df = clean_security_code(df.copy())
-    
-    df = check_schema(df.copy(), TDCCShareholding)
-    
-    return df
\ No newline at end of file
+    for df in crawler_tdcc_shareholding():
+    
+        # Data transformation pipeline
+        df = colname_zh2en(df)
+        df = format_date(df)
+        df = clean_security_code(df)
+        
+        yield check_schema(df, TDCCShareholding)
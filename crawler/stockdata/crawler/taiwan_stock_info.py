@@ -1,9 +1,18 @@
+import codecs
 import typing
 import pandas as pd
-import requests
-import time
+from lxml import etree
+from stockdata.config import STOCK_INFO_MAX_REMOVED_SHARE
+from stockdata.fetch import client
 from stockdata.schema.dataset import check_schema, TaiwanStockInfo
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
+
+
+# ISIN page columns kept, the page also lists ISIN code, listing date and CFI code
+ISIN_COLUMNS = ['有價證券代號及名稱', '市場別', '產業別']
+
+# taiwan_stock_info columns, StockID is the primary key
+INFO_COLUMNS = ['StockID', 'StockName', 'MarketType', 'IndustryType']
 
 
 def colname_zh2en(df: pd.DataFrame) -> pd.DataFrame:
@@ -53,32 +62,82 @@ def filter_invalid_rows(df: pd.DataFrame) -> pd.DataFrame:
     return df
 
 
-def crawler_tpex_isin() -> pd.DataFrame:
+def cell_text(cell) -> Optional[str]:
     """
-    Crawl TWSE ISIN data
+    Text of a table cell, whitespace collapsed like pd.read_html does, None when empty
+    """
+    
+    text = cell.text if len(cell) == 0 else "".join(cell.itertext())
+    text = " ".join(text.split()) if text else ""
+    
+    return text or None
+
+
+def isin_rows(chunks: typing.Iterable[str], columns: List[str]) -> typing.Iterator[List[Optional[str]]]:
+    """
+    Some columns of the rows of the first table of an ISIN page, parsed as the HTML arrives
+
+    The first row is the header. Section rows ("股票", "ETF", ...) are one
+    merged cell and are skipped. Rows are dropped from the tree once read,
+    so the page is never held whole.
+    """
+    
+    parser = etree.HTMLPullParser(events=("end",), tag=("tr", "table"))
+    in_table, positions, width = True, None, 0
+    
+    for chunk in chunks:
+        parser.feed(chunk)
+        
+        for _, element in parser.read_events():
+            if element.tag == "table":
+                in_table = False
+            
+            elif in_table:
+                if positions is None:
+                    header = [cell_text(cell) for cell in element]
+                    positions, width = [header.index(col) for col in columns], len(header)
+                
+                elif len(element) == width:
+                    yield [cell_text(element[i]) for i in positions]
+                
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+
+def crawler_isin(mode: int) -> pd.DataFrame:
+    """
+    Crawl one ISIN page (strMode=2 listed, strMode=4 OTC) into its raw columns
     """
     
-    url = "https://isin.twse.com.tw/isin/C_public.jsp?strMode=4"
-    resp = requests.get(url)
-    resp.encoding = 'big5'
+    url = f"https://isin.twse.com.tw/isin/C_public.jsp?strMode={mode}"
     
-    # Read HTML table
-    df = pd.read_html(resp.text)[0]
+    with client.stream("GET", url) as (response, body):
+        response.raise_for_status()
+        
+        # The pages are Big5, decoded block by block as they are read
+        decoder = codecs.getincrementaldecoder("big5")(errors="replace")
+        blocks = (decoder.decode(block) for block in iter(lambda: body.read1(1 << 16), b""))
+        
+        data = list(isin_rows(blocks, ISIN_COLUMNS))
     
-    # Set correct column names (first row is header)
-    df.columns = df.iloc[0]
-    df = df.iloc[1:].reset_index(drop=True)
+    return pd.DataFrame(data, columns=ISIN_COLUMNS)
+
+
+def crawler_tpex_isin() -> pd.DataFrame:
+    """
+    Crawl TPEX ISIN data
+    """
     
-    # Keep only required columns
-    df = df[['有價證券代號及名稱', '市場別', '產業別']].copy()
+    df = crawler_isin(4)
     
     # Convert column names from Chinese to English
-    df = colname_zh2en(df.copy())
-    df = split_stock_info(df.copy())
-    df = filter_invalid_rows(df.copy())
+    df = colname_zh2en(df)
+    df = split_stock_info(df)
+    df = filter_invalid_rows(df)
     
     # Final column order
-    df = df[['StockID', 'StockName', 'MarketType', 'IndustryType']].reset_index(drop=True)
+    df = df[INFO_COLUMNS].reset_index(drop=True)
     df['MarketType'] = 'tpex'
     df['IndustryType'] = df['IndustryType'].fillna('未知')
 
@@ -90,33 +149,84 @@ def crawler_twse_isin() -> pd.DataFrame:
     Crawl TWSE ISIN data
     """
     
-    url = "https://isin.twse.com.tw/isin/C_public.jsp?strMode=2"
-    resp = requests.get(url)
-    resp.encoding = 'big5'
-    
-    # Read HTML table
-    df = pd.read_html(resp.text)[0]
-    
-    # Set correct column names (first row is header)
-    df.columns = df.iloc[0]
-    df = df.iloc[1:].reset_index(drop=True)
-    
-    # Keep only required columns
-    df = df[['有價證券代號及名稱', '市場別', '產業別']].copy()
+    df = crawler_isin(2)
     
     # Convert column names from Chinese to English
-    df = colname_zh2en(df.copy())
-    df = split_stock_info(df.copy())
-    df = filter_invalid_rows(df.copy())
+    df = colname_zh2en(df)
+    df = split_stock_info(df)
+    df = filter_invalid_rows(df)
     
     # Final column order
-    df = df[['StockID', 'StockName', 'MarketType', 'IndustryType']].reset_index(drop=True)
+    df = df[INFO_COLUMNS].reset_index(drop=True)
     df['MarketType'] = 'twse'
     df['IndustryType'] = df['IndustryType'].fillna('未知')
 
     
     return df
 
+def diff_stock_info(current: pd.DataFrame, fetched: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Compare the stored stock list with a freshly crawled one
+
+    Delistings are only looked for in the markets present in `fetched`,
+    so a page that failed to load removes nothing.
+
+    Args:
+        current: Rows of taiwan_stock_info
+        fetched: Validated rows of the ISIN pages
+
+    Returns:
+        tuple: (new listings, renamed / moved / reclassified rows, StockIDs and MarketType no longer listed)
+    """
+    
+    current = current.reindex(columns=INFO_COLUMNS).astype({'StockID': 'int64'})
+    fetched = fetched.drop_duplicates('StockID')
+    
+    merged = current.merge(fetched, on='StockID', how='outer', suffixes=('_old', ''), indicator=True)
+    both = merged[merged['_merge'] == 'both']
+    
+    changed = pd.Series(False, index=both.index)
+    for col in INFO_COLUMNS[1:]:
+        changed = changed | (both[col].fillna('') != both[f'{col}_old'].fillna(''))
+    
+    inserted = merged.loc[merged['_merge'] == 'right_only', INFO_COLUMNS]
+    updated = both.loc[changed, INFO_COLUMNS]
+    removed = merged.loc[
+        (merged['_merge'] == 'left_only') & merged['MarketType_old'].isin(fetched['MarketType'].unique()),
+        ['StockID', 'MarketType_old'],
+    ].rename(columns={'MarketType_old': 'MarketType'})
+    
+    return inserted.reset_index(drop=True), updated.reset_index(drop=True), removed.reset_index(drop=True)
+
+def guard_removed(
+    current: pd.DataFrame,
+    removed: pd.DataFrame,
+    quarantined: Dict[str, int],
+    max_share: float = STOCK_INFO_MAX_REMOVED_SHARE,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Split the delistings of diff_stock_info into (applied, skipped)
+
+    A market's delistings are all skipped when rows of its page were quarantined,
+    or when they are more than `max_share` of its stored stocks: a truncated
+    page or dropped rows would otherwise delete live listings.
+
+    Args:
+        current: Rows of taiwan_stock_info
+        removed: StockIDs and MarketType no longer listed
+        quarantined: {market: rows of its page that failed validation}
+    """
+    
+    stored = current['MarketType'].value_counts()
+    suspicious = [
+        market
+        for market, count in removed['MarketType'].value_counts().items()
+        if quarantined.get(market, 0) > 0 or count > max_share * stored.get(market, 0)
+    ]
+    skipped = removed['MarketType'].isin(suspicious)
+    
+    return removed[~skipped].reset_index(drop=True), removed[skipped].reset_index(drop=True)
+
 def stock_info_pipeline() -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     Crawl pipeline
@@ -128,7 +238,11 @@ def stock_info_pipeline() -> Tuple[pd.DataFrame, pd.DataFrame]:
     print(f"Start_crawl_tpex_info...")
     df_tpex = crawler_tpex_isin()
     
-    df_twse = check_schema(df_twse.copy(), TaiwanStockInfo)
-    df_tpex = check_schema(df_tpex.copy(), TaiwanStockInfo)
+    # The loader only applies delistings of pages that validated whole
+    frames = []
+    for df in (df_twse, df_tpex):
+        validated = check_schema(df, TaiwanStockInfo)
+        validated.attrs['quarantined'] = len(df) - len(validated)
+        frames.append(validated)
     
-    return df_twse, df_tpex
+    return tuple(frames)
@@ -1,7 +1,10 @@
 import typing
 import pandas as pd
-import requests
-import time
+from stockdata import trading_calendar
+from stockdata.fetch import client
+from stockdata.crawler.common import check_markets, crawl_markets, fetch_markets
+from stockdata.crawler import decode
+from stockdata.crawler.cleaner import apply_sign, clean_numeric
 from stockdata.schema.dataset import check_schema, TaiwanStockPrice
 from typing import Tuple
 
@@ -23,81 +26,67 @@ def twse_header():
         "X-Requested-With": "XMLHttpRequest",
     }
 
-def colname_zh2en(df: pd.DataFrame, colname: typing.List[str],) -> pd.DataFrame:
-    """
-    Convert Chinese column names to English
-    """
-
-    taiwan_stock_price = {
-        "證券代號": "StockID",
-        "證券名稱": "",
-        "成交股數": "TradeVolume",
-        "成交筆數": "Transaction",
-        "成交金額": "TradeValue",
-        "開盤價": "Open",
-        "最高價": "Max",
-        "最低價": "Min",
-        "收盤價": "Close",
-        "漲跌(+/-)": "Dir",
-        "漲跌價差": "Change",
-        "最後揭示買價": "",
-        "最後揭示買量": "",
-        "最後揭示賣價": "",
-        "最後揭示賣量": "",
-        "本益比": "",
-    }
-    
-    df.columns = [taiwan_stock_price[col] for col in colname]
-    df = df.drop([""], axis=1)
-    
-    return df
+# MI_INDEX field names in English, "" for dropped fields
+TWSE_COLUMNS = {
+    "證券代號": "StockID",
+    "證券名稱": "",
+    "成交股數": "TradeVolume",
+    "成交筆數": "Transaction",
+    "成交金額": "TradeValue",
+    "開盤價": "Open",
+    "最高價": "Max",
+    "最低價": "Min",
+    "收盤價": "Close",
+    "漲跌(+/-)": "Dir",
+    "漲跌價差": "Change",
+    "最後揭示買價": "",
+    "最後揭示買量": "",
+    "最後揭示賣價": "",
+    "最後揭示賣量": "",
+    "本益比": "",
+}
+
+# Numeric columns and their dtypes
+NUMERIC_COLUMNS = {
+    "TradeVolume": "int64",
+    "Transaction": "int64",
+    "TradeValue": "int64",
+    "Open": "float64",
+    "Max": "float64",
+    "Min": "float64",
+    "Close": "float64",
+    "Change": "float64",
+}
+
+
+def twse_dtypes(colname: typing.List[str]) -> typing.Dict[str, str]:
+    """
+    dtypes of the numeric MI_INDEX fields, keyed by their Chinese names
+    """
+
+    return {col: NUMERIC_COLUMNS[TWSE_COLUMNS[col]] for col in colname if TWSE_COLUMNS.get(col) in NUMERIC_COLUMNS}
+
+
+def twse_names(colname: typing.List[str]) -> typing.Dict[str, str]:
+    """
+    English names of the MI_INDEX fields kept, keyed by their Chinese names
+    """
+
+    return {col: TWSE_COLUMNS[col] for col in colname if TWSE_COLUMNS.get(col)}
 
 def clear_data(df: pd.DataFrame) -> pd.DataFrame:
     """
     Clear data
     """
 
-    for col in ["TradeVolume", "Transaction", "TradeValue", "Open", "Max", "Min", "Close", "Change"]:
-        df[col] = (
-            df[col]
-            .astype(str)
-            .str.replace(",", "")
-            .str.replace("X", "")
-            .str.replace("+", "")
-            .str.replace("----", "0")
-            .str.replace("---", "0")
-            .str.replace("--", "0")
-            .str.replace(" ", "")
-            .str.replace("除權息", "0")
-            .str.replace("除息", "0")
-            .str.replace("除權", "0")
-        )
-    
-    return df
+    return clean_numeric(df, NUMERIC_COLUMNS)
 
 def convert_change(df: pd.DataFrame,) -> pd.DataFrame:
     """
     Convert stock price change direction and amount into a single numeric column.
     """
     
-    df["Dir"] = (
-        df["Dir"]
-        .str.split(">")
-        .str[1]
-        .str.split("<")
-        .str[0]
-    )
-
-    df["Change"] = (df["Dir"] + df["Change"])
-    
-    df["Change"] = (
-        df["Change"]
-        .str.replace(" ", "")
-        .str.replace("X", "")
-        .astype(float)
-    )
-
-    df = df.fillna("")
+    df["Change"] = apply_sign(df["Dir"], df["Change"])
     df = df.drop(["Dir"], axis=1)
     
     return df
@@ -112,32 +101,34 @@ def crawler_twse(date: str,) -> pd.DataFrame:
     url = ("https://www.twse.com.tw/exchangeReport/MI_INDEX?response=json&date={date}&type=ALL")
     url = url.format(date=date.replace("-", ""))
     
-    # To avoid being banned by twse, sleep for 5 seconds before each request
-    time.sleep(5)
-    res = requests.get(url, headers=twse_header())
+    # To avoid being banned by twse, requests are spaced out per host by the fetch client
+    res = client.get(url, headers=twse_header())
+    data = decode.payload(res)
 
-    if (res.json()["stat"] == "很抱歉，沒有符合條件的資料!"):
+    if (data["stat"] == "很抱歉，沒有符合條件的資料!"):
+        # MI_INDEX covers the whole market, no data means the exchange was closed
+        trading_calendar.get_calendar().learn(date, has_data=False)
         return pd.DataFrame()
     
     # After 2009, stock prices are in "data9" in the response  
     # Before 2009, stock prices are in "data8" in the response  
     # Consider cases where no data is available, such as no trading on Saturdays now, but trading was available on Saturdays in 2007  
     try:
-        if "data9" in res.json():
-            df = pd.DataFrame(res.json()["data9"])
-            colname = res.json()["fields9"]
+        if "data9" in data:
+            rows, colname = data["data9"], data["fields9"]
         
-        elif "data8" in res.json():
-            df = pd.DataFrame(res.json()["data8"])
-            colname = res.json()["fields8"]
+        elif "data8" in data:
+            rows, colname = data["data8"], data["fields8"]
         
-        elif res.json()["stat"] in ["查詢日期小於93年2月11日，請重新查詢!", "很抱歉，沒有符合條件的資料!"]:
+        elif data["stat"] in ["查詢日期小於93年2月11日，請重新查詢!", "很抱歉，沒有符合條件的資料!"]:
             return pd.DataFrame()
         
         else:
-            tables = res.json().get("tables", [{}])
-            df = pd.DataFrame(tables[8]["data"])
-            colname = tables[8]["fields"]
+            tables = data.get("tables", [{}])
+            rows, colname = tables[8]["data"], tables[8]["fields"]
+
+        # Only the kept fields are built, numeric ones parsed straight into typed columns
+        df = decode.frame(rows, colname, twse_dtypes(colname), twse_names(colname))
 
     except BaseException:
         return pd.DataFrame()
@@ -145,10 +136,10 @@ def crawler_twse(date: str,) -> pd.DataFrame:
     if len(df) == 0:
         return pd.DataFrame()
     
-    # Convert column names from Chinese to English
-    df = colname_zh2en(df.copy(), colname)
+    trading_calendar.get_calendar().learn(date, has_data=True)
+    
     df["Date"] = date
-    df = clear_data(df.copy())
+    df = clear_data(df)
     
     # Convert Dir to number(+-)
     df = convert_change(df)
@@ -173,24 +164,18 @@ def tpex_header():
     }
 
 
-def set_column(df: pd.DataFrame,) -> pd.DataFrame:
-    """
-    Set columns name
-    """
-
-    df.columns = [
-        "StockID",
-        "Close",
-        "Change",
-        "Open",
-        "Max",
-        "Min",
-        "TradeVolume",
-        "TradeValue",
-        "Transaction",
-    ]
-    
-    return df
+# Positions of the stk_wn1430 fields kept, in the order of the TWSE table
+TPEX_COLUMNS = {
+    0: "StockID",
+    7: "TradeVolume",
+    9: "Transaction",
+    8: "TradeValue",
+    4: "Open",
+    5: "Max",
+    6: "Min",
+    2: "Close",
+    3: "Change",
+}
 
 def convert_date(date: str) -> str:
     """
@@ -211,49 +196,165 @@ def crawler_tpex(date: str,) -> pd.DataFrame:
     url = "https://www.tpex.org.tw/web/stock/aftertrading/otc_quotes_no1430/stk_wn1430_result.php?l=zh-tw&d={date}&se=AL"
     url = url.format(date=convert_date(date))
     
-    # To avoid being banned by TPEX, sleep for 5 seconds before each request
-    time.sleep(5)
-    res = requests.get(url, headers=tpex_header())
-    data = res.json().get("tables", [])[0].get("data", [])
-    df = pd.DataFrame(data)
+    # To avoid being banned by TPEX, requests are spaced out per host by the fetch client
+    res = client.get(url, headers=tpex_header())
+    data = decode.payload(res).get("tables", [])[0].get("data", [])
 
-    if not data or len(df) == 0:
+    if not data:
         return pd.DataFrame()
     
     # The data returned by TPEX does not include column names, so specific columns are accessed by index
-    df = df[[0, 2, 3, 4, 5, 6, 7, 8, 9]]
+    dtypes = {position: NUMERIC_COLUMNS[name] for position, name in TPEX_COLUMNS.items() if name in NUMERIC_COLUMNS}
+    df = decode.frame(data, range(10), dtypes, TPEX_COLUMNS)
     
-    # Convert column names from Chinese to English
-    df = set_column(df.copy())
     df["Date"] = date
-    df = clear_data(df.copy())
+    df = clear_data(df)
+
+    return df
+
+def stock_price_pipeline(date: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
     
-    # Select and reorder the relevant columns
-    df = df[[
-        "StockID",
+
+    return crawl_markets(crawler_twse, crawler_tpex, date, TaiwanStockPrice, "")
+
+
+def stock_price_fetch(date: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Fetch stage of stock_price_pipeline: TWSE and TPEX parsed, not validated yet
+    """
+    return fetch_markets(crawler_twse, crawler_tpex, date, "")
+
+
+def stock_price_transform(date: str, frames: Tuple[pd.DataFrame, pd.DataFrame]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Transform stage of stock_price_pipeline: validate what stock_price_fetch returned
+    """
+    return check_markets(frames, TaiwanStockPrice)
+
+
+def convert_roc_date(date: str) -> str:
+    """
+    Convert ROC calendar date (e.g. 113/01/02) to YYYY-MM-DD
+    """
+
+    year, month, day = date.strip().split("/")
+
+    return f"{int(year) + 1911}-{month}-{day}"
+
+
+def month_first_day(month: str) -> str:
+    """
+    First day of a 'YYYY-MM' month, as YYYYMMDD
+    """
+
+    return month.replace("-", "") + "01"
+
+
+def crawler_twse_stock_month(stock_id: str, month: str) -> pd.DataFrame:
+    """
+    Crawl one month of a single twse stock (STOCK_DAY)
+    """
+
+    url = "https://www.twse.com.tw/exchangeReport/STOCK_DAY?response=json&date={date}&stockNo={stock_id}"
+    url = url.format(date=month_first_day(month), stock_id=stock_id)
+
+    # To avoid being banned by twse, requests are spaced out per host by the fetch client
+    res = client.get(url, headers=twse_header())
+    payload = decode.payload(res)
+    data = payload.get("data", [])
+
+    if payload.get("stat") != "OK" or not data:
+        return pd.DataFrame()
+
+    df = decode.frame(data, [
+        "Date",
         "TradeVolume",
+        "TradeValue",
+        "Open",
+        "Max",
+        "Min",
+        "Close",
+        "Change",
         "Transaction",
+    ], NUMERIC_COLUMNS)
+    df["StockID"] = stock_id
+    df["Date"] = df["Date"].map(convert_roc_date)
+
+    # Change carries its own sign here (e.g. +5.00, -1.50, X0.00), no Dir column
+    df = clear_data(df)
+
+    return df
+
+
+def crawler_tpex_stock_month(stock_id: str, month: str) -> pd.DataFrame:
+    """
+    Crawl one month of a single tpex stock (st43)
+    """
+
+    year, mon = month.split("-")
+    url = "https://www.tpex.org.tw/web/stock/aftertrading/daily_trading_info/st43_result.php?l=zh-tw&d={date}&stkno={stock_id}"
+    url = url.format(date=f"{int(year) - 1911}/{mon}", stock_id=stock_id)
+
+    # To avoid being banned by TPEX, requests are spaced out per host by the fetch client
+    res = client.get(url, headers=tpex_header())
+    payload = decode.payload(res)
+    data = payload.get("aaData") or payload.get("tables", [{}])[0].get("data", [])
+
+    if not data:
+        return pd.DataFrame()
+
+    df = decode.frame(data, [
+        "Date",
+        "TradeVolume",
         "TradeValue",
         "Open",
         "Max",
         "Min",
         "Close",
         "Change",
-        "Date"
-        ]]
+        "Transaction",
+    ], NUMERIC_COLUMNS)
+    df["StockID"] = stock_id
+    df["Date"] = df["Date"].map(convert_roc_date)
+    df = clear_data(df)
+
+    # st43 reports volume and value in thousands
+    for col in ["TradeVolume", "TradeValue"]:
+        df[col] = df[col] * 1000
 
     return df
 
-def stock_price_pipeline(date: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
-    
 
-    print(f"Start_crawl_twse_{date}_data...")
-    df_twse = crawler_twse(date)
+def stock_month_pipeline(item: Tuple[str, str, str]) -> pd.DataFrame:
+    """
+    Crawl pipeline for one stock over one month
 
-    print(f"Start_crawl_tpex_{date}_data...")
-    df_tpex = crawler_tpex(date)
-    
-    df_twse = check_schema(df_twse.copy(), TaiwanStockPrice)
-    df_tpex = check_schema(df_tpex.copy(), TaiwanStockPrice)
-    
-    return df_twse, df_tpex
+    Args:
+        item: (StockID, MarketType 'twse' or 'tpex', 'YYYY-MM')
+    """
+
+    stock_id, market, month = item
+
+    print(f"Start_crawl_{market}_{stock_id}_{month}_data...")
+    if market == "twse":
+        df = crawler_twse_stock_month(stock_id, month)
+    else:
+        df = crawler_tpex_stock_month(stock_id, month)
+
+    if df.empty:
+        return df
+
+    df = df[[
+        "StockID",
+        "TradeVolume",
+        "Transaction",
+        "TradeValue",
+        "Open",
+        "Max",
+        "Min",
+        "Close",
+        "Change",
+        "Date"
+        ]]
+
+    return check_schema(df, TaiwanStockPrice)
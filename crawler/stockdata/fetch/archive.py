@@ -0,0 +1,207 @@
+import datetime
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import typing
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from stockdata.metrics import metrics
+
+
+class ArchiveMiss(Exception):
+    """
+    Raised in replay mode when no payload was archived for a request
+    """
+
+
+def request_key(prepared: requests.PreparedRequest) -> str:
+    """
+    Identify a request by method, full url (query string included) and body
+    """
+
+    body = prepared.body or b""
+    if isinstance(body, str):
+        body = body.encode()
+
+    digest = hashlib.sha256(f"{prepared.method} {prepared.url}\n".encode() + body)
+
+    return digest.hexdigest()
+
+
+def request_source(prepared: requests.PreparedRequest) -> str:
+    """
+    Host and path of a request, e.g. "www.twse.com.tw/exchangeReport/MI_INDEX"
+    """
+
+    parts = urlsplit(prepared.url)
+
+    return f"{parts.hostname}{parts.path}".rstrip("/")
+
+
+def prepare(method: str, url: str, params: typing.Any = None, data: typing.Any = None) -> requests.PreparedRequest:
+    """
+    Prepare a request the same way the session does, so keys match between archive and replay
+    """
+
+    return requests.Request(method, url, params=params, data=data).prepare()
+
+
+class Archive:
+    """
+    Content-addressed store of raw HTTP payloads
+
+    Layout under `root`:
+        objects/ab/abcdef....gz                   gzip payload named by its sha256
+        index/<host>/<path>/<request key>.jsonl   one line per fetch: fetch time, sha256, encoding
+
+    Identical payloads (e.g. re-fetching an unchanged day) are stored once;
+    the index keeps every fetch so a payload can be found by request and fetch date.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _object_path(self, sha256: str) -> str:
+        return os.path.join(self.root, "objects", sha256[:2], f"{sha256}.gz")
+
+    def _index_path(self, prepared: requests.PreparedRequest) -> str:
+        return os.path.join(self.root, "index", request_source(prepared), f"{request_key(prepared)}.jsonl")
+
+    @staticmethod
+    def _write_atomic(path: str, content: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def put_object(self, content: bytes) -> str:
+        """
+        Store a payload, return its sha256
+        """
+
+        sha256 = hashlib.sha256(content).hexdigest()
+        path = self._object_path(sha256)
+
+        if not os.path.exists(path):
+            compressed = gzip.compress(content)
+            self._write_atomic(path, compressed)
+            metrics.inc("archive_bytes_total", len(compressed))
+
+        return sha256
+
+    def get_object(self, sha256: str) -> bytes:
+        with gzip.open(self._object_path(sha256), "rb") as f:
+            return f.read()
+
+    def store(self, response: requests.Response) -> str:
+        """
+        Archive the payload of a response and index it under its request
+
+        Returns:
+            str: sha256 of the payload
+        """
+
+        sha256 = self.put_object(response.content)
+        self._index(response, sha256)
+
+        return sha256
+
+    def _index(self, response: requests.Response, sha256: str) -> None:
+        entry = {
+            "fetched_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "sha256": sha256,
+            "status": response.status_code,
+            "content_type": response.headers.get("Content-Type", ""),
+            "encoding": response.encoding,
+            "url": response.request.url,
+        }
+
+        path = self._index_path(response.request)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def tee(self, response: requests.Response, chunks: typing.Iterable[bytes]) -> typing.Iterator[bytes]:
+        """
+        Archive a streamed body while the caller consumes it
+
+        Chunks are compressed to a temporary file as they pass through; the
+        payload is stored and indexed once the last chunk went through, and
+        dropped if the consumer stops early.
+        """
+
+        digest = hashlib.sha256()
+        tmp_dir = os.path.join(self.root, "objects")
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        complete = False
+
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+                for chunk in chunks:
+                    digest.update(chunk)
+                    gz.write(chunk)
+                    yield chunk
+
+            complete = True
+
+        finally:
+            path = self._object_path(digest.hexdigest())
+
+            if complete and not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                metrics.inc("archive_bytes_total", os.path.getsize(tmp_path))
+                os.replace(tmp_path, path)
+            else:
+                os.remove(tmp_path)
+
+            if complete:
+                self._index(response, digest.hexdigest())
+
+    def entries(self, prepared: requests.PreparedRequest) -> typing.List[typing.Dict[str, typing.Any]]:
+        """
+        All archived fetches of a request, oldest first
+        """
+
+        path = self._index_path(prepared)
+        if not os.path.exists(path):
+            return []
+
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def load(self, prepared: requests.PreparedRequest, as_of: typing.Optional[str] = None) -> requests.Response:
+        """
+        Rebuild the response of the latest fetch of a request
+
+        Args:
+            prepared: request to look up
+            as_of: only consider fetches at or before this ISO timestamp
+
+        Raises:
+            ArchiveMiss: nothing archived for the request
+        """
+
+        entries = [e for e in self.entries(prepared) if as_of is None or e["fetched_at"] <= as_of]
+        if not entries:
+            raise ArchiveMiss(f"No archived payload for {prepared.method} {prepared.url}")
+
+        entry = entries[-1]
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response._content = self.get_object(entry["sha256"])
+        response._content_consumed = True
+        response.headers = CaseInsensitiveDict({"Content-Type": entry["content_type"]})
+        response.encoding = entry["encoding"]
+        response.url = entry["url"]
+        response.request = prepared
+        metrics.inc("archive_replay_total")
+
+        return response
@@ -0,0 +1,299 @@
+import codecs
+import contextlib
+import hashlib
+import io
+import threading
+import typing
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from loguru import logger
+
+from stockdata.config import (
+    CRAWLER_ARCHIVE,
+    CRAWLER_ARCHIVE_DIR,
+    CRAWLER_HOST_CONCURRENCY,
+    CRAWLER_POOL_SIZE,
+    CRAWLER_RETRIES,
+    CRAWLER_TIMEOUT,
+)
+from stockdata.fetch.archive import Archive, prepare
+from stockdata.fetch.ratelimit import get_limiter
+
+
+# Status codes the exchanges answer with when they throttle or block a client
+THROTTLE_STATUS = (403, 429)
+
+# Text found on the HTML pages served instead of data when a client is blocked
+BAN_PAGE_MARKERS = ("請求過於頻繁", "拒絕存取", "Too Many Requests", "Access Denied")
+
+# Ban pages are small, larger HTML bodies are never searched for the markers
+BAN_PAGE_MAX_BYTES = 65536
+
+
+_semaphores: typing.Dict[str, threading.BoundedSemaphore] = {}
+_semaphores_lock = threading.Lock()
+
+
+def host_semaphore(host: str) -> threading.BoundedSemaphore:
+    """
+    Get (or create) the semaphore limiting concurrent requests to a host
+    """
+
+    with _semaphores_lock:
+        if host not in _semaphores:
+            _semaphores[host] = threading.BoundedSemaphore(CRAWLER_HOST_CONCURRENCY)
+
+        return _semaphores[host]
+
+
+def new_session() -> requests.Session:
+    """
+    Create a requests session backed by a keep-alive connection pool
+    """
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=CRAWLER_POOL_SIZE, pool_maxsize=CRAWLER_POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+_session = new_session()
+_archive = Archive(CRAWLER_ARCHIVE_DIR)
+
+# In replay mode every request is answered from the archive, without network access,
+# with the latest fetch at or before _replay_as_of (the latest one when None)
+_replay = False
+_replay_as_of = None
+
+
+def set_replay(enabled: bool, as_of: typing.Optional[str] = None) -> None:
+    """
+    Switch replay mode on or off (also used as a process pool initializer)
+
+    Args:
+        enabled: Answer requests from the archive
+        as_of: Replay the fetches made at or before this ISO timestamp, e.g. one of archived()
+    """
+
+    global _replay, _replay_as_of
+    _replay, _replay_as_of = enabled, as_of
+
+
+def archived(method: str, url: str, **kwargs) -> typing.List[typing.Dict[str, typing.Any]]:
+    """
+    Archive entries of every fetch of a request, oldest first, e.g. the weekly TDCC files
+    """
+
+    return _archive.entries(prepare(method, url, kwargs.get("params"), kwargs.get("data")))
+
+
+def replaying() -> bool:
+    """
+    True when requests are answered from the archive
+    """
+
+    return _replay
+
+
+def is_ban_page(response: requests.Response, content: bytes) -> bool:
+    """
+    True when (the start of) an HTML body carries one of the ban page markers
+    """
+
+    text = content.decode(response.encoding or "utf-8", errors="ignore")
+
+    return any(marker in text for marker in BAN_PAGE_MARKERS)
+
+
+def is_throttled(response: requests.Response, streamed: bool = False) -> bool:
+    """
+    Check whether a response is the host refusing to serve us
+
+    The body of a streamed response is not read here, that would download all
+    of it: it is only searched when its Content-Length is small, stream()
+    checks the first chunk of the others.
+
+    Args:
+        response: response object
+        streamed: The response was requested with stream=True, its body is not read yet
+
+    Returns:
+        bool: True for HTTP 403/429 or an HTML ban page
+    """
+
+    if response.status_code in THROTTLE_STATUS:
+        return True
+
+    if "html" not in response.headers.get("Content-Type", ""):
+        return False
+
+    if streamed:
+        length = response.headers.get("Content-Length", "")
+        if not length.isdigit() or int(length) >= BAN_PAGE_MAX_BYTES:
+            return False
+
+    return len(response.content) < BAN_PAGE_MAX_BYTES and is_ban_page(response, response.content)
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Send a request through the pooled session, respecting the host's concurrency limit and rate limit
+
+    Every outcome is reported to the limiter's pacer. Throttled responses,
+    connection errors and timeouts slow the host down and are retried up to CRAWLER_RETRIES
+    times; the last throttled response is returned to the caller as is.
+    Successful responses are archived, and in replay mode the archived
+    response is returned instead of sending the request.
+
+    Args:
+        method: HTTP method
+        url: Request url
+        **kwargs: Passed through to requests.Session.request
+
+    Returns:
+        requests.Response: response object
+    """
+
+    if _replay:
+        return _archive.load(prepare(method, url, kwargs.get("params"), kwargs.get("data")), _replay_as_of)
+
+    kwargs.setdefault("timeout", CRAWLER_TIMEOUT)
+
+    host = urlsplit(url).hostname
+    limiter = get_limiter()
+
+    for attempt in range(CRAWLER_RETRIES + 1):
+        with host_semaphore(host):
+            limiter.acquire(host)
+
+            try:
+                response = _session.request(method, url, **kwargs)
+
+            except (requests.ConnectionError, requests.Timeout) as e:
+                limiter.report(host, healthy=False)
+                if attempt == CRAWLER_RETRIES:
+                    raise
+
+                logger.warning(f"{host} {'timed out' if isinstance(e, requests.Timeout) else 'connection error'}, backing off: {e}")
+                continue
+
+        if not is_throttled(response, kwargs.get("stream", False)):
+            limiter.report(host, healthy=True)
+
+            # Streamed bodies are archived by stream() while they are read
+            if CRAWLER_ARCHIVE and response.ok and not kwargs.get("stream"):
+                _archive.store(response)
+
+            return response
+
+        limiter.report(host, healthy=False)
+        logger.warning(f"{host} throttled the request (HTTP {response.status_code}), backing off")
+
+        # Release the connection of a response that is not returned
+        if attempt < CRAWLER_RETRIES:
+            response.close()
+
+    return response
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    """
+    Send a GET request
+    """
+
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    """
+    Send a POST request
+    """
+
+    return request("POST", url, **kwargs)
+
+
+class ChunkReader(io.RawIOBase):
+    """
+    Read-only file object over an iterator of byte chunks, hashing them as they are read
+    """
+
+    def __init__(self, chunks: typing.Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._pending = b""
+        self.digest = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            self._pending = next(self._chunks, None)
+            if self._pending is None:
+                self._pending = b""
+                return 0
+            self.digest.update(self._pending)
+
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+
+        return size
+
+
+def sniff_encoding(response: requests.Response, head: bytes) -> str:
+    """
+    Text encoding of a streamed body: the declared charset, else UTF-8 if the first bytes decode, else Big5
+    """
+
+    declared = requests.utils.get_encoding_from_headers(response.headers)
+    if declared and declared.upper() != "ISO-8859-1":
+        return declared
+
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8-sig"
+
+    except UnicodeDecodeError:
+        return "big5"
+
+
+@contextlib.contextmanager
+def stream(method: str, url: str, chunk_size: int = 1 << 16, **kwargs) -> typing.Iterator[typing.Tuple[requests.Response, io.BufferedReader]]:
+    """
+    Send a request and read its body incrementally, e.g. for large CSV downloads
+
+    Only `chunk_size` bytes of the body are held at a time. The body is
+    archived while it is read, so replay and reparse see the same payload,
+    and hashed: once read to the end, `body.raw.digest` is its sha256.
+
+    Yields:
+        tuple: (response, buffered binary file over the body)
+    """
+
+    response = request(method, url, stream=True, **kwargs)
+    chunks = response.iter_content(chunk_size)
+
+    try:
+        # 304 Not Modified answers to conditional requests carry no body to archive
+        if CRAWLER_ARCHIVE and response.ok and response.status_code != 304 and not _replay:
+            chunks = _archive.tee(response, chunks)
+
+        body = io.BufferedReader(ChunkReader(chunks), buffer_size=chunk_size)
+
+        # A ban page served without a small Content-Length is only recognized by its first bytes
+        if "html" in response.headers.get("Content-Type", "") and is_ban_page(response, body.peek(4096)):
+            host = urlsplit(url).hostname
+            get_limiter().report(host, healthy=False)
+            raise requests.HTTPError(f"{host} served a ban page instead of data", response=response)
+
+        yield response, body
+
+    finally:
+        # An unfinished body is not archived
+        chunks.close()
+        response.close()
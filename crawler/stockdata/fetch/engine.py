@@ -0,0 +1,88 @@
+import asyncio
+import typing
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+from loguru import logger
+
+from stockdata import pipeline
+from stockdata.fetch.archive import ArchiveMiss
+
+
+async def _run_dates(
+    crawl: typing.Callable[[str], typing.Any],
+    load: typing.Callable[[str, typing.Any], None],
+    dates: typing.List[str],
+    concurrency: int,
+    executor: Executor,
+) -> None:
+    """
+    Keep up to `concurrency` dates in flight and load each result as it completes
+    """
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    with executor:
+
+        async def crawl_date(date: str) -> typing.Tuple[str, typing.Any]:
+            async with semaphore:
+                return date, await loop.run_in_executor(executor, crawl, date)
+
+        tasks = [asyncio.create_task(crawl_date(date)) for date in dates]
+
+        try:
+            for future in asyncio.as_completed(tasks):
+                date, result = await future
+
+                # Loading runs on the event loop thread, so DB writes stay serialized
+                load(date, result)
+
+        except Exception as e:
+            logger.error(f"Engine stopped: {type(e).__name__}: {e}")
+            raise
+
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+def run_dates(
+    crawl: typing.Callable[[str], typing.Any],
+    load: typing.Callable[[str, typing.Any], None],
+    dates: typing.List[str],
+    concurrency: int,
+    executor: typing.Optional[Executor] = None,
+) -> None:
+    """
+    Run a per-date crawl pipeline over many dates concurrently
+
+    The HTTP requests themselves are throttled per host by stockdata.fetch.client,
+    so dates targeting different hosts (TWSE, TPEX, TAIFEX) overlap while each host
+    still sees its own politeness budget.
+
+    Args:
+        crawl: Dataset pipeline function taking a 'YYYY-MM-DD' date
+        load: Callback receiving (date, crawl result), e.g. the DB writer
+        dates: Dates to crawl
+        concurrency: Maximum number of dates in flight
+        executor: Where crawl runs, a thread pool of `concurrency` workers by default
+    """
+
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="crawler")
+
+    asyncio.run(_run_dates(crawl, load, dates, concurrency, executor))
+
+
+def crawl_archived(crawl: typing.Callable[[str], typing.Any], date: str) -> typing.Any:
+    """
+    Run a pipeline in replay mode, returning None when the date was never archived
+    """
+
+    try:
+        with pipeline.copy_on_write():
+            return crawl(date)
+
+    except ArchiveMiss as e:
+        logger.warning(f"Skip {date}: {e}")
+        return None
@@ -0,0 +1,105 @@
+import os
+import sqlite3
+import threading
+import time
+import typing
+
+from stockdata.metrics import metrics
+
+
+class PacingStore:
+    """
+    Learned request rate per host, kept in a SQLite file so it survives between runs
+
+    Updates are single atomic statements, so concurrent crawler processes
+    sharing the file adjust one rate per host.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS host_pacing "
+            "(host TEXT PRIMARY KEY, rate REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+
+        return conn
+
+    def get(self, host: str) -> typing.Optional[float]:
+        row = self._connect().execute("SELECT rate FROM host_pacing WHERE host = ?", (host,)).fetchone()
+
+        return row[0] if row else None
+
+    def update(self, host: str, initial: float, expression: str, *params: float) -> float:
+        """
+        Create the host row at `initial` if missing, then apply `rate = <expression>`
+        """
+
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR IGNORE INTO host_pacing (host, rate, updated) VALUES (?, ?, ?)",
+            (host, initial, time.time()),
+        )
+        conn.execute(
+            f"UPDATE host_pacing SET rate = {expression}, updated = ? WHERE host = ?",
+            (*params, time.time(), host),
+        )
+
+        return self.get(host)
+
+
+class AIMDPacer:
+    """
+    Additive-increase / multiplicative-decrease controller of the per-host request rate
+
+    Every healthy response raises the host's rate by `step` requests per second,
+    every sign of being throttled (HTTP 429/403, ban page, connection reset)
+    multiplies it by `backoff`. Backfills therefore climb to the fastest rate a
+    host tolerates and settle just below it.
+    """
+
+    def __init__(
+        self,
+        store: PacingStore,
+        initial: typing.Callable[[str], float],
+        min_rate: float,
+        max_rate: float,
+        step: float,
+        backoff: float,
+    ):
+        self.store = store
+        self.initial = initial
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.step = step
+        self.backoff = backoff
+
+    def rate(self, host: str) -> float:
+        """
+        Current rate of a host, the configured rate until something was learned
+        """
+
+        rate = self.store.get(host)
+
+        return self.initial(host) if rate is None else rate
+
+    def on_success(self, host: str) -> float:
+        rate = self.store.update(host, self.initial(host), "MIN(?, rate + ?)", self.max_rate, self.step)
+        metrics.set("pacing_rate", rate, host=host)
+
+        return rate
+
+    def on_failure(self, host: str) -> float:
+        rate = self.store.update(host, self.initial(host), "MAX(?, rate * ?)", self.min_rate, self.backoff)
+        metrics.set("pacing_rate", rate, host=host)
+        metrics.inc("pacing_backoff_total", host=host)
+
+        return rate
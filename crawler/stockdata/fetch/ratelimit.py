@@ -0,0 +1,311 @@
+import os
+import sqlite3
+import threading
+import time
+import typing
+
+from stockdata.config import (
+    CRAWLER_BURST,
+    CRAWLER_PACING,
+    CRAWLER_PACING_BACKOFF,
+    CRAWLER_PACING_MAX_RATE,
+    CRAWLER_PACING_MIN_RATE,
+    CRAWLER_PACING_STEP,
+    CRAWLER_RATE,
+    CRAWLER_RATE_BACKEND,
+    CRAWLER_RATE_LIMITS,
+    CRAWLER_STATE_DIR,
+)
+from stockdata.fetch.pacing import AIMDPacer, PacingStore
+from stockdata.metrics import metrics
+
+
+def parse_rate_limits(spec: str) -> typing.Dict[str, typing.Tuple[float, float]]:
+    """
+    Parse per-host overrides
+
+    Args:
+        spec: "host=rate:burst,host=rate:burst", e.g. "www.twse.com.tw=0.5:2"
+
+    Returns:
+        dict: {host: (rate, burst)}
+    """
+
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        host, value = item.split("=", 1)
+        rate, _, burst = value.partition(":")
+        limits[host.strip()] = (float(rate), float(burst or CRAWLER_BURST))
+
+    return limits
+
+
+def take_token(tokens: float, updated: float, now: float, rate: float, burst: float) -> typing.Tuple[float, float]:
+    """
+    Refill a token bucket up to `now` and take one token
+
+    Callers that find the bucket empty go into debt, so concurrent callers are
+    served in the order they reserved and never overshoot the rate.
+
+    Returns:
+        tuple: (tokens left, seconds to wait before the token may be used)
+    """
+
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate) - 1
+
+    if tokens >= 0:
+        return tokens, 0.0
+
+    return tokens, -tokens / rate
+
+
+class LocalBackend:
+    """
+    Buckets held in process memory, only throttles threads of the current process
+    """
+
+    def __init__(self):
+        self._buckets: typing.Dict[str, typing.Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, host: str, rate: float, burst: float) -> float:
+        with self._lock:
+            now = time.monotonic()
+            tokens, updated = self._buckets.get(host, (burst, now))
+            tokens, wait = take_token(tokens, updated, now, rate, burst)
+            self._buckets[host] = (tokens, now)
+
+            return wait
+
+
+class SQLiteBackend:
+    """
+    Buckets stored in a SQLite file, shared by every process that can see the file
+
+    Each reservation runs in a write transaction, so concurrent crawler
+    containers mounting the same state volume consume one shared budget.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_bucket "
+                "(host TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+
+        return conn
+
+    def reserve(self, host: str, rate: float, burst: float) -> float:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated FROM rate_limit_bucket WHERE host = ?", (host,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens, wait = take_token(tokens, updated, now, rate, burst)
+            conn.execute(
+                "INSERT INTO rate_limit_bucket (host, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(host) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (host, tokens, now),
+            )
+            conn.execute("COMMIT")
+
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        return wait
+
+
+# Atomic token bucket evaluated by the Redis server, using the server clock
+_REDIS_TAKE_TOKEN = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or burst
+local updated = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate) - 1
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+if tokens >= 0 then
+    return '0'
+end
+return tostring(-tokens / rate)
+"""
+
+
+class RedisBackend:
+    """
+    Buckets stored in Redis (or any server speaking the Redis protocol with EVAL)
+
+    Args:
+        client: object with a redis-py style `eval(script, numkeys, *keys_and_args)`
+        prefix: key prefix of the buckets
+    """
+
+    def __init__(self, client: typing.Any, prefix: str = "stockdata:ratelimit:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("CRAWLER_RATE_BACKEND=redis needs the redis extra: pip install 'crawler[redis]'") from None
+
+        return cls(redis.Redis.from_url(url))
+
+    def reserve(self, host: str, rate: float, burst: float) -> float:
+        wait = self.client.eval(_REDIS_TAKE_TOKEN, 1, f"{self.prefix}{host}", rate, burst)
+
+        return float(wait.decode() if isinstance(wait, bytes) else wait)
+
+
+def get_backend(spec: str) -> typing.Any:
+    """
+    Build a backend from CRAWLER_RATE_BACKEND
+
+    Args:
+        spec: "local", "sqlite" (file under CRAWLER_STATE_DIR), "sqlite:///path/to/file" or "redis://host:port/db"
+    """
+
+    if spec == "local":
+        return LocalBackend()
+
+    if spec == "sqlite":
+        return SQLiteBackend(os.path.join(CRAWLER_STATE_DIR, "ratelimit.sqlite3"))
+
+    if spec.startswith("sqlite:///"):
+        return SQLiteBackend(spec[len("sqlite:///"):])
+
+    if spec.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend.from_url(spec)
+
+    raise ValueError(f"Unknown rate limit backend: {spec}")
+
+
+class RateLimiter:
+    """
+    Per-host token buckets shared by every crawler module
+
+    With a pacer the refill rate of each bucket is the rate the pacer learned
+    for the host, fed back through `report` after every response.
+    """
+
+    def __init__(
+        self,
+        backend: typing.Any,
+        rate: float,
+        burst: float,
+        overrides: typing.Dict[str, typing.Tuple[float, float]] = None,
+        pacer: typing.Optional[AIMDPacer] = None,
+    ):
+        self.backend = backend
+        self.rate = rate
+        self.burst = burst
+        self.overrides = overrides or {}
+        self.pacer = pacer
+
+    def configured(self, host: str) -> typing.Tuple[float, float]:
+        """
+        Return the configured (rate, burst) of a host
+        """
+
+        return self.overrides.get(host, (self.rate, self.burst))
+
+    def limits(self, host: str) -> typing.Tuple[float, float]:
+        """
+        Return the effective (rate, burst) of a host
+        """
+
+        rate, burst = self.configured(host)
+        if self.pacer is not None:
+            rate = self.pacer.rate(host)
+
+        return rate, burst
+
+    def report(self, host: str, healthy: bool) -> None:
+        """
+        Feed a response outcome back to the pacer
+        """
+
+        if self.pacer is None:
+            return
+
+        if healthy:
+            self.pacer.on_success(host)
+        else:
+            self.pacer.on_failure(host)
+
+    def acquire(self, host: str) -> float:
+        """
+        Block until a request to the host is allowed
+
+        Returns:
+            float: seconds spent waiting
+        """
+
+        rate, burst = self.limits(host)
+        wait = self.backend.reserve(host, rate, burst)
+        if wait > 0:
+            time.sleep(wait)
+
+        metrics.inc("ratelimit_requests_total", host=host)
+        metrics.inc("ratelimit_wait_seconds_total", wait, host=host)
+
+        return wait
+
+
+def get_pacer(overrides: typing.Dict[str, typing.Tuple[float, float]]) -> typing.Optional[AIMDPacer]:
+    """
+    Build the adaptive pacer when CRAWLER_PACING is on
+    """
+
+    if not CRAWLER_PACING:
+        return None
+
+    return AIMDPacer(
+        PacingStore(os.path.join(CRAWLER_STATE_DIR, "pacing.sqlite3")),
+        initial=lambda host: overrides.get(host, (CRAWLER_RATE, CRAWLER_BURST))[0],
+        min_rate=CRAWLER_PACING_MIN_RATE,
+        max_rate=CRAWLER_PACING_MAX_RATE,
+        step=CRAWLER_PACING_STEP,
+        backoff=CRAWLER_PACING_BACKOFF,
+    )
+
+
+_limiter: typing.Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_limiter() -> RateLimiter:
+    """
+    Return the limiter configured by the CRAWLER_RATE* settings
+
+    Built on the first request rather than at import, so importing the crawler
+    modules creates no state files and connects to no Redis.
+    """
+
+    global _limiter
+
+    with _limiter_lock:
+        if _limiter is None:
+            overrides = parse_rate_limits(CRAWLER_RATE_LIMITS)
+            _limiter = RateLimiter(get_backend(CRAWLER_RATE_BACKEND), CRAWLER_RATE, CRAWLER_BURST, overrides, get_pacer(overrides))
+
+        return _limiter
@@ -0,0 +1,115 @@
+import datetime
+import os
+import sqlite3
+import threading
+import typing
+
+import requests
+
+from stockdata.config import CRAWLER_STATE_DIR
+
+
+class Snapshot(typing.NamedTuple):
+    """
+    Fingerprint of the last fully loaded snapshot of a source
+    """
+
+    etag: str
+    last_modified: str
+    data_date: str
+    sha256: str
+
+
+class SnapshotStore:
+    """
+    Fingerprints of sources republished as a whole (e.g. the weekly TDCC file),
+    kept in a SQLite file so a run can tell an unchanged snapshot without loading it
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending: typing.Dict[str, Snapshot] = {}
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS snapshot "
+            "(source TEXT PRIMARY KEY, etag TEXT NOT NULL, last_modified TEXT NOT NULL, "
+            "data_date TEXT NOT NULL, sha256 TEXT NOT NULL, updated TEXT NOT NULL)"
+        )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+
+        return conn
+
+    def get(self, source: str) -> typing.Optional[Snapshot]:
+        row = self._connect().execute(
+            "SELECT etag, last_modified, data_date, sha256 FROM snapshot WHERE source = ?", (source,)
+        ).fetchone()
+
+        return Snapshot(*row) if row else None
+
+    def save(self, source: str, snapshot: Snapshot) -> None:
+        self._connect().execute(
+            "INSERT OR REPLACE INTO snapshot (source, etag, last_modified, data_date, sha256, updated) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (source, *snapshot, datetime.datetime.now().isoformat(timespec="seconds")),
+        )
+
+    def hold(self, source: str, snapshot: Snapshot) -> None:
+        """
+        Keep the fingerprint of a snapshot that was read but not loaded yet, commit() saves it
+        """
+
+        with self._lock:
+            self._pending[source] = snapshot
+
+    def discard(self, source: str) -> None:
+        with self._lock:
+            self._pending.pop(source, None)
+
+    def commit(self, source: str) -> None:
+        """
+        Save the held fingerprint of a source, once its snapshot is loaded and recorded
+        """
+
+        with self._lock:
+            snapshot = self._pending.pop(source, None)
+
+        if snapshot is not None:
+            self.save(source, snapshot)
+
+
+def conditional_headers(snapshot: typing.Optional[Snapshot]) -> typing.Dict[str, str]:
+    """
+    If-None-Match / If-Modified-Since headers from the validators of a snapshot
+    """
+
+    headers = {}
+    if snapshot and snapshot.etag:
+        headers["If-None-Match"] = snapshot.etag
+    if snapshot and snapshot.last_modified:
+        headers["If-Modified-Since"] = snapshot.last_modified
+
+    return headers
+
+
+def fingerprint(response: requests.Response, data_date: str, sha256: str) -> Snapshot:
+    """
+    Fingerprint of a downloaded snapshot: its validators, data date and payload hash
+    """
+
+    return Snapshot(
+        response.headers.get("ETag", ""),
+        response.headers.get("Last-Modified", ""),
+        data_date,
+        sha256,
+    )
+
+
+snapshots = SnapshotStore(os.path.join(CRAWLER_STATE_DIR, "snapshot.sqlite3"))
@@ -1,5 +1,9 @@
-import datetime
-from typing import List
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import List, Optional
+
+import pandas as pd
+from loguru import logger
 
 from stockdata.crawler import (
     taiwan_stock_price,
@@ -9,37 +13,71 @@ from stockdata.crawler import (
     taiwan_institutional_investor,
     taiwan_margin_short_sale
 )
-from stockdata.backend.db import get_db_router
-from stockdata.backend.db.db import update2mysql_by_sql, update2mysql_by_sql_for_info
-
-
-def is_weekend(day: int) -> bool:
-    """Return True if the day index is Saturday or Sunday"""
-    return day in (5, 6)
+from stockdata.backend.db import ddl, get_db_router, manifest
+from stockdata.backend.db.batch import BatchWriter
+from stockdata.backend.db.db import (
+    update2mysql_by_sql,
+    update2mysql_by_sql_for_info,
+    delete_mysql_by_key,
+    read_mysql_by_sql,
+    publish_enabled,
+    stage2mysql,
+    publish2mysql_by_date,
+)
+from stockdata.config import (
+    CRAWLER_CONCURRENCY,
+    CRAWLER_QUEUE_SIZE,
+    CRAWLER_REPARSE_WORKERS,
+    CRAWLER_TRANSFORM_WORKERS,
+    CRAWLER_WRITE_WORKERS,
+)
+from stockdata.fetch import client, engine
+from stockdata.metrics import metrics
+from stockdata import pipeline, trading_calendar
 
 
 def gen_date_list(start_date: str, end_date: str) -> List[str]:
-    """Generate a list of dates excluding weekends"""
-    start = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
-    end = datetime.datetime.strptime(end_date, "%Y-%m-%d").date()
-    delta_days = (end - start).days + 1
-
-    dates = [start + datetime.timedelta(days=i) for i in range(delta_days)]
-    return [d.strftime("%Y-%m-%d") for d in dates if not is_weekend(d.weekday())]
+    """Generate a list of dates excluding weekends and known non-trading days"""
+    return trading_calendar.get_calendar().trading_days(start_date, end_date)
 
 
-# Mapping tasks that do not require date range
+# Mapping tasks that do not require date range: (crawl pipeline, loader)
 PIPELINES_NO_DATE = {
-    "taiwan_stock_info": lambda router: update_stock_info(router),
-    "taiwan_share_holding": lambda router: update_share_holding(router),
+    "taiwan_stock_info": (taiwan_stock_info.stock_info_pipeline, lambda router, result, **options: load_stock_info(router, result)),
+    "taiwan_share_holding": (taiwan_share_holding.share_holding_pipeline, lambda router, result, **options: load_share_holding(router, result, **options)),
+}
+
+# No-date tasks whose source is a file republished under the same URL: archived fetch times,
+# reparse replays every archived file instead of the latest one
+PIPELINES_SNAPSHOTS = {
+    "taiwan_share_holding": taiwan_share_holding.archived_snapshots,
 }
 
-# Mapping tasks that require date range
+# Mapping tasks that require date range: (crawl pipeline, loader), loaders take the BatchWriter of a backfill
+# (writer=...) or replace what is loaded for the date (replace=True, reparse)
 PIPELINES_WITH_DATE = {
-    "taiwan_stock_price": lambda router, date: update_stock_price(router, date),
-    "taiwan_institutional_investor": lambda router, date: update_institutional_investor(router, date),
-    "taiwan_margin_short_sale": lambda router, date: update_margin_short_sale(router, date),
-    "taiwan_future_daily": lambda router, date: update_future_daily(router, date),
+    "taiwan_stock_price": (taiwan_stock_price.stock_price_pipeline, lambda router, date, result, **options: load_stock_price(router, date, result, **options)),
+    "taiwan_institutional_investor": (taiwan_institutional_investor.institutional_investor_pipeline, lambda router, date, result, **options: load_institutional_investor(router, date, result, **options)),
+    "taiwan_margin_short_sale": (taiwan_margin_short_sale.margin_short_sale_pipeline, lambda router, date, result, **options: load_margin_short_sale(router, date, result, **options)),
+    "taiwan_future_daily": (taiwan_futures_daily.future_pipeline, lambda router, date, result, **options: load_future_daily(router, date, result, **options)),
+}
+
+# Date range tasks split into pipeline stages: (fetch, transform), transform(date, fetch(date)) is the crawl pipeline
+PIPELINES_STAGED = {
+    "taiwan_stock_price": (taiwan_stock_price.stock_price_fetch, taiwan_stock_price.stock_price_transform),
+    "taiwan_institutional_investor": (taiwan_institutional_investor.institutional_investor_fetch, taiwan_institutional_investor.institutional_investor_transform),
+    "taiwan_margin_short_sale": (taiwan_margin_short_sale.margin_short_sale_fetch, taiwan_margin_short_sale.margin_short_sale_transform),
+    "taiwan_future_daily": (taiwan_futures_daily.future_fetch, taiwan_futures_daily.future_transform),
+}
+
+# Mapping date range tasks whose source serves a whole month per request: (month list, month pipeline)
+PIPELINES_BY_MONTH = {
+    "taiwan_future_daily": (taiwan_futures_daily.month_list, taiwan_futures_daily.future_month_pipeline),
+}
+
+# Full-market requests per trading day of a task (TWSE + TPEX)
+MARKET_REQUESTS_PER_DAY = {
+    "taiwan_stock_price": 2,
 }
 
 # -------------------------------------
@@ -47,81 +85,443 @@ PIPELINES_WITH_DATE = {
 # -------------------------------------
 
 def update_stock_info(router):
-    df_twse, df_tpex = taiwan_stock_info.stock_info_pipeline()
-    if not df_twse.empty:
-        update2mysql_by_sql_for_info(df_twse, "taiwan_stock_info", router.mysql_stockdata_conn)
-    if not df_tpex.empty:
-        update2mysql_by_sql_for_info(df_tpex, "taiwan_stock_info", router.mysql_stockdata_conn)
+    load_stock_info(router, taiwan_stock_info.stock_info_pipeline())
 
 
 def update_share_holding(router):
-    df = taiwan_share_holding.share_holding_pipeline()
-    if not df.empty:
-        update2mysql_by_sql(df, "taiwan_share_holding", router.mysql_stockdata_conn)
+    load_share_holding(router, taiwan_share_holding.share_holding_pipeline())
 
 
 def update_stock_price(router, date):
-    df_twse, df_tpex = taiwan_stock_price.stock_price_pipeline(date)
-    if not df_twse.empty:
-        update2mysql_by_sql(df_twse, "taiwan_stock_price", router.mysql_stockdata_conn)
-    if not df_tpex.empty:
-        update2mysql_by_sql(df_tpex, "taiwan_stock_price", router.mysql_stockdata_conn)
+    load_stock_price(router, date, taiwan_stock_price.stock_price_pipeline(date))
 
 
 def update_institutional_investor(router, date):
-    df_twse, df_tpex = taiwan_institutional_investor.institutional_investor_pipeline(date)
-    if not df_twse.empty:
-        update2mysql_by_sql(df_twse, "taiwan_institutional_investor", router.mysql_stockdata_conn)
-    if not df_tpex.empty:
-        update2mysql_by_sql(df_tpex, "taiwan_institutional_investor", router.mysql_stockdata_conn)
+    load_institutional_investor(router, date, taiwan_institutional_investor.institutional_investor_pipeline(date))
 
 
 def update_margin_short_sale(router, date):
-    df_twse, df_tpex = taiwan_margin_short_sale.margin_short_sale_pipeline(date)
-    if not df_twse.empty:
-        update2mysql_by_sql(df_twse, "taiwan_margin_short_sale", router.mysql_stockdata_conn)
-    if not df_tpex.empty:
-        update2mysql_by_sql(df_tpex, "taiwan_margin_short_sale", router.mysql_stockdata_conn)
+    load_margin_short_sale(router, date, taiwan_margin_short_sale.margin_short_sale_pipeline(date))
 
 
 def update_future_daily(router, date):
-    df = taiwan_futures_daily.future_pipeline(date)
-    if not df.empty:
-        update2mysql_by_sql(df, "taiwan_future_daily", router.mysql_stockdata_conn)
+    load_future_daily(router, date, taiwan_futures_daily.future_pipeline(date))
+
+
+# -------------------------------------
+# Loader functions
+# -------------------------------------
+
+def load_stock_info(router, result):
+    """Write only what changed in the stock list: new listings, changed rows and delistings"""
+    frames = [df for df in result if not df.empty]
+    if not frames:
+        return
+
+    with router.connection("taiwan_stock_info") as conn:
+        current = read_mysql_by_sql("SELECT StockID, StockName, MarketType, IndustryType FROM taiwan_stock_info", conn)
+        inserted, updated, removed = taiwan_stock_info.diff_stock_info(current, pd.concat(frames, ignore_index=True))
+
+        if not update2mysql_by_sql_for_info(pd.concat([inserted, updated], ignore_index=True), "taiwan_stock_info", conn):
+            return
+        metrics.inc("stock_info_rows_total", len(inserted), change="inserted")
+        metrics.inc("stock_info_rows_total", len(updated), change="updated")
+
+        # Mass or partly quarantined delistings are more likely a bad page than real ones
+        quarantined = {df["MarketType"].iloc[0]: df.attrs.get("quarantined", 0) for df in frames}
+        removed, skipped = taiwan_stock_info.guard_removed(current, removed, quarantined)
+        if not skipped.empty:
+            logger.warning(f"taiwan_stock_info: {len(skipped)} delistings not applied, StockIDs {skipped['StockID'].tolist()}")
+            metrics.inc("stock_info_rows_total", len(skipped), change="removal_skipped")
+        if delete_mysql_by_key("taiwan_stock_info", "StockID", removed["StockID"].tolist(), conn):
+            metrics.inc("stock_info_rows_total", len(removed), change="removed")
+
+
+def load_share_holding(router, result, replace=False):
+    """Insert (or stage, then publish) the TDCC file chunk by chunk, recording it in the ingest manifest once complete"""
+    # The staging table belongs to the connection, so one connection is held for the whole file
+    with router.connection("taiwan_share_holding") as conn:
+        load_share_holding_chunks(conn, result, replace)
+
+
+def load_share_holding_chunks(conn, result, replace=False):
+    table = "taiwan_share_holding"
+    # Replacing a date always goes through the publish, which deletes and inserts it in one transaction
+    publish = replace or publish_enabled(table)
+    date, row_count, digests, columns = None, 0, [], []
+
+    for df in result:
+        if df.empty:
+            continue
+        if date is None:
+            date = df["Date"].iloc[0]
+            if not replace and "tdcc" in manifest.loaded_markets(table, date, conn):
+                metrics.inc("manifest_skipped_loads_total", table=table)
+                return
+        written = stage2mysql(df, table, conn, reset=row_count == 0) if publish else update2mysql_by_sql(df, table, conn)
+        if not written:
+            return
+        row_count += len(df)
+        digests.append(manifest.content_hash(df))
+        columns = list(df.columns)
+
+    if date is None:
+        return
+    if publish and not publish2mysql_by_date(table, date, columns, row_count, conn):
+        return
+    if manifest.record(table, "tdcc", date, row_count, manifest.combined_hash(digests), conn):
+        taiwan_share_holding.confirm_loaded()
+
+
+def load_stock_price(router, date, result, writer=None, replace=False):
+    df_twse, df_tpex = result
+    load_markets(router, "taiwan_stock_price", date, {"twse": df_twse, "tpex": df_tpex}, writer, replace)
+
+
+def load_institutional_investor(router, date, result, writer=None, replace=False):
+    df_twse, df_tpex = result
+    load_markets(router, "taiwan_institutional_investor", date, {"twse": df_twse, "tpex": df_tpex}, writer, replace)
+
+
+def load_margin_short_sale(router, date, result, writer=None, replace=False):
+    df_twse, df_tpex = result
+    load_markets(router, "taiwan_margin_short_sale", date, {"twse": df_twse, "tpex": df_tpex}, writer, replace)
+
+
+def load_future_daily(router, date, result, writer=None, replace=False):
+    df = result
+    load_markets(router, "taiwan_future_daily", date, {"taifex": df}, writer, replace)
+
+
+def load_markets(router, table, date, frames, writer=None, replace=False):
+    """
+    Insert each market of a date once, recording it in the ingest manifest, or hand them to the batch writer of a backfill
+
+    With replace, the markets loaded for the date are ignored and the date is always
+    staged and published, so its old rows are deleted in the transaction inserting the new ones.
+    """
+    with router.connection(table) as conn:
+        loaded = set() if replace else manifest.loaded_markets(table, date, conn)
+        frames, publish = markets_to_load(table, date, frames, loaded, replace or publish_enabled(table))
+
+        if frames and writer is None:
+            if publish:
+                publish_markets(conn, table, date, frames)
+            else:
+                for market, df in frames.items():
+                    if update2mysql_by_sql(df, table, conn):
+                        manifest.record_load(table, market, date, df, conn)
+
+    # Outside the with block, a flush takes a connection of its own
+    if frames and writer is not None:
+        writer.add(date, frames, publish)
+
+
+def markets_to_load(table, date, frames, loaded, publish):
+    """
+    Markets of a date to write and whether to publish them: all of them when published,
+    the new non-empty ones otherwise
+
+    A published date missing a market (an outage, a fully quarantined frame, years before
+    the market existed) is not published, since that would delete the missing market's
+    rows: its other markets are upserted and recorded, the missing one stays a gap.
+    """
+    if publish:
+        if loaded >= set(frames):
+            metrics.inc("manifest_skipped_loads_total", table=table)
+            return {}, publish
+
+        empty = [market for market, df in frames.items() if df.empty]
+        if not empty:
+            return frames, publish
+        if len(empty) == len(frames):
+            return {}, publish
+
+        logger.warning(f"{table} {date}: no {', '.join(empty)} data, other markets upserted without publishing")
+        metrics.inc("publish_incomplete_total", table=table)
+
+    new = {}
+    for market, df in frames.items():
+        if df.empty:
+            continue
+        if market in loaded:
+            metrics.inc("manifest_skipped_loads_total", table=table)
+            continue
+        new[market] = df
+
+    return new, False
+
+
+def publish_markets(conn, table, date, frames):
+    """Stage every market of a date and publish them together, so readers never see one without the others"""
+    for i, df in enumerate(frames.values()):
+        if not stage2mysql(df, table, conn, reset=i == 0):
+            return
+
+    columns = list(next(iter(frames.values())).columns)
+    if publish2mysql_by_date(table, date, columns, sum(len(df) for df in frames.values()), conn):
+        for market, df in frames.items():
+            manifest.record_load(table, market, date, df, conn)
 
 
 # -------------------------------------
 # Function for Airflow to call
 # -------------------------------------
-def run_task(task_name: str, start_date: str = None, end_date: str = None):
-    """Run a specific crawler task"""
+def run_task(task_name: str, start_date: str = None, end_date: str = None, stock_ids: Optional[List[str]] = None):
+    """Run a specific crawler task, optionally restricted to some stocks"""
     router = get_db_router()
+    with router.connection(task_name) as conn:
+        manifest.create_manifest_table(conn)
 
     if task_name in PIPELINES_NO_DATE:
-        PIPELINES_NO_DATE[task_name](router)
+        crawl, load = PIPELINES_NO_DATE[task_name]
+        with pipeline.copy_on_write():
+            load(router, crawl())
         return
 
     if task_name in PIPELINES_WITH_DATE:
         if start_date is None or end_date is None:
             raise ValueError(f"Task {task_name} requires start_date and end_date")
-        for date in gen_date_list(start_date, end_date):
-            PIPELINES_WITH_DATE[task_name](router, date)
+
+        crawl, load = PIPELINES_WITH_DATE[task_name]
+        dates = gen_date_list(start_date, end_date)
+        items, load_item = dates, lambda date, result: load(router, date, result)
+        writer = None
+        fetch, transform = PIPELINES_STAGED.get(task_name, (crawl, None))
+
+        if stock_ids:
+            fetch, load_item, items = plan_stocks(router, task_name, dates, stock_ids, crawl)
+            transform = None
+
+        # Only fetch the dates the ingest manifest has not seen completely
+        elif dates:
+            with router.connection(task_name) as conn:
+                loaded = manifest.loaded_dates(task_name, dates[0], dates[-1], conn)
+            items = dates = manifest.missing_dates(dates, loaded)
+            metrics.inc("manifest_skipped_dates_total", len(loaded), table=task_name)
+
+            # Backfills write many dates at once, a daily run writes its date right away
+            if len(dates) > 1:
+                writer = BatchWriter(router, task_name)
+                load_item = lambda date, result: load(router, date, result, writer=writer)
+
+        # Backfills of month-range sources download one month per request
+        if task_name in PIPELINES_BY_MONTH and len(dates) > 1:
+            fetch, load_item, items = by_month(task_name, dates, load_item)
+            transform = None
+
+        try:
+            # Backfills fetch, transform and write different dates at the same time, daily runs stay sequential
+            if CRAWLER_CONCURRENCY > 1 and len(items) > 1:
+                pipeline.run(items, pipeline_stages(fetch, transform, load_item), CRAWLER_QUEUE_SIZE)
+            else:
+                with pipeline.copy_on_write():
+                    for item in items:
+                        result = fetch(item)
+                        load_item(item, transform(item, result) if transform else result)
+        finally:
+            # Dates written before a failure are kept and recorded, the others are fetched again next run
+            if writer is not None:
+                writer.close()
         return
 
     raise ValueError(f"Unknown task: {task_name}")
 
 
+def pipeline_stages(fetch, transform, load_item) -> List[pipeline.Stage]:
+    """Stages of a date range run: fetch, transform when the task has one, write"""
+    stages = [pipeline.Stage("fetch", fetch, CRAWLER_CONCURRENCY)]
+    if transform is not None:
+        stages.append(pipeline.Stage("transform", transform, CRAWLER_TRANSFORM_WORKERS))
+    stages.append(pipeline.Stage("write", load_item, CRAWLER_WRITE_WORKERS))
+
+    return stages
+
+
+def by_month(task_name: str, dates: List[str], load_date):
+    """Turn a per-date loader into (month pipeline, month loader, months) covering the dates"""
+    month_list, crawl_month = PIPELINES_BY_MONTH[task_name]
+    wanted = set(dates)
+    # Months whose dates are all loaded already are not downloaded again
+    months = {date[:7] for date in dates}
+
+    def load_month(month, result):
+        for date, df in result or []:
+            if date in wanted:
+                load_date(date, df)
+
+    return crawl_month, load_month, [month for month in month_list(dates[0], dates[-1]) if month in months]
+
+
+def stock_number(stock_id) -> Optional[int]:
+    """StockID as the number taiwan_stock_info stores, None when it is not one"""
+    try:
+        return int(stock_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def plan_stocks(router, task_name: str, dates: List[str], stock_ids: List[str], crawl):
+    """
+    Pick the cheaper source for a few stocks over a date range
+
+    Full-market requests cost MARKET_REQUESTS_PER_DAY per trading day whatever the
+    number of stocks, per-stock requests cost one per stock and month.
+    Returns (pipeline, loader, items) of the chosen path. Both paths load some
+    stocks of a date only, so they bypass the ingest manifest.
+    """
+    if task_name not in MARKET_REQUESTS_PER_DAY:
+        raise ValueError(f"Task {task_name} does not support stock ids")
+
+    with router.connection("taiwan_stock_info") as conn:
+        stocks = read_mysql_by_sql(
+            f"SELECT StockID, MarketType FROM taiwan_stock_info WHERE StockID IN ({', '.join(['%s'] * len(stock_ids))})",
+            conn,
+            stock_ids,
+        )
+    # StockID is numeric in taiwan_stock_info ("0050" is stored as 50), so match on the number but keep
+    # the requested spelling, the one the exchanges expect and the full-market frames carry
+    by_number = {stock_number(row.StockID): row.MarketType for row in stocks.itertuples()}
+    markets = {
+        stock_id: by_number[stock_number(stock_id)]
+        for stock_id in stock_ids
+        if stock_number(stock_id) is not None and stock_number(stock_id) in by_number
+    }
+    for stock_id in sorted(set(stock_ids) - set(markets)):
+        logger.warning(f"Skip {stock_id}: not found in taiwan_stock_info")
+
+    wanted = set(dates)
+    months = sorted({date[:7] for date in dates})
+    market_requests = MARKET_REQUESTS_PER_DAY[task_name] * len(dates)
+    stock_requests = len(markets) * len(months)
+    logger.info(f"{task_name}: {market_requests} full-market vs {stock_requests} per-stock requests")
+
+    if stock_requests < market_requests:
+        metrics.inc("planner_path_total", path="stock_month")
+
+        def load_stock_month(item, df):
+            if not df.empty:
+                with router.connection(task_name) as conn:
+                    update2mysql_by_sql(df[df["Date"].isin(wanted)], task_name, conn)
+
+        items = [(stock_id, market, month) for stock_id, market in sorted(markets.items()) for month in months]
+        return taiwan_stock_price.stock_month_pipeline, load_stock_month, items
+
+    metrics.inc("planner_path_total", path="market_day")
+
+    # Full-market days only keep the requested stocks
+    def load_market_day(date, result):
+        with router.connection(task_name) as conn:
+            for df in result:
+                if not df.empty:
+                    update2mysql_by_sql(df[df["StockID"].isin(list(markets))], task_name, conn)
+
+    return crawl, load_market_day, dates
+
+
+def reparse_task(task_name: str, start_date: str = None, end_date: str = None):
+    """Re-run parse, validation and loading over archived payloads, without network access"""
+    router = get_db_router()
+    with router.connection(task_name) as conn:
+        manifest.create_manifest_table(conn)
+    client.set_replay(True)
+
+    # Archived days replace what is already loaded for them: each date is staged and published,
+    # its old rows deleted in the same transaction, so a day that fails to parse or validate keeps its rows
+    if task_name in PIPELINES_NO_DATE:
+        crawl, load = PIPELINES_NO_DATE[task_name]
+        snapshots = PIPELINES_SNAPSHOTS[task_name]() if task_name in PIPELINES_SNAPSHOTS else [None]
+        with pipeline.copy_on_write():
+            for as_of in snapshots:
+                client.set_replay(True, as_of)
+                load(router, crawl(), replace=True)
+        return
+
+    if task_name in PIPELINES_WITH_DATE:
+        if start_date is None or end_date is None:
+            raise ValueError(f"Task {task_name} requires start_date and end_date")
+
+        crawl, load = PIPELINES_WITH_DATE[task_name]
+        dates = gen_date_list(start_date, end_date)
+
+        def load_item(date, result):
+            if result is not None:
+                load(router, date, result, replace=True)
+
+        items = dates
+
+        if task_name in PIPELINES_BY_MONTH and len(dates) > 1:
+            crawl, load_item, items = by_month(task_name, dates, load_item)
+
+        # Parsing is CPU-bound once the network is out of the way, so use processes
+        executor = ProcessPoolExecutor(max_workers=CRAWLER_REPARSE_WORKERS, initializer=client.set_replay, initargs=(True,))
+        engine.run_dates(partial(engine.crawl_archived, crawl), load_item, items, CRAWLER_REPARSE_WORKERS, executor)
+        return
+
+    raise ValueError(f"Unknown task: {task_name}")
+
+
+def gaps_task(start_date: str, end_date: str, *task_names: str):
+    """Print the trading days each dataset is missing according to the ingest manifest"""
+    router = get_db_router()
+    expected = gen_date_list(start_date, end_date)
+
+    for task_name in task_names or PIPELINES_WITH_DATE:
+        # Each table's manifest lives on the MySQL target the table is routed to
+        with router.connection(task_name) as conn:
+            manifest.create_manifest_table(conn)
+            loaded = manifest.loaded_dates(task_name, start_date, end_date, conn)
+        missing = manifest.missing_dates(expected, loaded)
+
+        print(f"{task_name}: {len(missing)} of {len(expected)} trading days missing")
+        for first, last in manifest.date_ranges(expected, missing):
+            print(f"  {first}" if first == last else f"  {first} .. {last}")
+
+
+def migrate_task(*args: str):
+    """Create or migrate the dataset tables to the definitions derived from their models, rebuilds only with --rebuild"""
+    dry_run = "--dry-run" in args
+    rebuild = "--rebuild" in args
+    tables = [arg for arg in args if arg not in ("--dry-run", "--rebuild")]
+
+    router = get_db_router()
+
+    # Each table is created on the MySQL target it is routed to
+    for table in tables or ddl.DATASET_SCHEMAS:
+        with router.connection(table) as conn:
+            if not ddl.migrate(conn, [table], dry_run=dry_run, rebuild=rebuild):
+                raise RuntimeError("Schema migration failed")
+
+
 # -------------------------------------
 # CLI support (for local testing)
 # -------------------------------------
 if __name__ == "__main__":
     import sys
     if len(sys.argv) < 2:
-        print("Usage: python main.py <task_name> [start_date end_date]")
+        print("Usage: python main.py <task_name> [start_date end_date [stock_id,stock_id,...]]")
+        print("       python main.py reparse <task_name> [start_date end_date]")
+        print("       python main.py gaps <start_date> <end_date> [task_name ...]")
+        print("       python main.py migrate [--dry-run] [--rebuild] [table ...]")
         sys.exit(1)
 
+    if sys.argv[1] == "reparse":
+        reparse_task(*sys.argv[2:5])
+        metrics.log_summary()
+        sys.exit(0)
+
+    if sys.argv[1] == "gaps":
+        gaps_task(*sys.argv[2:])
+        sys.exit(0)
+
+    if sys.argv[1] == "migrate":
+        migrate_task(*sys.argv[2:])
+        sys.exit(0)
+
     task_name = sys.argv[1]
     start_date = sys.argv[2] if len(sys.argv) > 2 else None
     end_date = sys.argv[3] if len(sys.argv) > 3 else None
+    stock_ids = sys.argv[4].split(",") if len(sys.argv) > 4 else None
 
-    run_task(task_name, start_date, end_date)
+    run_task(task_name, start_date, end_date, stock_ids)
+    metrics.log_summary()
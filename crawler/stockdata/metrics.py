@@ -0,0 +1,76 @@
+import threading
+import typing
+
+from loguru import logger
+
+
+class Metrics:
+    """
+    Thread-safe in-process counters and gauges keyed by name and labels
+
+    The crawler runs as short-lived containers, so values are summarized in the
+    task log when a run finishes instead of being scraped.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: typing.Dict[typing.Tuple[str, typing.Tuple], float] = {}
+
+    @staticmethod
+    def _key(name: str, labels: typing.Dict[str, typing.Any]) -> typing.Tuple[str, typing.Tuple]:
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Increase a counter
+        """
+
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """
+        Set a gauge
+        """
+
+        with self._lock:
+            self._values[self._key(name, labels)] = value
+
+    def get(self, name: str, **labels) -> float:
+        """
+        Read the current value, 0 when never recorded
+        """
+
+        with self._lock:
+            return self._values.get(self._key(name, labels), 0)
+
+    def snapshot(self) -> typing.Dict[str, float]:
+        """
+        Return all values as a {"name{label=value}": value} dict
+        """
+
+        with self._lock:
+            items = list(self._values.items())
+
+        result = {}
+        for (name, labels), value in sorted(items):
+            label_str = ",".join(f"{k}={v}" for k, v in labels)
+            result[f"{name}{{{label_str}}}" if label_str else name] = value
+
+        return result
+
+    def log_summary(self) -> None:
+        """
+        Write every recorded value to the log
+        """
+
+        for key, value in self.snapshot().items():
+            logger.info(f"metric {key} = {value:.3f}")
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+metrics = Metrics()
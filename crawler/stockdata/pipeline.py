@@ -0,0 +1,191 @@
+import queue
+import threading
+import time
+import typing
+
+import pandas as pd
+from loguru import logger
+
+from stockdata.metrics import metrics
+
+
+# Sent down a queue once a stage has no more items
+_DONE = object()
+
+
+def copy_on_write() -> typing.ContextManager:
+    """
+    pandas Copy-on-Write while stages run
+
+    A stage owns the frame it receives and modifies it in place. Under
+    Copy-on-Write the column selections, renames and reorders between
+    stages share memory with the frame instead of copying it. The option is
+    process-wide, so it is set once by the thread running the stages.
+    """
+
+    return pd.option_context("mode.copy_on_write", True)
+
+
+class Stage(typing.NamedTuple):
+    """
+    One step of a pipeline, run by `workers` threads
+
+    The first stage is called with the item, e.g. fn(date), the others with
+    the item and the previous stage's result, e.g. fn(date, frames).
+    """
+
+    name: str
+    fn: typing.Callable[..., typing.Any]
+    workers: int = 1
+
+
+class _StageState:
+    def __init__(self, stage: Stage):
+        self.stage = stage
+        self.lock = threading.Lock()
+        self.running = stage.workers
+        self.busy = 0.0
+        self.blocked = 0.0
+        self.items = 0
+
+
+def _get(inbox: queue.Queue, stop: threading.Event) -> typing.Any:
+    while not stop.is_set():
+        try:
+            return inbox.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+    return _DONE
+
+
+def _put(outbox: queue.Queue, value: typing.Any, stop: threading.Event) -> None:
+    while not stop.is_set():
+        try:
+            outbox.put(value, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+
+def _work(
+    state: _StageState,
+    first: bool,
+    inbox: queue.Queue,
+    outbox: typing.Optional[queue.Queue],
+    next_workers: int,
+    stop: threading.Event,
+    errors: typing.List[BaseException],
+) -> None:
+    stage = state.stage
+
+    try:
+        while True:
+            entry = _get(inbox, stop)
+            if entry is _DONE:
+                break
+
+            item, value = entry
+            started = time.perf_counter()
+            result = stage.fn(item) if first else stage.fn(item, value)
+            finished = time.perf_counter()
+
+            if outbox is not None:
+                # Blocks while the next stage is behind, which bounds what is held in memory
+                _put(outbox, (item, result), stop)
+
+            with state.lock:
+                state.busy += finished - started
+                state.blocked += time.perf_counter() - finished
+                state.items += 1
+
+    except BaseException as e:
+        logger.error(f"Pipeline stage {stage.name} stopped: {type(e).__name__}: {e}")
+        errors.append(e)
+        stop.set()
+
+    finally:
+        with state.lock:
+            state.running -= 1
+            last = state.running == 0
+
+        # The last worker of a stage tells every worker of the next one
+        if last and outbox is not None:
+            for _ in range(next_workers):
+                _put(outbox, _DONE, stop)
+
+
+def report(states: typing.List[_StageState], elapsed: float) -> None:
+    """
+    Record and log how busy each stage was
+
+    Utilization is the share of the run its workers spent in the stage function,
+    blocked the share spent waiting for room in the next stage's queue. The stage
+    close to 100% busy is the bottleneck, the stages before it show up as blocked.
+    """
+
+    for state in states:
+        capacity = elapsed * state.stage.workers or 1
+        utilization, blocked = state.busy / capacity, state.blocked / capacity
+
+        metrics.inc("pipeline_stage_items_total", state.items, stage=state.stage.name)
+        metrics.inc("pipeline_stage_busy_seconds_total", state.busy, stage=state.stage.name)
+        metrics.inc("pipeline_stage_blocked_seconds_total", state.blocked, stage=state.stage.name)
+        metrics.set("pipeline_stage_utilization", utilization, stage=state.stage.name)
+
+        logger.info(
+            f"Pipeline stage {state.stage.name}: {state.items} items, {state.stage.workers} workers, "
+            f"{utilization:.0%} busy, {blocked:.0%} blocked"
+        )
+
+
+def run(items: typing.Iterable[typing.Any], stages: typing.List[Stage], queue_size: int) -> None:
+    """
+    Run items through stages connected by bounded queues, e.g. fetch -> transform -> write
+
+    Every stage works on different items at the same time. A queue between two
+    stages holds at most `queue_size` results, so a slow stage makes the ones
+    before it wait instead of piling results up in memory. The first exception
+    in any stage stops the pipeline and is raised once every worker has exited.
+
+    Args:
+        items: Items fed to the first stage, e.g. dates
+        stages: Stages in order, the last one's results are discarded
+        queue_size: Results queued between two stages
+    """
+
+    stop = threading.Event()
+    errors: typing.List[BaseException] = []
+
+    # The items are known up front, only the queues between stages are bounded
+    inboxes = [queue.Queue()] + [queue.Queue(maxsize=queue_size) for _ in stages[1:]]
+    for item in items:
+        inboxes[0].put((item, None))
+    for _ in range(stages[0].workers):
+        inboxes[0].put(_DONE)
+
+    states = [_StageState(stage) for stage in stages]
+    threads = []
+    for i, state in enumerate(states):
+        outbox = inboxes[i + 1] if i + 1 < len(stages) else None
+        next_workers = stages[i + 1].workers if outbox is not None else 0
+
+        for n in range(state.stage.workers):
+            threads.append(threading.Thread(
+                target=_work,
+                args=(state, i == 0, inboxes[i], outbox, next_workers, stop, errors),
+                name=f"{state.stage.name}-{n}",
+                daemon=True,
+            ))
+
+    started = time.perf_counter()
+    with copy_on_write():
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    report(states, time.perf_counter() - started)
+
+    if errors:
+        raise errors[0]
@@ -1,10 +1,19 @@
+import datetime
+import os
+import typing
 from pydantic import BaseModel
-from pydantic import parse_obj_as, ValidationError
+from pydantic import ValidationError
 from typing import Type
+import numpy as np
 import pandas as pd
-from typing import Optional
+from typing import ClassVar, Optional, Tuple
+from loguru import logger
+from stockdata.config import QUARANTINE_DIR
+from stockdata.metrics import metrics
 
 class TaiwanStockPrice(BaseModel):
+    natural_key: ClassVar[Tuple[str, ...]] = ("StockID", "Date")
+
     StockID: str
     TradeVolume: int
     Transaction: int
@@ -18,6 +27,8 @@ class TaiwanStockPrice(BaseModel):
 
 
 class TaiwanFuturesDaily(BaseModel):
+    natural_key: ClassVar[Tuple[str, ...]] = ("FuturesID", "Date", "ContractDate", "TradingSession")
+
     Date: str
     FuturesID: str
     ContractDate: str
@@ -34,13 +45,17 @@ class TaiwanFuturesDaily(BaseModel):
 
 
 class TaiwanStockInfo(BaseModel):
+    natural_key: ClassVar[Tuple[str, ...]] = ("StockID",)
+
     StockID: int
     StockName: str
     MarketType: str
-    IndustryType: str   
+    IndustryType: str
 
 
 class TDCCShareholding(BaseModel):
+    natural_key: ClassVar[Tuple[str, ...]] = ("StockID", "Date", "ShareholdingLevel")
+
     Date: str
     StockID: str
     ShareholdingLevel: int
@@ -49,6 +64,8 @@ class TDCCShareholding(BaseModel):
     PercentageOfTotalShares: float
 
 class TaiwanInstitutionalInvestor(BaseModel):
+    natural_key: ClassVar[Tuple[str, ...]] = ("StockID", "Date")
+
     StockID: str
     StockName: str
     ForeignBuy: int
@@ -70,6 +87,8 @@ class TaiwanInstitutionalInvestor(BaseModel):
     Date: str
 
 class TaiwanMarginPurchaseShortSale(BaseModel):
+    natural_key: ClassVar[Tuple[str, ...]] = ("StockID", "Date")
+
     StockID: str
     StockName: str
     MarginPurchaseBuy: int
@@ -89,25 +108,141 @@ class TaiwanMarginPurchaseShortSale(BaseModel):
     Date: str
 
 
+# Table each dataset is loaded into, upserts and primary keys use the model's natural_key
+DATASET_SCHEMAS = {
+    "taiwan_stock_price": TaiwanStockPrice,
+    "taiwan_future_daily": TaiwanFuturesDaily,
+    "taiwan_stock_info": TaiwanStockInfo,
+    "taiwan_share_holding": TDCCShareholding,
+    "taiwan_institutional_investor": TaiwanInstitutionalInvestor,
+    "taiwan_margin_short_sale": TaiwanMarginPurchaseShortSale,
+}
+
+
+def field_types(schema: Type) -> typing.Dict[str, typing.Tuple[type, bool]]:
+    """
+    Map each field of a Pydantic model to (type, nullable), e.g. Optional[int] -> (int, True)
+    """
+
+    types = {}
+    for name, field in schema.model_fields.items():
+        annotation = field.annotation
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        nullable = typing.get_origin(annotation) is typing.Union and len(args) < len(typing.get_args(annotation))
+        types[name] = (args[0] if nullable else annotation, nullable)
+
+    return types
+
+
+def coerce_column(values: pd.Series, kind: type) -> typing.Tuple[pd.Series, np.ndarray]:
+    """
+    Coerce a column to a field type the way Pydantic's lax mode does, vectorized
+
+    Returns:
+        tuple: (coerced column, boolean mask of the values that do not fit the type)
+    """
+
+    if kind is str:
+        invalid = ~np.array([isinstance(value, str) for value in values.to_numpy()], dtype=bool)
+        return values, invalid
+
+    # Columns the crawler already parsed are returned as they are
+    if kind is int and values.dtype == "int64":
+        return values, np.zeros(len(values), dtype=bool)
+
+    if kind is float and values.dtype == "float64":
+        return values, values.isna().to_numpy()
+
+    if kind is bool:
+        invalid = ~values.isin([True, False, 0, 1]).to_numpy()
+        return values.where(~invalid, False).astype(bool), invalid
+
+    numbers = pd.to_numeric(values, errors="coerce")
+    invalid = numbers.isna().to_numpy()
+
+    if kind is int:
+        # Floats are only ints without a fractional part
+        invalid = invalid | (numbers.fillna(0) % 1 != 0).to_numpy()
+        return numbers.where(~invalid, 0).astype("int64"), invalid
+
+    return numbers.astype("float64"), invalid
+
+
+def quarantine(df: pd.DataFrame, schema: Type) -> None:
+    """
+    Report rows rejected by a schema, with Pydantic's error for each, and save them under QUARANTINE_DIR
+    """
+
+    errors = []
+    for record in df.to_dict(orient="records"):
+        try:
+            schema.model_validate(record)
+            errors.append("")
+        except ValidationError as e:
+            errors.append("; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+
+    df = df.assign(_errors=errors)
+    metrics.inc("schema_rows_quarantined_total", len(df), schema=schema.__name__)
+    logger.warning(f"{schema.__name__}: {len(df)} rows failed validation, e.g. {df.iloc[0].to_dict()}")
+
+    if QUARANTINE_DIR:
+        path = os.path.join(QUARANTINE_DIR, schema.__name__, f"{datetime.datetime.now():%Y%m%dT%H%M%S%f}.csv")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_csv(path, index=False)
+
+
 def check_schema(df: pd.DataFrame, schema: Type) -> pd.DataFrame:
     """
     Validate DataFrame using the given Pydantic schema.
 
+    Every field is checked and coerced a whole column at a time. Rows that
+    do not fit are dropped and quarantined, the rest of the frame is kept.
+    The frame is taken over: columns that need coercing are replaced in it,
+    typed ones are kept without a copy.
+
     Args:
-        df (pd.DataFrame): Input data.
+        df (pd.DataFrame): Input data, owned by the caller's stage.
         schema (Type): A Pydantic BaseModel class.
 
     Returns:
         pd.DataFrame: Validated records as DataFrame.
     """
     
-    #Check Schema
-    try:
-        records = parse_obj_as(list[schema], df.to_dict(orient="records"))
-        return pd.DataFrame([r.dict() for r in records])
-    
-    except ValidationError as e:
-        print("Schema validation failed:\n", e)
+    if df.empty:
+        return pd.DataFrame()
+
+    types = field_types(schema)
+
+    # A missing field fails every row
+    missing = [name for name in types if name not in df.columns]
+    if missing:
+        print(f"Schema validation failed: {schema.__name__} missing columns {missing}")
         return pd.DataFrame()
 
+    invalid = np.zeros(len(df), dtype=bool)
+    # Columns before coercion, rejected rows are quarantined as they came in
+    raw = {}
+    for name, (kind, nullable) in types.items():
+        values = df[name]
+        nulls = values.isna().to_numpy() if nullable else np.zeros(len(df), dtype=bool)
+
+        column, bad = coerce_column(values, kind)
+        invalid |= bad & ~nulls
+
+        if nulls.any():
+            column = column.astype(object).where(~nulls, None)
+
+        if column is not values:
+            raw[name] = values
+            df[name] = column
+
+    df = df[list(types)]
+    if invalid.any():
+        quarantine(df.loc[invalid].assign(**{name: values.loc[invalid] for name, values in raw.items()}), schema)
+        df = df.loc[~invalid]
+
+    if not df.index.equals(pd.RangeIndex(len(df))):
+        df = df.reset_index(drop=True)
+
+    return df
 
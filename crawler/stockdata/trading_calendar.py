@@ -0,0 +1,179 @@
+import datetime
+import os
+import sqlite3
+import threading
+import typing
+
+import pytz
+
+from stockdata.config import (
+    CRAWLER_STATE_DIR,
+    TRADING_CALENDAR_HOLIDAYS,
+    TRADING_CALENDAR_SESSIONS,
+    TRADING_SATURDAY_UNTIL,
+)
+from stockdata.metrics import metrics
+
+
+# Holidays observed on the same day every year, (month, day, first year)
+# Tomb Sweeping Day moves between April 4 and 5 with the solar term and is left to
+# what is learned; a day wrongly assumed closed would never be fetched at all.
+FIXED_HOLIDAYS = [
+    (1, 1, 1900),   # Founding day of the Republic of China
+    (2, 28, 1997),  # Peace Memorial Day
+    (4, 4, 2011),   # Children's Day
+    (5, 1, 2012),   # Labour Day
+    (10, 10, 1900), # National Day
+]
+
+
+def is_weekend(day: int) -> bool:
+    """Return True if the day index is Saturday or Sunday"""
+    return day in (5, 6)
+
+
+def today_taipei() -> datetime.date:
+    return datetime.datetime.now(pytz.timezone("Asia/Taipei")).date()
+
+
+class TradingCalendar:
+    """
+    Persistent record of which days the exchanges trade
+
+    A day is decided, in order, by:
+      1. what was learned from TWSE responses (data or "no matching data") or seeded by config
+      2. the fixed national holidays
+      3. the weekday: Monday to Friday trade, Saturdays trade before `saturday_until`
+         (Saturday sessions of the early TWSE years), Sundays never do
+
+    Learned days live in a SQLite file under CRAWLER_STATE_DIR, so every later
+    run and every crawler container skips non-trading days without a request.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        saturday_until: str,
+        holidays: typing.Iterable[str] = (),
+        sessions: typing.Iterable[str] = (),
+    ):
+        self.path = path
+        self.saturday_until = datetime.date.fromisoformat(saturday_until)
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connect().execute(
+            "CREATE TABLE IF NOT EXISTS trading_day "
+            "(date TEXT PRIMARY KEY, is_open INTEGER NOT NULL, source TEXT NOT NULL)"
+        )
+
+        for date in holidays:
+            self.mark(date, is_open=False, source="config", overwrite=False)
+        for date in sessions:
+            self.mark(date, is_open=True, source="config", overwrite=False)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+
+        return conn
+
+    def mark(self, date: str, is_open: bool, source: str = "learned", overwrite: bool = True) -> None:
+        """
+        Record whether the exchanges traded on a date
+
+        Args:
+            date: 'YYYY-MM-DD'
+            is_open: True when the day had a trading session
+            source: where the fact came from
+            overwrite: replace an existing record
+        """
+
+        verb = "INSERT OR REPLACE" if overwrite else "INSERT OR IGNORE"
+        self._connect().execute(
+            f"{verb} INTO trading_day (date, is_open, source) VALUES (?, ?, ?)",
+            (date, int(is_open), source),
+        )
+
+    def learn(self, date: str, has_data: bool) -> None:
+        """
+        Learn from a TWSE market-wide response of a date
+
+        Empty answers for today or later are not learned, the data may simply not be published yet.
+        """
+
+        if not has_data and datetime.date.fromisoformat(date) >= today_taipei():
+            return
+
+        self.mark(date, is_open=has_data)
+
+    def _learned(self, start: str, end: str) -> typing.Dict[str, bool]:
+        rows = self._connect().execute(
+            "SELECT date, is_open FROM trading_day WHERE date BETWEEN ? AND ?", (start, end)
+        ).fetchall()
+
+        return {date: bool(is_open) for date, is_open in rows}
+
+    def _default(self, day: datetime.date) -> bool:
+        for month, dom, since in FIXED_HOLIDAYS:
+            if day.month == month and day.day == dom and day.year >= since:
+                return False
+
+        if day.weekday() == 5:
+            return day < self.saturday_until
+
+        return not is_weekend(day.weekday())
+
+    def trading_days(self, start_date: str, end_date: str) -> typing.List[str]:
+        """
+        Candidate trading days between two dates, inclusive
+
+        Args:
+            start_date: 'YYYY-MM-DD'
+            end_date: 'YYYY-MM-DD'
+        """
+
+        start = datetime.date.fromisoformat(start_date)
+        end = datetime.date.fromisoformat(end_date)
+        learned = self._learned(start_date, end_date)
+
+        days = []
+        for i in range((end - start).days + 1):
+            day = start + datetime.timedelta(days=i)
+            date = day.isoformat()
+
+            if learned.get(date, self._default(day)):
+                days.append(date)
+            elif not is_weekend(day.weekday()):
+                metrics.inc("calendar_skipped_weekdays_total")
+
+        return days
+
+
+def _split(value: str) -> typing.List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+_calendar: typing.Optional[TradingCalendar] = None
+_calendar_lock = threading.Lock()
+
+
+def get_calendar() -> TradingCalendar:
+    """
+    Return the calendar kept under CRAWLER_STATE_DIR, opened on first use rather than at import
+    """
+
+    global _calendar
+
+    with _calendar_lock:
+        if _calendar is None:
+            _calendar = TradingCalendar(
+                os.path.join(CRAWLER_STATE_DIR, "trading_calendar.sqlite3"),
+                saturday_until=TRADING_SATURDAY_UNTIL,
+                holidays=_split(TRADING_CALENDAR_HOLIDAYS),
+                sessions=_split(TRADING_CALENDAR_SESSIONS),
+            )
+
+        return _calendar
@@ -0,0 +1,126 @@
+import typing
+
+import numpy as np
+import pandas as pd
+import pytest
+from pydantic import BaseModel
+
+from stockdata.metrics import metrics
+from stockdata.schema import dataset
+from stockdata.schema.dataset import TaiwanStockPrice, check_schema, coerce_column
+
+
+class Holding(BaseModel):
+    StockID: str
+    Shares: int
+    Percentage: float
+    Level: typing.Optional[int]
+
+
+def prices(**overrides) -> pd.DataFrame:
+    columns = {
+        "StockID": ["2330", "2317"],
+        "TradeVolume": ["1000", "2000"],
+        "Transaction": ["10", "20"],
+        "TradeValue": ["500000", "90000"],
+        "Open": ["500", "45.5"],
+        "Max": ["510", "46"],
+        "Min": ["495", "45"],
+        "Close": ["505", "45.8"],
+        "Change": ["5", "-0.2"],
+        "Date": ["2024-01-02", "2024-01-02"],
+    }
+    columns.update(overrides)
+
+    return pd.DataFrame(columns)
+
+
+@pytest.fixture(autouse=True)
+def quarantine_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset, "QUARANTINE_DIR", str(tmp_path))
+    metrics.reset()
+
+    return tmp_path
+
+
+def test_coerce_column_int():
+    column, invalid = coerce_column(pd.Series(["1", "2.0", "2.5", "x", None], dtype=object), int)
+
+    assert column.dtype == "int64"
+    assert column.tolist()[:2] == [1, 2]
+    assert invalid.tolist() == [False, False, True, True, True]
+
+
+def test_coerce_column_float_rejects_nan():
+    column, invalid = coerce_column(pd.Series([1.5, np.nan, 3.0]), float)
+
+    assert column.dtype == "float64"
+    assert invalid.tolist() == [False, True, False]
+
+
+def test_coerce_column_keeps_typed_columns():
+    values = pd.Series([1, 2, 3], dtype="int64")
+    column, invalid = coerce_column(values, int)
+
+    assert column is values
+    assert not invalid.any()
+
+
+def test_coerce_column_str():
+    _, invalid = coerce_column(pd.Series(["2330", 2330, None], dtype=object), str)
+
+    assert invalid.tolist() == [False, True, True]
+
+
+def test_check_schema_coerces_types():
+    df = check_schema(prices(), TaiwanStockPrice)
+
+    assert list(df.columns) == list(TaiwanStockPrice.model_fields)
+    assert df["TradeVolume"].dtype == "int64"
+    assert df["Close"].dtype == "float64"
+    assert df["StockID"].tolist() == ["2330", "2317"]
+    assert df["Change"].tolist() == [5.0, -0.2]
+
+
+def test_check_schema_quarantines_bad_rows(quarantine_dir):
+    df = check_schema(prices(TradeVolume=["n/a", "2000"]), TaiwanStockPrice)
+
+    assert df["StockID"].tolist() == ["2317"]
+    assert df.index.tolist() == [0]
+    assert metrics.get("schema_rows_quarantined_total", schema="TaiwanStockPrice") == 1
+
+    files = list((quarantine_dir / "TaiwanStockPrice").glob("*.csv"))
+    assert len(files) == 1
+    saved = pd.read_csv(files[0], dtype=str, keep_default_na=False)
+    # Saved as received, with Pydantic's reason
+    assert saved["StockID"].tolist() == ["2330"]
+    assert saved["TradeVolume"].tolist() == ["n/a"]
+    assert saved["_errors"][0].startswith("TradeVolume:")
+
+
+def test_check_schema_rejects_nan():
+    df = check_schema(prices(Close=[np.nan, 45.8]), TaiwanStockPrice)
+
+    assert df["StockID"].tolist() == ["2317"]
+    assert metrics.get("schema_rows_quarantined_total", schema="TaiwanStockPrice") == 1
+
+
+def test_check_schema_keeps_nulls_of_optional_fields():
+    df = check_schema(
+        pd.DataFrame({"StockID": ["2330", "2317"], "Shares": [1, 2], "Percentage": [0.5, 0.1], "Level": [3, np.nan]}),
+        Holding,
+    )
+
+    assert df["Level"].tolist() == [3, None]
+
+
+def test_check_schema_missing_field():
+    assert check_schema(prices().drop(columns="Close"), TaiwanStockPrice).empty
+
+
+def test_check_schema_takes_over_the_frame():
+    df = prices()
+    check_schema(df, TaiwanStockPrice)
+
+    # Coerced columns replace the caller's ones, pass a copy to keep the input
+    assert df["TradeVolume"].dtype == "int64"
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from stockdata import pipeline
+from stockdata.metrics import metrics
+from stockdata.pipeline import Stage
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+
+
+def run_in_thread(items, stages, queue_size):
+    """Run a pipeline in the background, returns (thread, errors raised by run)"""
+
+    errors = []
+
+    def target():
+        try:
+            pipeline.run(items, stages, queue_size)
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+
+    return thread, errors
+
+
+def stage_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith(("fetch-", "transform-", "write-"))]
+
+
+def test_every_item_goes_through_every_stage():
+    written = []
+    lock = threading.Lock()
+
+    def write(item, value):
+        with lock:
+            written.append((item, value))
+
+    stages = [
+        Stage("fetch", lambda item: item * 10, workers=2),
+        Stage("transform", lambda item, value: value + 1, workers=3),
+        Stage("write", write),
+    ]
+    pipeline.run(range(20), stages, queue_size=2)
+
+    assert sorted(written) == [(i, i * 10 + 1) for i in range(20)]
+    assert metrics.get("pipeline_stage_items_total", stage="fetch") == 20
+    assert metrics.get("pipeline_stage_items_total", stage="write") == 20
+
+
+def test_slow_stage_holds_back_the_ones_before_it():
+    fetched = []
+    release = threading.Event()
+
+    def fetch(item):
+        fetched.append(item)
+        return item
+
+    stages = [Stage("fetch", fetch), Stage("write", lambda item, value: release.wait())]
+    thread, errors = run_in_thread(range(100), stages, queue_size=1)
+
+    time.sleep(0.5)
+    # One item in the blocked writer, one queued, one waiting for room in the queue
+    assert len(fetched) == 3
+
+    release.set()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert not errors
+    assert len(fetched) == 100
+
+
+def test_first_error_is_raised():
+    def transform(item, value):
+        if item == 3:
+            raise ValueError("bad item")
+        return value
+
+    stages = [Stage("fetch", lambda item: item), Stage("transform", transform), Stage("write", lambda item, value: None)]
+
+    with pytest.raises(ValueError, match="bad item"):
+        pipeline.run(range(10), stages, queue_size=1)
+
+    assert not stage_threads()
+
+
+def test_failing_worker_stops_the_blocked_stages():
+    fetched = []
+
+    def fetch(item):
+        fetched.append(item)
+        return item
+
+    def write(item, value):
+        raise RuntimeError("write failed")
+
+    # Without the stop the other writer and the fetcher would wait on full queues forever
+    stages = [Stage("fetch", fetch), Stage("transform", lambda item, value: value, workers=2), Stage("write", write, workers=2)]
+    thread, errors = run_in_thread(range(1000), stages, queue_size=1)
+
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert [type(e) for e in errors] == [RuntimeError]
+    assert len(fetched) < 1000
+    assert not stage_threads()
+
+
+def test_stages_run_with_copy_on_write():
+    seen = []
+    stages = [Stage("fetch", lambda item: pd.get_option("mode.copy_on_write")), Stage("write", lambda item, value: seen.append(value))]
+
+    pipeline.run([1], stages, queue_size=1)
+
+    assert seen == [True]
+    assert pd.get_option("mode.copy_on_write") is False